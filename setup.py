@@ -43,6 +43,8 @@ setup(
     include_package_data=True,
     install_requires=[
         'celery',
+        'channels<4.1',  # 4.1 requires Django 4.2
+        'channels-redis',
         'django<4.2',
         'django-admin-display',
         'django-allauth',
@@ -55,12 +57,14 @@ setup(
         'drf-yasg',
         'pandas',
         'pyrabbit',
+        'redis',
         'ngpuinfo',
         'swcc',
         # Production-only
         'django-composed-configuration[prod]',
         'django-s3-file-field[boto3]<1',  # v1 has breaking changes
         'gunicorn',
+        'uvicorn[standard]',
         'numpy',
     ],
     extras_require={
@@ -1,11 +1,61 @@
+"""
+Serve HTTP and the task progress websockets from one application.
+
+Django 4.1 iterates streaming responses, such as the project archives, on the event loop, which
+would stall every other request and socket of the worker while a file is read from storage.
+Their parts are read in the request's thread instead.
+"""
+
 import os
 
 import configurations.importer
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ['DJANGO_SETTINGS_MODULE'] = 'shapeworks_cloud.settings'
 if not os.environ.get('DJANGO_CONFIGURATION'):
     raise ValueError('The environment variable "DJANGO_CONFIGURATION" must be set.')
 configurations.importer.install()
 
-application = get_asgi_application()
+# Set up Django before importing anything that touches models.
+django.setup(set_prefix=False)
+
+from asgiref.sync import sync_to_async  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+
+from shapeworks_cloud.core.routing import websocket_urlpatterns  # noqa: E402
+
+
+class StreamingASGIHandler(ASGIHandler):
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        headers = [
+            (header.encode('ascii'), value.encode('latin1')) for header, value in response.items()
+        ]
+        headers += [
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        ]
+        await send(
+            {'type': 'http.response.start', 'status': response.status_code, 'headers': headers}
+        )
+        # thread sensitive calls of a request share its thread, where response.close() also
+        # releases the database connection the iterator may open
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while (part := await next_part(parts, None)) is not None:
+            for chunk, _ in self.chunk_bytes(part):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+# without a channel layer the progress consumer refuses connections, and the client polls
+application = ProtocolTypeRouter(
+    {
+        'http': StreamingASGIHandler(),
+        'websocket': URLRouter(websocket_urlpatterns),
+    }
+)
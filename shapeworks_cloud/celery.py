@@ -23,6 +23,11 @@ def setup_periodic_tasks(sender, **kwargs):
     sender.add_periodic_task(
         20, manage.s(**{k: os.environ.get(k) for k in AWS_ENV_VARS}), name='manage workers'
     )
+    sender.add_periodic_task(
+        24 * 60 * 60,
+        sender.signature('shapeworks_cloud.core.tasks.prune_write_access_log'),
+        name='prune write access log',
+    )
 
 
 @app.task
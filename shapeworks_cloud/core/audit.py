@@ -0,0 +1,96 @@
+"""
+Record write access to the database without blocking the request that made it.
+
+Entries are buffered in memory and stored in batches by a background thread of each process.
+When the buffer is full, for instance because the database is unreachable, new entries are
+dropped and counted rather than held up in the request.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+
+from django.db import connection
+
+from .models import WriteAccessLog
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 2  # seconds
+MAX_BUFFERED = 10000
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogSink:
+    def __init__(self):
+        self.buffer: queue.Queue = queue.Queue(maxsize=MAX_BUFFERED)
+        self.wake = threading.Event()
+        self.start_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pid = None
+        self.dropped = 0
+
+    def record(self, timestamp, username, action, *details):
+        self.ensure_started()
+        entry = WriteAccessLog(
+            timestamp=timestamp,
+            username=str(username or '')[:150],
+            action=str(action)[:255],
+            details='\t'.join(str(d) for d in details),
+        )
+        try:
+            self.buffer.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.buffer.qsize() >= BATCH_SIZE:
+            self.wake.set()
+
+    def ensure_started(self):
+        # a forked worker inherits the buffer of its parent, but not the thread that drains it
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            self.buffer = queue.Queue(maxsize=MAX_BUFFERED)
+            self.wake = threading.Event()
+            self.flush_lock = threading.Lock()
+            threading.Thread(target=self.run, name='audit-log', daemon=True).start()
+            self.pid = os.getpid()
+
+    def run(self):
+        while True:
+            self.wake.wait(FLUSH_INTERVAL)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        if self.pid != os.getpid():
+            return
+        with self.flush_lock:
+            entries = []
+            while True:
+                try:
+                    entries.append(self.buffer.get_nowait())
+                except queue.Empty:
+                    break
+            if self.dropped:
+                logger.warning('Dropped %d write access log entries', self.dropped)
+                self.dropped = 0
+            if not entries:
+                return
+            try:
+                WriteAccessLog.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+            except Exception:
+                logger.exception('Could not store %d write access log entries', len(entries))
+            finally:
+                # connections are per thread, and this one would otherwise stay open for good
+                if threading.current_thread() is not threading.main_thread():
+                    connection.close()
+
+
+sink = AuditLogSink()
+atexit.register(sink.flush)
@@ -0,0 +1,74 @@
+"""
+Push task progress to the browser over a websocket, instead of having it poll the API.
+
+A client connects to `ws/projects/<id>/task-progress/` and sends `{"token": <access token>}`
+as its first message, since browsers cannot set headers on websockets and query strings end up
+in access logs. It then receives `{"tasks": [...]}` with every task of the project, followed by
+the same shape with a single task whenever that task's progress is written.
+"""
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.contrib.auth.models import AnonymousUser
+from oauth2_provider.models import get_access_token_model
+
+from .models import Project, TaskProgress
+from .progress import progress_group
+from .serializers import TaskProgressSerializer
+
+# application close codes start at 4000; this one mirrors HTTP 403
+CLOSE_FORBIDDEN = 4003
+
+
+@database_sync_to_async
+def get_token_user(token):
+    access_token = (
+        get_access_token_model().objects.select_related('user').filter(token=token).first()
+    )
+    if access_token and access_token.is_valid() and access_token.user:
+        return access_token.user
+    return AnonymousUser()
+
+
+@database_sync_to_async
+def can_view_project(user, project_id):
+    return Project.visible_to(user).filter(id=project_id).exists()
+
+
+@database_sync_to_async
+def get_project_tasks(project_id):
+    tasks = TaskProgress.objects.filter(project=project_id).order_by('id')
+    return list(TaskProgressSerializer(tasks, many=True).data)
+
+
+class TaskProgressConsumer(AsyncJsonWebsocketConsumer):
+    group_name = None
+
+    async def connect(self):
+        # progress only reaches this process through a shared channel layer; refusing the
+        # connection sends the client back to polling
+        if self.channel_layer is None:
+            await self.close()
+        else:
+            await self.accept()
+
+    async def receive_json(self, content, **kwargs):
+        if self.group_name:
+            return
+        token = content.get('token') if isinstance(content, dict) else None
+        user = await get_token_user(str(token)) if token else AnonymousUser()
+        project_id = self.scope['url_route']['kwargs']['project_id']
+        if not await can_view_project(user, project_id):
+            await self.close(code=CLOSE_FORBIDDEN)
+            return
+        # join before reading the tasks, so that no write falls between the two
+        self.group_name = progress_group(project_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.send_json({'tasks': await get_project_tasks(project_id)})
+
+    async def disconnect(self, code):
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def task_progress(self, event):
+        await self.send_json({'tasks': event['tasks']})
@@ -8,6 +8,7 @@ from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
 
 from shapeworks_cloud.core import models
+from shapeworks_cloud.core.progress import ProgressReporter
 from swcc.api import swcc_session
 from swcc.models import Project as SWCCProject
 
@@ -30,7 +31,7 @@ def run_prep(params, project, project_file, progress):
     # /////////////////////////////////////////////////////////////////
     # /// STEP 2: Groom Training Shapes
     # /////////////////////////////////////////////////////////////////
-    progress.update_message('Grooming Training Shapes...')
+    progress.report('Grooming Training Shapes...')
 
     project_params = project.get_parameters('groom')
     # alignment should always be set to ICP
@@ -41,33 +42,33 @@ def run_prep(params, project, project_file, progress):
     DeepSSMUtils.groom_training_shapes(project)
     project.save(project_file)
 
-    progress.update_percentage(11)
+    progress.report(percentage=11)
 
     # /////////////////////////////////////////////////////////////////
     # /// STEP 3: Optimize Training Particles
     # /////////////////////////////////////////////////////////////////
-    progress.update_message('Optimizing Training Particles...')
+    progress.report('Optimizing Training Particles...')
     DeepSSMUtils.optimize_training_particles(project)
     project.save(project_file)
-    progress.update_percentage(12)
+    progress.report(percentage=12)
 
     # /////////////////////////////////////////////////////////////////
     # /// STEP 4: Groom Training Images
     # /////////////////////////////////////////////////////////////////
-    progress.update_message('Grooming Training Images...')
+    progress.report('Grooming Training Images...')
     DeepSSMUtils.groom_training_images(project)
     project.save(project_file)
 
     # /////////////////////////////////////////////////////////////////
     # /// STEP 5: Groom Validation Images
     # /////////////////////////////////////////////////////////////////
-    progress.update_message('Grooming Validation Images...')
+    progress.report('Grooming Validation Images...')
     val_indices = DeepSSMUtils.get_split_indices(project, 'val')
     test_indices = DeepSSMUtils.get_split_indices(project, 'test')
     val_test_indices = val_indices + test_indices
     DeepSSMUtils.groom_val_test_images(project, val_test_indices)
     project.save(project_file)
-    progress.update_percentage(14)
+    progress.report(percentage=14)
 
     # /////////////////////////////////////////////////////////////////
     # /// STEP 6: Optimize Validation Particles with Fixed Domains
@@ -83,18 +84,18 @@ def run_prep(params, project, project_file, progress):
 
     project.set_parameters('optimize', project_params)
 
-    progress.update_message('Grooming Validation Shapes...')
+    progress.report('Grooming Validation Shapes...')
     DeepSSMUtils.groom_validation_shapes(project)
     project.save(project_file)
-    progress.update_percentage(17)
+    progress.report(percentage=17)
 
-    progress.update_message('Optimizing Validation Particles...')
+    progress.report('Optimizing Validation Particles...')
     optimize = sw.Optimize()
     optimize.SetUpOptimize(project)
     optimize.Run()
 
     project.save(project_file)
-    progress.update_percentage(20)
+    progress.report(percentage=20)
 
 
 def run_augmentation(params, project, download_dir, progress):
@@ -110,7 +111,7 @@ def run_augmentation(params, project, download_dir, progress):
 
     num_dims = 0  # set to 0 to allow for percent variability to be used
 
-    progress.update_message('Running Data Augmentation...')
+    progress.report('Running Data Augmentation...')
     embedded_dims = DeepSSMUtils.run_data_augmentation(
         project,
         num_samples,
@@ -120,14 +121,13 @@ def run_augmentation(params, project, download_dir, progress):
         mixture_num=0,
         processes=1,  # Thread count
     )
-    progress.update_message('Generating Augmentation visualizations...')
-    progress.update_percentage(25)
+    progress.report('Generating Augmentation visualizations...', 25)
 
     aug_dir = download_dir + '/deepssm/augmentation/'
     aug_data_csv = aug_dir + 'TotalData.csv'
 
     DataAugmentationUtils.visualizeAugmentation(aug_data_csv, 'violin')
-    progress.update_percentage(30)
+    progress.report(percentage=30)
 
     return embedded_dims
 
@@ -140,10 +140,10 @@ def run_training(params, project, download_dir, aug_dims, progress):
     # /////////////////////////////////////////////////////////////////
     # /// STEP 8: Create PyTorch loaders from data
     # /////////////////////////////////////////////////////////////////
-    progress.update_message('Preparing Training Data Loaders...')
+    progress.report('Preparing Training Data Loaders...')
     DeepSSMUtils.prepare_data_loaders(project, batch_size, 'train')
     DeepSSMUtils.prepare_data_loaders(project, batch_size, 'val')
-    progress.update_percentage(35)
+    progress.report(percentage=35)
 
     # /////////////////////////////////////////////////////////////////
     # /// STEP 9: Train DeepSSM Model
@@ -178,11 +178,11 @@ def run_training(params, project, download_dir, aug_dims, progress):
         fine_tune_learning_rate,
         loss_function,
     )
-    progress.update_percentage(40)
+    progress.report(percentage=40)
 
-    progress.update_message('Training DeepSSM Model...')
+    progress.report('Training DeepSSM Model...')
     DeepSSMUtils.trainDeepSSM(project, config_file)
-    progress.update_percentage(50)
+    progress.report(percentage=50)
 
 
 def run_testing(params, project, download_dir, progress):
@@ -193,14 +193,14 @@ def run_testing(params, project, download_dir, progress):
     # /////////////////////////////////////////////////////////////////
     # /// STEP 10: Groom Testing Images
     # /////////////////////////////////////////////////////////////////
-    progress.update_message('Grooming Testing Images...')
+    progress.report('Grooming Testing Images...')
     DeepSSMUtils.groom_val_test_images(project, test_indices)
-    progress.update_percentage(55)
+    progress.report(percentage=55)
 
     # /////////////////////////////////////////////////////////////////
     # /// STEP 11: Prepare Test Data PyTorch Loaders
     # /////////////////////////////////////////////////////////////////
-    progress.update_message('Preparing Testing Data Loaders...')
+    progress.report('Preparing Testing Data Loaders...')
     batch_size = int(params['train_batch_size'])
     DeepSSMUtils.prepare_data_loaders(project, batch_size, 'test')
 
@@ -213,18 +213,17 @@ def run_testing(params, project, download_dir, progress):
         file.write(']')
 
     config_file = download_dir + '/deepssm/configuration.json'
-    progress.update_percentage(60)
+    progress.report(percentage=60)
 
     # /////////////////////////////////////////////////////////////////
     # /// STEP 12: Test DeepSSM Model
     # /////////////////////////////////////////////////////////////////
-    progress.update_message('Testing DeepSSM Model...')
+    progress.report('Testing DeepSSM Model...')
     DeepSSMUtils.testDeepSSM(config_file)
 
-    progress.update_messsage('Processing Test Predictions...')
-    progress.update_percentage(75)
+    progress.report('Processing Test Predictions...', 75)
     DeepSSMUtils.process_test_predictions(project, config_file)
-    progress.update_percentage(90)
+    progress.report(percentage=90)
 
 
 def run_deepssm_command(
@@ -239,12 +238,12 @@ def run_deepssm_command(
     import shapeworks as sw
 
     user = User.objects.get(id=user_id)
-    progress = models.TaskProgress.objects.get(id=progress_id)
+    progress = ProgressReporter(progress_id)
     token, _created = Token.objects.get_or_create(user=user)
     base_url = settings.API_URL  # type: ignore
 
     try:
-        progress.update_message('Initializing task...')
+        progress.report('Initializing task...')
         with TemporaryDirectory() as download_dir:
             with swcc_session(base_url=base_url) as session:
                 # fetch everything we need
@@ -252,13 +251,11 @@ def run_deepssm_command(
                 project = models.Project.objects.get(id=project_id)
                 project_filename = project.file.name.split('/')[-1]
                 swcc_project = SWCCProject.from_id(project.id)
-                progress.update_message('Downloading project...')
+                progress.report('Downloading project...')
                 swcc_project.download(download_dir)
 
                 pre_command_function()
-                progress.update_percentage(10)
-
-                progress.update_message('Writing form data to project file...')
+                progress.report('Writing form data to project file...', 10)
                 if form_data:
                     # write the form data to the project file
                     edit_swproj_section(
@@ -274,10 +271,10 @@ def run_deepssm_command(
 
                 sw_project_file = str(Path(download_dir, project_filename))
 
-                progress.update_message('Loading project file...')
+                progress.report('Loading project file...')
                 sw_project.load(sw_project_file)
 
-                progress.update_message('Copying grooming parameters')
+                progress.report('Copying grooming parameters')
                 groom_params = sw_project.get_parameters('groom')
 
                 # for each parameter in the form data, set the parameter in the project
@@ -286,7 +283,7 @@ def run_deepssm_command(
 
                 sw_project.set_parameters('groom', groom_params)
 
-                progress.update_message('Copying optimization parameters')
+                progress.report('Copying optimization parameters')
                 optimize_params = sw_project.get_parameters('optimize')
                 # for each parameter in the form data, set the parameter in the project
                 for key, value in form_data.items():
@@ -294,7 +291,7 @@ def run_deepssm_command(
 
                 sw_project.set_parameters('optimize', optimize_params)
 
-                progress.update_message('Running DeepSSM on data...')
+                progress.report('Running DeepSSM on data...')
 
                 os.chdir(sw_project.get_project_path())
                 run_prep(form_data, sw_project, sw_project_file, progress)
@@ -337,7 +334,7 @@ def run_deepssm_command(
                 }
 
                 run_testing(form_data, sw_project, download_dir, progress)
-                progress.update_message('Saving Results...')
+                progress.report('Saving Results...')
 
                 subjects = sw_project.get_subjects()
 
@@ -355,7 +352,7 @@ def run_deepssm_command(
                 os.chdir('../../')
 
                 post_command_function(project, download_dir, result_data, project_filename)
-                progress.update_percentage(100)
+                progress.report(percentage=100)
     except models.TaskProgress.TaskAbortedError:
         print('Task Aborted. Exiting.')
     except Exception as e:
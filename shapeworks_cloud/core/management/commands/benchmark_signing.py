@@ -0,0 +1,32 @@
+import time
+
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from shapeworks_cloud.core import signing
+
+
+class Command(BaseCommand):
+    help = 'Times URL signing for many files, directly and through the signing cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--count', type=int, default=10000)
+
+    def handle(self, count, **options):
+        names = [f'benchmark/{index:06d}/file.vtk' for index in range(count)]
+        caches[signing.CACHE_ALIAS].clear()
+
+        def timed(label, function):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f'{label:<24}{elapsed * 1000:10.1f} ms{elapsed / count * 1e6:10.1f} us/file'
+            )
+
+        self.stdout.write(f'Signing {count} files with {default_storage.__class__.__name__}')
+        timed('storage.url', lambda: [default_storage.url(name) for name in names])
+        timed('sign_names, cold cache', lambda: signing.sign_names(names))
+        timed('sign_names, warm cache', lambda: signing.sign_names(names))
+        timed('one by one, warm cache', lambda: [signing.sign_names([name]) for name in names])
@@ -0,0 +1,47 @@
+# Generated by Django 4.1.13 on 2026-10-18 01:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+import s3_file_field.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0041_taskprogress_formdata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='manifest_stale',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.CreateModel(
+            name='ProjectManifestEntry',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                ('path', models.CharField(max_length=1024)),
+                ('file', s3_file_field.fields.S3FileField()),
+                (
+                    'project',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='manifest_entries',
+                        to='core.project',
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='projectmanifestentry',
+            constraint=models.UniqueConstraint(
+                fields=('project', 'path'), name='unique_project_manifest_path'
+            ),
+        ),
+    ]
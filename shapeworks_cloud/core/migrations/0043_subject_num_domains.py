@@ -0,0 +1,38 @@
+# Generated by Django 4.1.13 on 2026-10-18 01:05
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def populate_num_domains(apps, schema_editor):
+    subject_model = apps.get_model('core', 'Subject')
+    domains = defaultdict(set)
+    for model_name in ['Segmentation', 'Mesh', 'Contour']:
+        shape_model = apps.get_model('core', model_name)
+        for subject_id, anatomy_type in (
+            shape_model.objects.values_list('subject_id', 'anatomy_type').distinct().iterator()
+        ):
+            domains[subject_id].add(anatomy_type)
+
+    subjects = []
+    for subject in subject_model.objects.only('id').iterator():
+        subject.num_domains = len(domains[subject.id])
+        subjects.append(subject)
+    subject_model.objects.bulk_update(subjects, ['num_domains'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0042_project_manifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subject',
+            name='num_domains',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_num_domains, reverse_code=migrations.RunPython.noop),
+    ]
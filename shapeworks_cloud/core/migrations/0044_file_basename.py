@@ -0,0 +1,52 @@
+# Generated by Django 4.1.13 on 2026-10-18 01:07
+
+from django.db import migrations, models
+
+
+def populate_file_basename(apps, schema_editor):
+    for model_name in ['Segmentation', 'Mesh', 'GroomedSegmentation', 'GroomedMesh']:
+        model = apps.get_model('core', model_name)
+        rows = []
+        for row in model.objects.only('id', 'file').iterator():
+            row.file_basename = row.file.name.split('/')[-1] if row.file else ''
+            rows.append(row)
+        model.objects.bulk_update(rows, ['file_basename'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0043_subject_num_domains'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groomedmesh',
+            name='file_basename',
+            field=models.CharField(
+                blank=True, db_index=True, default='', editable=False, max_length=2000
+            ),
+        ),
+        migrations.AddField(
+            model_name='groomedsegmentation',
+            name='file_basename',
+            field=models.CharField(
+                blank=True, db_index=True, default='', editable=False, max_length=2000
+            ),
+        ),
+        migrations.AddField(
+            model_name='mesh',
+            name='file_basename',
+            field=models.CharField(
+                blank=True, db_index=True, default='', editable=False, max_length=2000
+            ),
+        ),
+        migrations.AddField(
+            model_name='segmentation',
+            name='file_basename',
+            field=models.CharField(
+                blank=True, db_index=True, default='', editable=False, max_length=2000
+            ),
+        ),
+        migrations.RunPython(populate_file_basename, reverse_code=migrations.RunPython.noop),
+    ]
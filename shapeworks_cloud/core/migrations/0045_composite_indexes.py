@@ -0,0 +1,63 @@
+# Generated by Django 4.1.13 on 2026-10-18 01:07
+
+from django.db import migrations, models
+
+
+def delete_duplicate_annotations(apps, schema_editor):
+    # keep the most recently written row of each (project, subject, anatomy_type)
+    for model_name in ['Landmarks', 'Constraints']:
+        model = apps.get_model('core', model_name)
+        seen = set()
+        duplicate_ids = []
+        for row_id, project_id, subject_id, anatomy_type in (
+            model.objects.filter(project__isnull=False)
+            .order_by('-modified', '-id')
+            .values_list('id', 'project_id', 'subject_id', 'anatomy_type')
+            .iterator()
+        ):
+            key = (project_id, subject_id, anatomy_type)
+            if key in seen:
+                duplicate_ids.append(row_id)
+            seen.add(key)
+        model.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0044_file_basename'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dataset',
+            index=models.Index(fields=['private', 'creator'], name='dataset_private_creator_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='optimizedparticles',
+            index=models.Index(
+                fields=['project', 'subject', 'anatomy_type'], name='particles_project_subject_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['private', 'creator'], name='project_private_creator_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subject',
+            index=models.Index(fields=['dataset', 'name'], name='subject_dataset_name_idx'),
+        ),
+        migrations.RunPython(delete_duplicate_annotations, reverse_code=migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='constraints',
+            constraint=models.UniqueConstraint(
+                fields=('project', 'subject', 'anatomy_type'), name='unique_project_constraints'
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name='landmarks',
+            constraint=models.UniqueConstraint(
+                fields=('project', 'subject', 'anatomy_type'), name='unique_project_landmarks'
+            ),
+        ),
+    ]
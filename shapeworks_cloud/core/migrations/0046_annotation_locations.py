@@ -0,0 +1,34 @@
+# Generated by Django 4.1.13 on 2026-10-18 01:15
+
+from django.db import migrations, models
+import s3_file_field.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0045_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='constraints',
+            name='locations',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='landmarks',
+            name='locations',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='constraints',
+            name='file',
+            field=s3_file_field.fields.S3FileField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='landmarks',
+            name='file',
+            field=s3_file_field.fields.S3FileField(blank=True, null=True),
+        ),
+    ]
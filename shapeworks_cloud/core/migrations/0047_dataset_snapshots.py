@@ -0,0 +1,64 @@
+# Generated by Django 4.1.13 on 2026-10-18 01:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+import s3_file_field.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0046_annotation_locations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='contents_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='DatasetSnapshot',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                (
+                    'created',
+                    django_extensions.db.fields.CreationDateTimeField(
+                        auto_now_add=True, verbose_name='created'
+                    ),
+                ),
+                (
+                    'modified',
+                    django_extensions.db.fields.ModificationDateTimeField(
+                        auto_now=True, verbose_name='modified'
+                    ),
+                ),
+                ('version', models.PositiveIntegerField()),
+                ('file', s3_file_field.fields.S3FileField(blank=True, null=True)),
+                (
+                    'dataset',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='snapshots',
+                        to='core.dataset',
+                    ),
+                ),
+            ],
+            options={
+                'get_latest_by': 'modified',
+                'abstract': False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='datasetsnapshot',
+            constraint=models.UniqueConstraint(
+                fields=('dataset', 'version'), name='unique_dataset_snapshot_version'
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.13 on 2026-10-18 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0047_dataset_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WriteAccessLog',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                ('timestamp', models.DateTimeField(db_index=True)),
+                ('username', models.CharField(blank=True, max_length=150)),
+                ('action', models.CharField(max_length=255)),
+                ('details', models.TextField(blank=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-18 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0048_write_access_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectmanifestentry',
+            name='crc',
+            field=models.PositiveBigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='projectmanifestentry',
+            name='size',
+            field=models.PositiveBigIntegerField(null=True),
+        ),
+    ]
@@ -1,11 +1,48 @@
 import json
+from typing import Dict
 
 from django.contrib.auth.models import User
 from django.core.files.base import ContentFile
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Case, F, Max, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.dispatch import Signal
+from django.utils import timezone
 from django_extensions.db.models import TimeStampedModel
 from s3_file_field import S3FileField
 
+from . import payload_cache, signing, zip_stream
+
+# sent by Model.delete of the models below. Unlike post_delete, it is not sent for rows deleted
+# through a cascade or a queryset, whose callers invalidate in bulk; listening to post_delete
+# would keep Django from deleting the cascades of a dataset without loading every row.
+post_instance_delete = Signal()
+
+
+class InstanceDeleteSignalMixin:
+    def delete(self, *args, **kwargs):
+        ret = super().delete(*args, **kwargs)
+        post_instance_delete.send(sender=type(self), instance=self)
+        return ret
+
+
+def copy_rows(rows, **fields):
+    """Bulk insert copies of rows with fields replaced, mapping each original id to its copy."""
+    rows = list(rows)
+    if not rows:
+        return {}
+    old_ids = [row.id for row in rows]
+    for row in rows:
+        row.id = None
+        for key, value in fields.items():
+            setattr(row, key, value)
+    copies = type(rows[0]).objects.bulk_create(rows)
+    return dict(zip(old_ids, copies))
+
+
+def copied_id(copies, old_id):
+    return copies[old_id].id if old_id in copies else old_id
+
 
 class Dataset(TimeStampedModel, models.Model):
     name = models.CharField(max_length=255, unique=True)
@@ -18,9 +55,48 @@ class Dataset(TimeStampedModel, models.Model):
     keywords = models.CharField(max_length=255, blank=True, default='')
     contributors = models.TextField(blank=True, default='')
     publications = models.TextField(blank=True, default='')
+    # bumped by signals whenever a subject, shape, image or annotation of the dataset changes
+    contents_version = models.PositiveIntegerField(default=0)
+
+    class Meta(TimeStampedModel.Meta):
+        indexes = [
+            models.Index(fields=['private', 'creator'], name='dataset_private_creator_idx'),
+        ]
+
+    @classmethod
+    def bump_contents_version(cls, **lookup):
+        # outdates the snapshots of the matching datasets
+        datasets = cls.objects.filter(**lookup)
+        datasets.update(contents_version=models.F('contents_version') + 1)
+        # and the cached projects, whose max_num_domains may have changed
+        payload_cache.invalidate(
+            'project',
+            Project.objects.filter(dataset__in=datasets).values_list('id', flat=True),
+        )
+
+    def get_snapshot_files(self):
+        """Return the files of every subject, keyed by the name swcc downloads them under."""
+        files = {}
+        for model in [Segmentation, Mesh, Contour, Image]:
+            for instance in model.objects.filter(subject__dataset=self).order_by('id'):
+                if instance.file:
+                    files[instance.file.name.split('/')[-1]] = instance.file
+        # annotation files are written under one name per subject and anatomy type, the way
+        # swcc writes them from their locations, keeping the first match
+        for model in [Landmarks, Constraints]:
+            for instance in (
+                model.objects.filter(subject__dataset=self).select_related('subject').order_by('id')
+            ):
+                instance.ensure_file()
+                if instance.file:
+                    anatomy = instance.anatomy_type.replace('anatomy_', '')
+                    name = f'{instance.subject.name}_{anatomy}_{instance.default_file_name}'
+                    files.setdefault(name, instance.file)
+        return files
 
     def get_contents(self):
-        ret = []  # type: ignore
+        # rows keyed by subject name, in order of first appearance
+        ret: Dict[str, Dict[str, str]] = {}
 
         def truncate_filename(filename):
             return filename.split('/')[-1]
@@ -28,61 +104,96 @@ class Dataset(TimeStampedModel, models.Model):
         def truncate_anatomy(anatomy_type):
             return anatomy_type.replace('anatomy_', '')
 
+        # one query per shape type, reading only the columns we need
         group_list = [
-            Segmentation.objects.filter(subject__dataset=self),
-            Mesh.objects.filter(subject__dataset=self),
-            Image.objects.filter(subject__dataset=self),
-            Contour.objects.filter(subject__dataset=self),
+            ('shape_', Segmentation.objects.filter(subject__dataset=self), 'anatomy_type'),
+            ('shape_', Mesh.objects.filter(subject__dataset=self), 'anatomy_type'),
+            ('image_', Image.objects.filter(subject__dataset=self), 'modality'),
+            ('shape_', Contour.objects.filter(subject__dataset=self), 'anatomy_type'),
         ]
 
-        for shape_group in group_list:
-            for shape in shape_group:
-                if hasattr(shape, 'anatomy_type'):
-                    anatomy = truncate_anatomy(shape.anatomy_type)
-                    label = 'shape_'
-                else:
-                    anatomy = shape.modality  # type: ignore
-                    label = 'image_'
-                if shape.subject.name in [s['name'] for s in ret]:  # type: ignore
-                    subject = next(
-                        (s for s in ret if s['name'] == shape.subject.name), None  # type: ignore
-                    )
-                    subject[label + anatomy] = truncate_filename(shape.file.name)  # type: ignore
-                else:
-                    subject = {
-                        'name': shape.subject.name,  # type: ignore
-                        label + anatomy: truncate_filename(shape.file.name),  # type: ignore
-                    }
-                    ret.append(subject)
+        for label, shape_group, anatomy_field in group_list:
+            for subject_name, anatomy, filename in shape_group.order_by('id').values_list(
+                'subject__name', anatomy_field, 'file'
+            ):
+                if label == 'shape_':
+                    anatomy = truncate_anatomy(anatomy)
+                subject = ret.setdefault(subject_name, {'name': subject_name})
+                subject[label + anatomy] = truncate_filename(filename)
+
+        return list(ret.values())
 
-        return ret
 
+class DatasetSnapshot(TimeStampedModel, models.Model):
+    """An archive of every file in a dataset at one contents_version."""
 
-class Subject(TimeStampedModel, models.Model):
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name='snapshots')
+    version = models.PositiveIntegerField()
+    # empty until the build task has finished
+    file = S3FileField(null=True, blank=True)
+
+    class Meta(TimeStampedModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dataset', 'version'], name='unique_dataset_snapshot_version'
+            )
+        ]
+
+
+class Subject(InstanceDeleteSignalMixin, TimeStampedModel, models.Model):
     name = models.CharField(max_length=255)
     groups = models.JSONField(null=True, blank=True)
     dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name='subjects')
+    # number of distinct anatomy types among the subject's shapes, kept up to date on write
+    num_domains = models.IntegerField(default=0)
+
+    class Meta(TimeStampedModel.Meta):
+        indexes = [
+            models.Index(fields=['dataset', 'name'], name='subject_dataset_name_idx'),
+        ]
+
+    @classmethod
+    def refresh_num_domains(cls, subject_ids):
+        """Recount num_domains of the given subjects, or of a queryset of them, in one UPDATE."""
+        qn = connection.ops.quote_name
+        # UNION drops duplicates, so its rows are the distinct anatomy types of a subject
+        anatomy_types = ' UNION '.join(
+            f'SELECT {qn("anatomy_type")} FROM {qn(model._meta.db_table)} '
+            f'WHERE {qn("subject_id")} = {qn(cls._meta.db_table)}.{qn("id")}'
+            for model in [Segmentation, Mesh, Contour]
+        )
+        cls.objects.filter(id__in=subject_ids).update(
+            num_domains=RawSQL(f'SELECT COUNT(*) FROM ({anatomy_types}) AS anatomy_types', [])
+        )
 
 
-class Segmentation(TimeStampedModel, models.Model):
+class Segmentation(InstanceDeleteSignalMixin, TimeStampedModel, models.Model):
     file = S3FileField()
+    # last path component of file, kept in sync by a pre_save signal for indexed lookups;
+    # as long as the file name itself, which S3 keeps under 1024 bytes, so it fits a btree index
+    file_basename = models.CharField(
+        max_length=2000, blank=True, default='', db_index=True, editable=False
+    )
     anatomy_type = models.CharField(max_length=255)  # choices?
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='segmentations')
 
 
-class Mesh(TimeStampedModel, models.Model):
+class Mesh(InstanceDeleteSignalMixin, TimeStampedModel, models.Model):
     file = S3FileField()
+    file_basename = models.CharField(
+        max_length=2000, blank=True, default='', db_index=True, editable=False
+    )
     anatomy_type = models.CharField(max_length=255)  # choices?
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='meshes')
 
 
-class Contour(TimeStampedModel, models.Model):
+class Contour(InstanceDeleteSignalMixin, TimeStampedModel, models.Model):
     file = S3FileField()
     anatomy_type = models.CharField(max_length=255)  # choices?
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='contours')
 
 
-class Image(TimeStampedModel, models.Model):
+class Image(InstanceDeleteSignalMixin, TimeStampedModel, models.Model):
     file = S3FileField()
     modality = models.CharField(max_length=255)  # choices?
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='images')
@@ -141,6 +252,21 @@ class Project(TimeStampedModel, models.Model):
         on_delete=models.SET_NULL,
         null=True,
     )
+    # set whenever a write may have changed the files referenced by the project
+    manifest_stale = models.BooleanField(default=True)
+
+    class Meta(TimeStampedModel.Meta):
+        indexes = [
+            models.Index(fields=['private', 'creator'], name='project_private_creator_idx'),
+        ]
+
+    @classmethod
+    def visible_to(cls, user):
+        if user.is_anonymous:
+            return cls.objects.none()
+        if user.is_staff:
+            return cls.objects.all()
+        return cls.objects.filter(Q(private=False) | Q(creator=user))
 
     def create_new_file(self):
         file_contents = {
@@ -152,64 +278,391 @@ class Project(TimeStampedModel, models.Model):
             f'{self.dataset.name}.swproj', ContentFile(json.dumps(file_contents).encode())
         )
 
-    def get_download_paths(self):
+    def get_max_num_domains(self):
+        return (
+            Subject.objects.filter(dataset=self.dataset_id).aggregate(
+                max_num_domains=Max('num_domains')
+            )['max_num_domains']
+            or 0
+        )
+
+    def get_download_files(self):
+        """Map each relative path referenced by the project file to its stored file."""
         ret = {}
         with self.file.open() as f:
             data = json.load(f)['data']
 
-        for subject_info in data:
-            subject = Subject.objects.filter(
-                dataset=self.dataset, name=subject_info['name']
-            ).first()
-            if subject:
-                particles = OptimizedParticles.objects.filter(project=self, subject=subject)
-                related_files = {
-                    'mesh': [(m.anatomy_type, m.file) for m in subject.meshes.all()],
-                    'segmentation': [(s.anatomy_type, s.file) for s in subject.segmentations.all()],
-                    'contour': [(c.anatomy_type, c.file) for c in subject.contours.all()],
-                    'image': [(i.modality, i.file) for i in subject.images.all()],
-                    'constraints': [(c.anatomy_type, c.file) for c in subject.constraints.all()],
-                    'landmarks': [
-                        (lm.anatomy_type, lm.file)
-                        for lm in Landmarks.objects.filter(project=self, subject=subject)
-                    ],
-                    'groomed': [
-                        (gm.mesh.anatomy_type, gm.file)
-                        for gm in GroomedMesh.objects.filter(project=self, mesh__subject=subject)
-                        if gm.mesh
-                    ]
-                    + [
-                        (gs.segmentation.anatomy_type, gs.file)
-                        for gs in GroomedSegmentation.objects.filter(
-                            project=self, segmentation__subject=subject
-                        )
-                        if gs.segmentation
-                    ],
-                    'local': [(p.anatomy_type, p.local) for p in particles if p.local],
-                    'world': [(p.anatomy_type, p.world) for p in particles if p.world],
-                }
-                related_files['shape'] = (
-                    related_files['mesh']
-                    + related_files['segmentation']
-                    + related_files['contour']
-                    + related_files['image']
+        # first subject wins when names collide within the dataset
+        subject_ids: Dict[str, int] = {}
+        for name, subject_id in (
+            Subject.objects.filter(dataset=self.dataset_id).order_by('id').values_list('name', 'id')
+        ):
+            subject_ids.setdefault(name, subject_id)
+
+        shapes_filter = {'subject__dataset': self.dataset_id}
+        particles = list(
+            OptimizedParticles.objects.filter(project=self, subject__isnull=False).order_by('id')
+        )
+        # annotations written since ensure_annotation_files ran have no file yet, and are
+        # left out until the next refresh, which their write has already requested
+        constraints = list(Constraints.objects.filter(**shapes_filter))
+        landmarks = list(Landmarks.objects.filter(project=self).order_by('id'))
+        related_rows = {
+            'mesh': [
+                (m.subject_id, m.anatomy_type, m.file)
+                for m in Mesh.objects.filter(**shapes_filter).order_by('id')
+            ],
+            'segmentation': [
+                (s.subject_id, s.anatomy_type, s.file)
+                for s in Segmentation.objects.filter(**shapes_filter).order_by('id')
+            ],
+            'contour': [
+                (c.subject_id, c.anatomy_type, c.file)
+                for c in Contour.objects.filter(**shapes_filter).order_by('id')
+            ],
+            'image': [
+                (i.subject_id, i.modality, i.file)
+                for i in Image.objects.filter(**shapes_filter).order_by('id')
+            ],
+            # constraints of this project take precedence over those of other projects
+            'constraints': [
+                (c.subject_id, c.anatomy_type, c.file)
+                for c in sorted(constraints, key=lambda c: (c.project_id != self.id, c.id))
+            ],
+            'landmarks': [(lm.subject_id, lm.anatomy_type, lm.file) for lm in landmarks],
+            'groomed': [
+                (gm.mesh.subject_id, gm.mesh.anatomy_type, gm.file)
+                for gm in GroomedMesh.objects.filter(project=self, mesh__isnull=False)
+                .select_related('mesh')
+                .order_by('id')
+            ]
+            + [
+                (gs.segmentation.subject_id, gs.segmentation.anatomy_type, gs.file)
+                for gs in GroomedSegmentation.objects.filter(
+                    project=self, segmentation__isnull=False
                 )
+                .select_related('segmentation')
+                .order_by('id')
+            ],
+            'local': [(p.subject_id, p.anatomy_type, p.local) for p in particles if p.local],
+            'world': [(p.subject_id, p.anatomy_type, p.world) for p in particles if p.world],
+        }
+        related_rows['shape'] = (
+            related_rows['mesh']
+            + related_rows['segmentation']
+            + related_rows['contour']
+            + related_rows['image']
+        )
+
+        # index every file by (subject, anatomy type), keeping the first match
+        related_files: Dict[str, Dict] = {}
+        for prefix, rows in related_rows.items():
+            index = related_files[prefix] = {}
+            for subject_id, anatomy_type, file in rows:
+                index.setdefault((subject_id, anatomy_type.replace('anatomy_', '')), file)
 
-                for key, value in subject_info.items():
-                    prefix = key.split('_')[0]
-                    suffix = key.split('_')[-1]
-                    target_file = None
-                    if prefix in related_files:
-                        for related in related_files[prefix]:
-                            if not target_file:
-                                # subject and anatomy type must match
-                                if suffix == related[0].replace('anatomy_', ''):
-                                    target_file = related[1].url
+        for subject_info in data:
+            subject_id = subject_ids.get(subject_info['name'])
+            if subject_id is None:
+                continue
+            for key, value in subject_info.items():
+                prefix = key.split('_')[0]
+                suffix = key.split('_')[-1]
+                if prefix in related_files:
+                    # subject and anatomy type must match
+                    target_file = related_files[prefix].get((subject_id, suffix))
                     if target_file:
-                        value = value.replace('../', '')
-                        ret[value] = target_file
+                        ret[value.replace('../', '')] = target_file
         return ret
 
+    def ensure_annotation_files(self):
+        """Write the files of the project's annotations that are stored as locations only."""
+        for annotation_model, lookup in [
+            (Constraints, {'subject__dataset': self.dataset_id}),
+            (Landmarks, {'project': self}),
+        ]:
+            for annotation in annotation_model.objects.filter(
+                Q(file__isnull=True) | Q(file=''), locations__isnull=False, **lookup
+            ):
+                annotation.ensure_file()
+
+    def refresh_manifest(self):
+        """Bring the stored download manifest in line with the project's current files."""
+        # storage writes are slow and may fail, so they happen before the row lock is taken
+        self.ensure_annotation_files()
+        with transaction.atomic():
+            # serialize concurrent refreshes of the same project
+            Project.objects.select_for_update().filter(id=self.id).first()
+            keys = {path: file.name for path, file in self.get_download_files().items()}
+            existing = {entry.path: entry for entry in self.manifest_entries.all()}
+
+            removed = [path for path in existing if path not in keys]
+            if removed:
+                self.manifest_entries.filter(path__in=removed).delete()
+            changed = []
+            for path, entry in existing.items():
+                if path in keys and entry.file.name != keys[path]:
+                    entry.file = keys[path]
+                    entry.size = entry.crc = None
+                    changed.append(entry)
+            ProjectManifestEntry.objects.bulk_update(changed, ['file', 'size', 'crc'])
+            ProjectManifestEntry.objects.bulk_create(
+                [
+                    ProjectManifestEntry(project=self, path=path, file=key)
+                    for path, key in keys.items()
+                    if path not in existing
+                ]
+            )
+            Project.objects.filter(id=self.id).update(manifest_stale=False)
+        self.manifest_stale = False
+
+    def store_manifest_checksums(self):
+        """Read the new files of the manifest once, so exports need not read them for CRCs."""
+        entries = list(self.manifest_entries.filter(crc__isnull=True))
+        if not entries:
+            return
+        checksums = zip_stream.read_checksums([entry.file for entry in entries])
+        # an entry whose file changed in the meantime is left for the next refresh
+        cases = [
+            (Q(id=entry.id, file=entry.file.name), size, crc)
+            for entry, (size, crc) in zip(entries, checksums)
+        ]
+        ProjectManifestEntry.objects.filter(id__in=[entry.id for entry in entries]).update(
+            size=Case(
+                *[When(q, then=Value(size)) for q, size, _ in cases],
+                default=F('size'),
+                output_field=models.PositiveBigIntegerField(),
+            ),
+            crc=Case(
+                *[When(q, then=Value(crc)) for q, _, crc in cases],
+                default=F('crc'),
+                output_field=models.PositiveBigIntegerField(),
+            ),
+        )
+
+    def get_download_paths(self):
+        if self.manifest_stale:
+            self.refresh_manifest()
+        return signing.sign_files({entry.path: entry.file for entry in self.manifest_entries.all()})
+
+    def copy_cached_analysis(self):
+        """Copy the rows of the project's cached analysis, sharing their stored files."""
+        analysis = (
+            CachedAnalysis.objects.filter(id=self.last_cached_analysis_id)
+            .prefetch_related('modes__pca_values', 'groups', 'mean_shapes')
+            .first()
+        )
+        if analysis is None:
+            return None
+        modes = list(analysis.modes.all())
+        mode_pca_ids = [(mode.id, [pca.id for pca in mode.pca_values.all()]) for mode in modes]
+        pca_values = {pca.id: pca for mode in modes for pca in mode.pca_values.all()}
+        mean_shapes = list(analysis.mean_shapes.all())
+        groups = list(analysis.groups.all())
+
+        new_pca_values = copy_rows(pca_values.values())
+        new_modes = copy_rows(modes)
+        new_mean_shapes = copy_rows(mean_shapes)
+        new_groups = copy_rows(groups)
+        # copy_rows gives the copied rows their new ids, so the key is read beforehand
+        analysis_id = analysis.id
+        new_analysis = copy_rows([analysis])[analysis_id]
+
+        CachedAnalysisMode.pca_values.through.objects.bulk_create(
+            [
+                CachedAnalysisMode.pca_values.through(
+                    cachedanalysismode_id=new_modes[mode_id].id,
+                    cachedanalysismodepca_id=new_pca_values[pca_id].id,
+                )
+                for mode_id, pca_ids in mode_pca_ids
+                for pca_id in pca_ids
+            ]
+        )
+        for relation, copies in [
+            (CachedAnalysis.modes, new_modes),
+            (CachedAnalysis.mean_shapes, new_mean_shapes),
+            (CachedAnalysis.groups, new_groups),
+        ]:
+            through = relation.through
+            target_field = relation.field.m2m_reverse_field_name()
+            through.objects.bulk_create(
+                [
+                    through(cachedanalysis_id=new_analysis.id, **{target_field: copy})
+                    for copy in copies.values()
+                ]
+            )
+        return new_analysis
+
+    def clone(self, **fields):
+        """
+        Copy the project with every row derived from it.
+
+        Stored files are never modified in place, so the copies share them with the originals.
+        """
+        with transaction.atomic():
+            clone = Project.objects.get(id=self.id)
+            clone.id = None
+            for key, value in fields.items():
+                setattr(clone, key, value)
+            clone.last_cached_analysis = self.copy_cached_analysis()
+            clone.save()
+
+            # bulk_create sends no signals, so the copied manifest below stays valid
+            groomed_meshes = copy_rows(GroomedMesh.objects.filter(project=self), project=clone)
+            groomed_segmentations = copy_rows(
+                GroomedSegmentation.objects.filter(project=self), project=clone
+            )
+            particles = list(OptimizedParticles.objects.filter(project=self))
+            for p in particles:
+                p.groomed_mesh_id = copied_id(groomed_meshes, p.groomed_mesh_id)
+                p.groomed_segmentation_id = copied_id(
+                    groomed_segmentations, p.groomed_segmentation_id
+                )
+            new_particles = copy_rows(particles, project=clone)
+            samples = list(ReconstructedSample.objects.filter(project=self))
+            for sample in samples:
+                sample.particles_id = copied_id(new_particles, sample.particles_id)
+            copy_rows(samples, project=clone)
+
+            annotation_subjects = set()
+            for related_model in [
+                Landmarks,
+                Constraints,
+                DeepSSMTestingData,
+                DeepSSMTrainingPair,
+                DeepSSMTrainingImage,
+                DeepSSMAugPair,
+                DeepSSMResult,
+            ]:
+                copies = copy_rows(related_model.objects.filter(project=self), project=clone)
+                if related_model in [Landmarks, Constraints]:
+                    annotation_subjects |= {copy.subject_id for copy in copies.values()}
+            if annotation_subjects:
+                # the copied annotations are part of the dataset snapshots
+                Dataset.bump_contents_version(subjects__in=annotation_subjects)
+
+            if Project.objects.filter(id=self.id, manifest_stale=False).exists():
+                copy_rows(self.manifest_entries.all(), project=clone)
+                Project.objects.filter(id=clone.id).update(manifest_stale=False)
+                clone.manifest_stale = False
+        return clone
+
+    def get_bundle(self):
+        """Collect the file URLs of every subject of the project, grouped by anatomy."""
+        subjects = list(Subject.objects.filter(dataset=self.dataset_id).order_by('name'))
+        bundle: Dict[int, Dict] = {
+            subject.id: {
+                'id': subject.id,
+                'name': subject.name,
+                'groups': subject.groups,
+                'images': {},
+                'anatomies': {},
+            }
+            for subject in subjects
+        }
+
+        def anatomy(subject_id, anatomy_type):
+            return bundle[subject_id]['anatomies'].setdefault(
+                anatomy_type,
+                {
+                    'shape': None,
+                    'groomed': None,
+                    'particles': None,
+                    'landmarks': None,
+                    'constraints': None,
+                    'reconstructed': [],
+                },
+            )
+
+        def file_entry(shape_type, obj):
+            return {'type': shape_type, 'id': obj.id, 'url': obj.file}
+
+        # one query per table, each covering the whole project
+        shapes_filter = {'subject__dataset': self.dataset_id}
+        for shape_type, shape_model in [
+            ('segmentation', Segmentation),
+            ('mesh', Mesh),
+            ('contour', Contour),
+        ]:
+            for shape in shape_model.objects.filter(**shapes_filter).order_by('id'):
+                entry = anatomy(shape.subject_id, shape.anatomy_type)
+                if entry['shape'] is None:
+                    entry['shape'] = file_entry(shape_type, shape)
+        for image in Image.objects.filter(**shapes_filter).order_by('id'):
+            bundle[image.subject_id]['images'].setdefault(
+                image.modality, {'id': image.id, 'url': image.file}
+            )
+
+        groomed_shapes = [
+            ('mesh', gm, gm.mesh)
+            for gm in GroomedMesh.objects.filter(project=self, mesh__isnull=False)
+            .select_related('mesh')
+            .order_by('id')
+        ] + [
+            ('segmentation', gs, gs.segmentation)
+            for gs in GroomedSegmentation.objects.filter(project=self, segmentation__isnull=False)
+            .select_related('segmentation')
+            .order_by('id')
+        ]
+        for shape_type, groomed, original in groomed_shapes:
+            if original.subject_id not in bundle:
+                continue
+            entry = anatomy(original.subject_id, original.anatomy_type)
+            if entry['groomed'] is None:
+                entry['groomed'] = file_entry(shape_type, groomed)
+
+        particles_anatomies = {}
+        for particles in OptimizedParticles.objects.filter(
+            project=self, subject__dataset=self.dataset_id
+        ).order_by('id'):
+            entry = anatomy(particles.subject_id, particles.anatomy_type)
+            particles_anatomies[particles.id] = entry
+            if entry['particles'] is None:
+                entry['particles'] = {
+                    'id': particles.id,
+                    'world': particles.world or None,
+                    'local': particles.local or None,
+                    'transform': particles.transform or None,
+                }
+
+        for key, annotation_model in [('landmarks', Landmarks), ('constraints', Constraints)]:
+            for annotation in annotation_model.objects.filter(
+                project=self, subject__dataset=self.dataset_id
+            ).order_by('id'):
+                entry = anatomy(annotation.subject_id, annotation.anatomy_type)
+                entry[key] = {
+                    'id': annotation.id,
+                    'url': annotation.file or None,
+                    'locations': annotation.locations,
+                }
+
+        for sample in ReconstructedSample.objects.filter(
+            project=self, particles__isnull=False
+        ).order_by('id'):
+            if sample.particles_id in particles_anatomies:
+                particles_anatomies[sample.particles_id]['reconstructed'].append(
+                    {'id': sample.id, 'url': sample.file}
+                )
+
+        # the files collected above are signed in one batch
+        return signing.sign_files({'id': self.id, 'subjects': list(bundle.values())})
+
+
+class ProjectManifestEntry(models.Model):
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='manifest_entries')
+    path = models.CharField(max_length=1024)
+    file = S3FileField()
+    # of the file, stored so that exports can lay out and resume archives without reading it
+    size = models.PositiveBigIntegerField(null=True)
+    crc = models.PositiveBigIntegerField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['project', 'path'], name='unique_project_manifest_path'
+            ),
+        ]
+
 
 class DeepSSMTestingData(models.Model):
     project = models.ForeignKey(
@@ -260,9 +713,12 @@ class DeepSSMResult(models.Model):
     testing_distances = S3FileField(null=True)  # .csv
 
 
-class GroomedSegmentation(TimeStampedModel, models.Model):
+class GroomedSegmentation(InstanceDeleteSignalMixin, TimeStampedModel, models.Model):
     # The contents of the nrrd file
     file = S3FileField()
+    file_basename = models.CharField(
+        max_length=2000, blank=True, default='', db_index=True, editable=False
+    )
 
     # represent these in raw form?
     pre_cropping = S3FileField(null=True)
@@ -280,9 +736,12 @@ class GroomedSegmentation(TimeStampedModel, models.Model):
     )
 
 
-class GroomedMesh(TimeStampedModel, models.Model):
+class GroomedMesh(InstanceDeleteSignalMixin, TimeStampedModel, models.Model):
     # The contents of the nrrd file
     file = S3FileField()
+    file_basename = models.CharField(
+        max_length=2000, blank=True, default='', db_index=True, editable=False
+    )
 
     # represent these in raw form?
     pre_cropping = S3FileField(null=True)
@@ -298,7 +757,7 @@ class GroomedMesh(TimeStampedModel, models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='groomed_meshes')
 
 
-class OptimizedParticles(TimeStampedModel, models.Model):
+class OptimizedParticles(InstanceDeleteSignalMixin, TimeStampedModel, models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
     world = S3FileField(null=True)
     local = S3FileField(null=True)
@@ -323,24 +782,127 @@ class OptimizedParticles(TimeStampedModel, models.Model):
         null=True,
     )
 
+    class Meta(TimeStampedModel.Meta):
+        indexes = [
+            models.Index(
+                fields=['project', 'subject', 'anatomy_type'], name='particles_project_subject_idx'
+            ),
+        ]
 
-class Landmarks(TimeStampedModel, models.Model):
-    file = S3FileField()
+
+class AnnotationFileMixin:
+    """
+    Keep annotation coordinates in the `locations` column.
+
+    The file format ShapeWorks reads is only written when a task or download needs it, and
+    rows that predate the column are parsed from their file on first read.
+    """
+
+    default_file_name: str
+
+    def ensure_file(self):
+        if not self.file and self.locations is not None:
+            self.file.save(
+                self.default_file_name,
+                ContentFile(self.dump_locations().encode()),
+                save=False,
+            )
+            # the row content is unchanged, so skip the signals of a full save, but still
+            # touch modified since the serialized row (and so its ETag) changes
+            self.modified = timezone.now()
+            type(self).objects.filter(id=self.id).update(
+                file=self.file.name, modified=self.modified
+            )
+            self.invalidate_project_payload()
+
+    def get_locations(self):
+        if self.locations is None and self.file:
+            with self.file.open() as f:
+                contents = f.read()
+            if isinstance(contents, bytes):
+                contents = contents.decode()
+            self.locations = self.parse_file(contents)
+            self.modified = timezone.now()
+            type(self).objects.filter(id=self.id).update(
+                locations=self.locations, modified=self.modified
+            )
+            self.invalidate_project_payload()
+        return self.locations
+
+    def invalidate_project_payload(self):
+        # the project payload nests its annotations, and update() sends no signals
+        if self.project_id is not None:
+            payload_cache.invalidate('project', [self.project_id])
+
+
+class Landmarks(InstanceDeleteSignalMixin, AnnotationFileMixin, TimeStampedModel, models.Model):
+    file = S3FileField(null=True, blank=True)
+    # list of [x, y, z] points
+    locations = models.JSONField(null=True, blank=True)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='landmarks')
     anatomy_type = models.CharField(max_length=255)
     project = models.ForeignKey(
         Project, on_delete=models.CASCADE, related_name='landmarks', null=True
     )
 
+    class Meta(TimeStampedModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['project', 'subject', 'anatomy_type'], name='unique_project_landmarks'
+            ),
+        ]
 
-class Constraints(TimeStampedModel, models.Model):
-    file = S3FileField()
+    default_file_name = 'landmarks.csv'
+
+    @staticmethod
+    def normalize_locations(locations):
+        if (
+            locations is not None
+            and len(locations) > 0
+            and locations[0] is not None
+            and len(locations[0]) == 3
+        ):
+            return [list(loc.values()) if isinstance(loc, dict) else list(loc) for loc in locations]
+        return []
+
+    def dump_locations(self):
+        return '\n'.join(' '.join(str(n) for n in loc) for loc in self.locations)
+
+    @staticmethod
+    def parse_file(contents):
+        return [[float(n) for n in line.split()] for line in contents.splitlines() if line.strip()]
+
+
+class Constraints(InstanceDeleteSignalMixin, AnnotationFileMixin, TimeStampedModel, models.Model):
+    file = S3FileField(null=True, blank=True)
+    # contents of the constraints json file
+    locations = models.JSONField(null=True, blank=True)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='constraints')
     anatomy_type = models.CharField(max_length=255)
     project = models.ForeignKey(
         Project, on_delete=models.CASCADE, related_name='constraints', null=True
     )
 
+    class Meta(TimeStampedModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['project', 'subject', 'anatomy_type'], name='unique_project_constraints'
+            ),
+        ]
+
+    default_file_name = 'constraints.json'
+
+    @staticmethod
+    def normalize_locations(locations):
+        return locations
+
+    def dump_locations(self):
+        return json.dumps(self.locations)
+
+    @staticmethod
+    def parse_file(contents):
+        return json.loads(contents)
+
 
 class ReconstructedSample(TimeStampedModel, models.Model):
     file = S3FileField()
@@ -383,3 +945,10 @@ class TaskProgress(TimeStampedModel, models.Model):
         self.error = error[:255]
         self.abort = True
         self.save()
+
+
+class WriteAccessLog(models.Model):
+    timestamp = models.DateTimeField(db_index=True)
+    username = models.CharField(max_length=150, blank=True)
+    action = models.CharField(max_length=255)
+    details = models.TextField(blank=True)
@@ -0,0 +1,92 @@
+"""
+Cache serialized payloads that are expensive to rebuild, such as a project with its analysis.
+
+Each object has a version counter in the cache, and its payload is stored under the version
+that was current when the payload was built. Invalidating an object bumps the counter, so a
+payload built concurrently with a write is never served afterwards.
+"""
+
+from functools import partial
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+
+CACHE_ALIAS = 'payloads'
+STATS = ['hits', 'misses', 'invalidations']
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def version_key(kind, object_id):
+    return f'{kind}:{object_id}:version'
+
+
+def current_version(kind, object_id):
+    cache = get_cache()
+    key = version_key(kind, object_id)
+    version = cache.get(key)
+    if version is None:
+        # start from the clock rather than zero, so that if the counter was evicted, payloads
+        # stored under its earlier values are never read again
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key, time.time_ns())
+    return version
+
+
+def count(stat, delta=1):
+    cache = get_cache()
+    key = f'stats:{stat}'
+    # add is a no-op when the counter exists, and incr is atomic in redis
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # evicted between the two calls
+        cache.set(key, delta, timeout=None)
+
+
+def get_or_build(kind, object_id, build):
+    cache = get_cache()
+    key = f'{kind}:{object_id}:{current_version(kind, object_id)}'
+    payload = cache.get(key)
+    if payload is None:
+        count('misses')
+        payload = build()
+        cache.set(key, payload)
+    else:
+        count('hits')
+    return payload
+
+
+def invalidate(kind, object_ids):
+    """Invalidate the payloads of the given objects once the current transaction commits."""
+    object_ids = list(object_ids)
+    if object_ids:
+        # after commit, so that a payload rebuilt meanwhile cannot hold the old rows
+        transaction.on_commit(partial(bump_versions, kind, object_ids))
+
+
+def bump_versions(kind, object_ids):
+    cache = get_cache()
+    for object_id in object_ids:
+        try:
+            cache.incr(version_key(kind, object_id))
+        except ValueError:
+            # no counter yet, so the next read starts a fresh version anyway
+            pass
+    count('invalidations', len(object_ids))
+
+
+def get_stats():
+    values = get_cache().get_many([f'stats:{stat}' for stat in STATS])
+    stats = {stat: values.get(f'stats:{stat}', 0) for stat in STATS}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else None
+    return stats
+
+
+def reset_stats():
+    get_cache().delete_many([f'stats:{stat}' for stat in STATS])
@@ -0,0 +1,110 @@
+"""
+Report the progress of a background task without a database write for every update.
+
+Frequent updates, such as one per line of command output, are coalesced in memory and written
+at most once per write interval. Only the changed fields are written, so the abort flag set by
+the API is never overwritten, and the flag itself is read at most once per check interval.
+Every write is also published to the channel group of the project, for its websocket clients.
+"""
+
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from .models import TaskProgress
+from .serializers import TaskProgressSerializer
+
+logger = logging.getLogger(__name__)
+
+WRITE_INTERVAL = 0.5  # seconds
+ABORT_CHECK_INTERVAL = 2  # seconds
+
+
+def progress_group(project_id):
+    return f'task-progress.{project_id}'
+
+
+def publish_progress(progress):
+    """Push a task progress row to the websocket clients following its project."""
+    layer = get_channel_layer()
+    if layer is None or progress.project_id is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(
+            progress_group(progress.project_id),
+            {'type': 'task.progress', 'tasks': [TaskProgressSerializer(progress).data]},
+        )
+    except Exception:
+        # a broken channel layer must not fail the task it reports on
+        logger.exception('Could not publish progress of task %s', progress.id)
+
+
+class ProgressReporter:
+    def __init__(
+        self, progress_id, write_interval=WRITE_INTERVAL, abort_check_interval=ABORT_CHECK_INTERVAL
+    ):
+        self.progress = TaskProgress.objects.get(id=progress_id)
+        self.write_interval = write_interval
+        self.abort_check_interval = abort_check_interval
+        self.pending = set()
+        self.last_write = float('-inf')
+        self.last_abort_check = time.monotonic()
+        self.aborted = self.progress.abort
+
+    @property
+    def percent_complete(self):
+        return self.progress.percent_complete
+
+    def set(self, message=None, percentage=None):
+        if message is not None and message[:255] != self.progress.message:
+            self.progress.message = message[:255]
+            self.pending.add('message')
+        if percentage is not None and percentage != self.progress.percent_complete:
+            self.progress.percent_complete = percentage
+            self.pending.add('percent_complete')
+
+    def update_message(self, message):
+        """Show a message, written with the next write due."""
+        self.set(message=message)
+        self.throttled_flush()
+
+    def update_percentage(self, percentage):
+        """Show a percentage, written with the next write due."""
+        self.set(percentage=percentage)
+        self.throttled_flush()
+
+    def report(self, message=None, percentage=None):
+        """Show the start of a stage, written right away with anything still pending."""
+        self.set(message, percentage)
+        self.flush()
+        self.check_abort()
+
+    def update_error(self, error):
+        self.progress.error = error[:255]
+        self.progress.abort = True
+        self.pending.update(['error', 'abort'])
+        self.flush()
+
+    def throttled_flush(self):
+        if time.monotonic() - self.last_write >= self.write_interval:
+            self.flush()
+        self.check_abort()
+
+    def flush(self):
+        if self.pending:
+            # modified is listed because conditional requests for task progress depend on it
+            self.progress.save(update_fields=[*self.pending, 'modified'])
+            self.pending.clear()
+            publish_progress(self.progress)
+            self.last_write = time.monotonic()
+
+    def check_abort(self):
+        now = time.monotonic()
+        if not self.aborted and now - self.last_abort_check >= self.abort_check_interval:
+            self.last_abort_check = now
+            self.aborted = TaskProgress.objects.filter(id=self.progress.id, abort=True).exists()
+        if self.aborted:
+            self.flush()
+            raise TaskProgress.TaskAbortedError()
@@ -1,31 +1,47 @@
 import base64
+from datetime import timedelta
+import hashlib
 import json
-import os
 from pathlib import Path
-from tempfile import TemporaryDirectory, gettempdir
-from typing import Dict, Type
+from tempfile import TemporaryDirectory
+import time
+from typing import Dict, List, Type
 
+from django.conf import settings
 from django.contrib.auth import logout
 from django.core.files.base import ContentFile
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Aggregate, Count, Func, IntegerField, Max, OuterRef, Q, Subquery
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import mixins, status
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.permissions import IsAdminUser, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework.serializers import BaseSerializer
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 
-from . import filters, models, serializers
+from . import audit, filters, models, payload_cache, serializers, signing
 from .deepssm_tasks import deepssm_run
-from .tasks import analyze, groom, optimize
-
-DB_WRITE_ACCESS_LOG_FILE = Path(gettempdir(), 'logging', 'db_write_access.log')
-if not os.path.exists(DB_WRITE_ACCESS_LOG_FILE.parent):
-    os.mkdir(DB_WRITE_ACCESS_LOG_FILE.parent)
+from .progress import publish_progress
+from .tasks import (
+    analyze,
+    build_dataset_snapshot,
+    create_subset,
+    groom,
+    optimize,
+    store_manifest_checksums,
+)
+from .zip_stream import storage_layout, stream_zip
+
+# larger subset selections are copied in a background task
+SUBSET_TASK_THRESHOLD = 500
+# snapshots still unbuilt after this long are assumed lost and queued again
+SNAPSHOT_BUILD_TIMEOUT = timedelta(hours=1)
 
 
 class LogoutView(APIView):
@@ -35,10 +51,21 @@ class LogoutView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-def log_write_access(*args):
-    with open(DB_WRITE_ACCESS_LOG_FILE, 'a') as log_file:
-        log_file.write('\t'.join(str(a) for a in args))
-        log_file.write('\n\n')
+class PayloadCacheStatsView(APIView):
+    """Hit and miss counts of the payload cache, for tuning its size and timeout."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(payload_cache.get_stats())
+
+    def delete(self, request):
+        payload_cache.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def log_write_access(timestamp, username, action, *details):
+    audit.sink.record(timestamp, username, action, *details)
 
 
 def save_thumbnail_image(target, encoded_thumbnail):
@@ -50,13 +77,203 @@ def save_thumbnail_image(target, encoded_thumbnail):
             target.thumbnail.save('thumbnail.png', open(target_path, 'rb'))
 
 
+def parse_range(header, size):
+    """
+    Parse a single byte range from a Range header into an inclusive (start, end) pair.
+
+    Returns None when the whole content should be sent, which is also the case for
+    headers that are malformed or ask for several ranges, and False when the range
+    cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes=') :].strip().partition('-')
+    if not (first or last) or not (first or '0').isdigit() or not (last or '0').isdigit():
+        return None
+    if not first:
+        # a suffix range, the last n bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def count_subquery(queryset):
+    """Count the rows of a queryset correlated with OuterRef, without joining them in."""
+    # COUNT through Func is not seen as an aggregate, so no GROUP BY is added
+    return Subquery(
+        queryset.order_by().annotate(count=Func('id', function='COUNT')).values('count'),
+        output_field=IntegerField(),
+    )
+
+
 class Pagination(PageNumberPagination):
     page_size = 100
     max_page_size = 200
     page_size_query_param = 'page_size'
 
 
+class KeysetPagination(CursorPagination):
+    """Page through the rows in the order of the view's queryset, with the id breaking ties."""
+
+    page_size = 100
+    max_page_size = 5000
+    page_size_query_param = 'page_size'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = []
+        for name in queryset.query.order_by or queryset.model._meta.ordering:
+            descending = name.startswith('-')
+            field = queryset.model._meta.get_field(name.lstrip('-'))
+            # the cursor holds the position as a string, so relations are ordered by their id
+            ordering.append(('-' if descending else '') + field.attname)
+        if not {'id', '-id'} & set(ordering):
+            ordering.append('id')
+        return tuple(ordering)
+
+
+class CursorPaginationMixin:
+    """Use keyset pagination instead of the default when `?pagination=cursor` is requested."""
+
+    @property
+    def paginator(self):
+        if (
+            self.pagination_class is not None
+            and self.request is not None
+            and self.request.query_params.get('pagination') == 'cursor'
+        ):
+            if not isinstance(getattr(self, '_paginator', None), KeysetPagination):
+                self._paginator = KeysetPagination()
+            return self._paginator
+        return super().paginator
+
+
+def split_query_param(value):
+    return [name for name in (value or '').split(',') if name]
+
+
+class SparseFieldsMixin:
+    """
+    Apply the `fields` and `omit` query parameters to read responses.
+
+    Fields dropped here are never serialized, so their file URLs are not signed, and nested
+    payloads such as the project of DeepSSM rows can be left out with `omit`.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if self.request is not None and self.request.method == 'GET':
+            self.apply_field_selection(getattr(serializer, 'child', serializer))
+        return serializer
+
+    def apply_field_selection(self, serializer):
+        params = self.request.query_params
+        fields = split_query_param(params.get('fields'))
+        omit = split_query_param(params.get('omit'))
+        for name in list(serializer.fields):
+            if (fields and name not in fields) or name in omit:
+                serializer.fields.pop(name)
+
+
+class ConditionalGetMixin:
+    """
+    Answer list and retrieve requests with 304 Not Modified when If-None-Match still matches.
+
+    The ETag is built from the ids and latest `modified` time of the returned rows,
+    the aggregates in `etag_fields` and the count and latest `modified` time of each
+    relation in `etag_related`, which together track everything the serializer nests.
+    Lists only aggregate over the rows of the requested page, and add its count and links.
+    Signed file URLs expire, so the ETag also changes every half URL lifetime.
+    """
+
+    etag_fields: Dict[str, Aggregate] = {}
+    etag_related: List[str] = []
+    # set when get_etag_queryset leaves out the joins and prefetches the serializer needs,
+    # so that the rows of a changed page are fetched again from get_queryset
+    refetch_page = False
+
+    def get_etag(self, queryset, extra=None):
+        if not any(field.name == 'modified' for field in queryset.model._meta.get_fields()):
+            return None
+        queryset = queryset.order_by()
+        values = queryset.aggregate(
+            count=Count('pk', distinct=True), modified=Max('modified'), **self.etag_fields
+        )
+        for name in self.etag_related:
+            # one query per relation, so their rows are never joined with each other
+            values.update(
+                queryset.aggregate(
+                    **{
+                        f'{name}_count': Count(name, distinct=True),
+                        f'{name}_modified': Max(f'{name}__modified'),
+                    }
+                )
+            )
+        url_bucket = int(time.time()) // (getattr(settings, 'AWS_QUERYSTRING_EXPIRE', 3600) // 2)
+        key = [self.request.get_full_path(), self.request.user.pk, url_bucket, extra]
+        key += sorted((name, str(value)) for name, value in values.items())
+        return quote_etag(hashlib.md5(json.dumps(key).encode()).hexdigest())
+
+    def conditional_response(self, request, etag, respond):
+        response = get_conditional_response(request, etag=etag) if etag else None
+        if response is None:
+            response = respond()
+        if etag and response.status_code in [status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED]:
+            response['ETag'] = etag
+            # responses differ per user, and must be revalidated before reuse
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get_etag_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_etag_queryset())
+        if page is None:
+            return self.conditional_response(
+                request,
+                self.get_etag(self.get_etag_queryset()),
+                lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+            )
+        ids = [row.pk for row in page]
+        envelope = self.get_paginated_response([]).data
+        return self.conditional_response(
+            request,
+            self.get_etag(self.get_etag_queryset().filter(pk__in=ids), [ids, envelope]),
+            lambda: self.get_paginated_response(
+                self.get_serializer(self.get_page_rows(page), many=True).data
+            ),
+        )
+
+    def get_page_rows(self, page):
+        if not self.refetch_page:
+            return page
+        positions = {row.pk: position for position, row in enumerate(page)}
+        rows = self.filter_queryset(self.get_queryset()).filter(pk__in=positions)
+        return sorted(rows, key=lambda row: positions[row.pk])
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.get_etag_queryset().filter(
+                **{self.lookup_field: int(self.kwargs[lookup_url_kwarg])}
+            )
+        except ValueError:
+            # not a valid id; the default retrieve answers 404
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            request,
+            self.get_etag(queryset),
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs),
+        )
+
+
 class BaseViewSet(
+    SparseFieldsMixin,
+    ConditionalGetMixin,
+    CursorPaginationMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
@@ -76,17 +293,64 @@ class BaseViewSet(
         return self.serializer_class_dict.get(self.action, self.serializer_class)
 
 
+class BulkCreateMixin:
+    @action(
+        detail=False,
+        url_path='bulk',
+        url_name='bulk',
+        methods=['POST'],
+    )
+    def bulk(self, request, **kwargs):
+        if not isinstance(request.data, list):
+            return Response('Expected a list of objects.', status=status.HTTP_400_BAD_REQUEST)
+        serializer = serializers.BulkCreateListSerializer(
+            child=self.get_serializer_class()(),
+            data=request.data,
+            context=self.get_serializer_context(),
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
 class DatasetViewSet(BaseViewSet):
     serializer_class = serializers.DatasetSerializer
     filterset_class = filters.DatasetFilter
+    # the summary counts follow contents_version
+    etag_fields = {'contents_version': Max('contents_version')}
+    etag_related = ['projects']
+    refetch_page = True
 
-    def get_queryset(self):
+    def get_visible_queryset(self):
         user = self.request.user
         if user.is_anonymous:
             return models.Dataset.objects.none()
+        queryset = models.Dataset.objects.all()
         if user.is_staff:
-            return models.Dataset.objects.all()
-        return models.Dataset.objects.filter(Q(private=False) | Q(creator=user)).order_by('name')
+            return queryset
+        return queryset.filter(Q(private=False) | Q(creator=user)).order_by('name')
+
+    def get_queryset(self):
+        queryset = self.get_visible_queryset()
+        if self.action in ['list', 'retrieve']:
+            queryset = (
+                queryset.select_related('creator')
+                .prefetch_related('projects')
+                .annotate(
+                    # one subquery per relation, since joining both multiplies their rows
+                    meshes_count=count_subquery(
+                        models.Mesh.objects.filter(subject__dataset=OuterRef('pk'))
+                    ),
+                    segmentations_count=count_subquery(
+                        models.Segmentation.objects.filter(subject__dataset=OuterRef('pk'))
+                    ),
+                )
+            )
+        return queryset
+
+    def get_etag_queryset(self):
+        # the visible rows without the joins of get_queryset
+        return self.filter_queryset(self.get_visible_queryset())
 
     def perform_create(self, serializer):
         user = None
@@ -119,6 +383,36 @@ class DatasetViewSet(BaseViewSet):
         )
         return Response(serializers.DatasetSerializer(dataset).data)
 
+    def unknown_subset_shapes(self, dataset, selected):
+        """Return the selected shapes that are not meshes or segmentations of the dataset."""
+        shape_models = {'mesh': models.Mesh, 'segmentation': models.Segmentation}
+        requested = {shape_type: [] for shape_type in shape_models}
+        unknown = []
+        for datum in selected:
+            if (
+                not isinstance(datum, dict)
+                or datum.get('type') not in shape_models
+                or not isinstance(datum.get('id'), int)
+            ):
+                unknown.append(datum)
+            else:
+                requested[datum['type']].append(datum)
+        for shape_type, data in requested.items():
+            if not data:
+                continue
+            subjects = dict(
+                shape_models[shape_type]
+                .objects.filter(id__in=[datum['id'] for datum in data], subject__dataset=dataset)
+                .values_list('id', 'subject_id')
+            )
+            unknown += [
+                datum
+                for datum in data
+                if datum['id'] not in subjects
+                or datum.get('subject', subjects[datum['id']]) != subjects[datum['id']]
+            ]
+        return unknown
+
     @action(
         detail=True,
         url_path='subset',
@@ -130,12 +424,16 @@ class DatasetViewSet(BaseViewSet):
         form_data = request.data
         selected = form_data.get('selected')
         name = form_data.get('name') or dataset.name + '_subset'
-        if len(selected) < 1:
+        if not isinstance(selected, list) or len(selected) < 1:
             return Response(
                 'Cannot make dataset from empty subset.', status=status.HTTP_400_BAD_REQUEST
             )
         if models.Dataset.objects.filter(name=name).count() > 0:
             return Response(f'Dataset {name} already exists.', status=status.HTTP_400_BAD_REQUEST)
+        # checked before anything is created, since the copy may run in a task
+        unknown = self.unknown_subset_shapes(dataset, selected)
+        if unknown:
+            return Response({'unknown_shapes': unknown[:100]}, status=status.HTTP_400_BAD_REQUEST)
         new_dataset = models.Dataset.objects.create(
             name=name,
             description=form_data.get('description') or dataset.description,
@@ -146,65 +444,86 @@ class DatasetViewSet(BaseViewSet):
             contributors=dataset.contributors,
             publications=dataset.publications,
         )
-        for datum in selected:
-            target_subject = models.Subject.objects.get(id=datum['subject'])
-            new_subject = models.Subject.objects.create(
-                name=target_subject.name, dataset=new_dataset
-            )
-            if datum['type'] == 'mesh':
-                target_object = models.Mesh.objects.get(id=datum['id'])
-            elif datum['type'] == 'segmentation':
-                target_object = models.Segmentation.objects.get(id=datum['id'])
-            # clone object with new subject
-            target_object.id = None
-            target_object.subject = new_subject
-            target_object.save()
+        if len(selected) <= SUBSET_TASK_THRESHOLD:
+            create_subset(dataset.id, new_dataset.id, selected)
+            subset_task = None
+        else:
+            subset_task = models.TaskProgress.objects.create(name='subset')
+            create_subset.delay(dataset.id, new_dataset.id, selected, subset_task.id)
         log_write_access(
             timezone.now(),
             self.request.user.username,
             'Create Dataset Subset',
             form_data,
         )
-        return Response(serializers.DatasetSerializer(new_dataset).data)
+        if subset_task is None:
+            return Response(serializers.DatasetSerializer(new_dataset).data)
+        data = serializers.DatasetSerializer(new_dataset).data
+        data['subset_task'] = serializers.TaskProgressSerializer(subset_task).data
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+    @action(
+        detail=True,
+        url_path='download',
+        url_name='download',
+        methods=['GET'],
+    )
+    def download(self, request, **kwargs):
+        dataset = self.get_object()
+        snapshot, created = models.DatasetSnapshot.objects.get_or_create(
+            dataset=dataset, version=dataset.contents_version
+        )
+        if not snapshot.file and (
+            created or snapshot.modified < timezone.now() - SNAPSHOT_BUILD_TIMEOUT
+        ):
+            if not created:
+                snapshot.save()
+            build_dataset_snapshot.delay(snapshot.id)
+        return Response(
+            serializers.DatasetSnapshotSerializer(snapshot).data,
+            status=status.HTTP_200_OK if snapshot.file else status.HTTP_202_ACCEPTED,
+        )
 
 
-class SubjectViewSet(BaseViewSet):
+class SubjectViewSet(BulkCreateMixin, BaseViewSet):
     queryset = models.Subject.objects.all().order_by('name')
     serializer_class = serializers.SubjectSerializer
     filterset_class = filters.SubjectFilter
+    # num_domains is recounted in bulk whenever contents_version is bumped
+    etag_fields = {'contents_version': Max('dataset__contents_version')}
 
 
-class SegmentationViewSet(BaseViewSet):
+class SegmentationViewSet(BulkCreateMixin, BaseViewSet):
     queryset = models.Segmentation.objects.all().order_by('subject')
     serializer_class = serializers.SegmentationSerializer
     filterset_class = filters.SegmentationFilter
 
 
-class MeshViewSet(BaseViewSet):
+class MeshViewSet(BulkCreateMixin, BaseViewSet):
     queryset = models.Mesh.objects.all().order_by('subject')
     serializer_class = serializers.MeshSerializer
     filterset_class = filters.MeshFilter
 
 
-class ContourViewSet(BaseViewSet):
+class ContourViewSet(BulkCreateMixin, BaseViewSet):
     queryset = models.Contour.objects.all().order_by('subject')
     serializer_class = serializers.ContourSerializer
     filterset_class = filters.ContourFilter
 
 
-class ImageViewSet(BaseViewSet):
+class ImageViewSet(BulkCreateMixin, BaseViewSet):
     queryset = models.Image.objects.all().order_by('subject')
     serializer_class = serializers.ImageSerializer
     filterset_class = filters.ImageFilter
 
 
-class LandmarksViewSet(BaseViewSet):
+class LandmarksViewSet(BulkCreateMixin, BaseViewSet):
     queryset = models.Landmarks.objects.all().order_by('subject')
     serializer_class = serializers.LandmarksSerializer
     filterset_class = filters.LandmarksFilter
 
 
-class ConstraintsViewSet(BaseViewSet):
+class ConstraintsViewSet(BulkCreateMixin, BaseViewSet):
     queryset = models.Constraints.objects.all().order_by('subject')
     serializer_class = serializers.ConstraintsSerializer
     filterset_class = filters.ConstraintsFilter
@@ -212,14 +531,36 @@ class ConstraintsViewSet(BaseViewSet):
 
 class ProjectViewSet(BaseViewSet):
     filterset_class = filters.ProjectFilter
+    etag_fields = {'contents_version': Max('dataset__contents_version')}
+    etag_related = ['landmarks', 'constraints', 'last_cached_analysis']
+    refetch_page = True
+
+    def get_visible_queryset(self):
+        queryset = models.Project.visible_to(self.request.user)
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.order_by('name')
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_anonymous:
-            return models.Project.objects.none()
-        if user.is_staff:
-            return models.Project.objects.all()
-        return models.Project.objects.filter(Q(private=False) | Q(creator=user)).order_by('name')
+        queryset = self.get_visible_queryset()
+        if self.action == 'list':
+            # ProjectReadSerializer nests the whole analysis tree, landmarks and constraints.
+            # A single project is served from the payload cache, which prefetches on a miss.
+            queryset = (
+                queryset.select_related('last_cached_analysis')
+                .prefetch_related(
+                    'last_cached_analysis__modes__pca_values',
+                    'last_cached_analysis__groups',
+                    'last_cached_analysis__mean_shapes',
+                    'landmarks',
+                    'constraints',
+                )
+                .annotate(max_num_domains=Max('dataset__subjects__num_domains'))
+            )
+        return queryset
+
+    def get_etag_queryset(self):
+        return self.filter_queryset(self.get_visible_queryset())
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -260,26 +601,13 @@ class ProjectViewSet(BaseViewSet):
         methods=['POST'],
     )
     def clone(self, request, **kwargs):
-        project = self.get_object()
-        related_models = [
-            models.GroomedMesh,
-            models.GroomedSegmentation,
-            models.OptimizedParticles,
-            models.Landmarks,
-            models.ReconstructedSample,
-        ]
-        project.id = None
-        project.readonly = False
-        project.private = True
-        project.creator = request.user
-        project.name += ' (clone)'
-        project.save()
-        # project has new id now, is the cloned object
-        for related_model in related_models:
-            for related_object in related_model.objects.filter(project=project):
-                related_object.id = None  # type: ignore
-                related_object.project = project  # type: ignore
-                related_object.save()
+        source = self.get_object()
+        project = source.clone(
+            readonly=False,
+            private=True,
+            creator=request.user,
+            name=source.name + ' (clone)',
+        )
         return Response(
             serializers.ProjectReadSerializer(project).data, status=status.HTTP_201_CREATED
         )
@@ -320,21 +648,165 @@ class ProjectViewSet(BaseViewSet):
 
     @action(
         detail=True,
-        url_path='landmarks',
-        url_name='landmarks',
+        url_path='bundle',
+        url_name='bundle',
+        methods=['GET'],
+    )
+    def bundle(self, request, **kwargs):
+        project = self.get_object()
+        return Response(project.get_bundle())
+
+    @action(
+        detail=True,
+        url_path=r'export\.zip',
+        url_name='export',
+        methods=['GET'],
+    )
+    def export(self, request, **kwargs):
+        project = self.get_object()
+        if project.manifest_stale:
+            project.refresh_manifest()
+        files = {project.file.name.split('/')[-1]: project.file}
+        checksums = {}
+        missing_checksums = False
+        for entry in project.manifest_entries.all():
+            files[entry.path.lstrip('/')] = entry.file
+            if entry.crc is not None:
+                checksums[entry.path.lstrip('/')] = (entry.size, entry.crc)
+            else:
+                missing_checksums = True
+        if missing_checksums:
+            # read in the background; the layout does not depend on the CRCs, so a resumed
+            # download can use them as soon as they are stored
+            store_manifest_checksums.delay(project.id)
+        layout = storage_layout(files, checksums)
+
+        byte_range = parse_range(request.headers.get('Range'), layout.size)
+        if byte_range is False:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{layout.size}'
+            return response
+        start, end = byte_range or (0, layout.size - 1)
+        response = StreamingHttpResponse(
+            stream_zip(layout, start, end),
+            status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+            content_type='application/zip',
+        )
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{layout.size}'
+        response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+        response['Content-Disposition'] = f'attachment; filename="{project.name}.zip"'
+        return response
+
+    @action(
+        detail=True,
+        url_path='sign',
+        url_name='sign',
         methods=['POST'],
     )
-    def set_landmarks(self, request, **kwargs):
-        if not self.edit_allowed(request, **kwargs):
+    def sign(self, request, **kwargs):
+        """Sign URLs for a list of storage keys, limited to the files of the project."""
+        project = self.get_object()
+        keys = request.data.get('keys')
+        if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+            return Response('Expected a list of keys.', status=status.HTTP_400_BAD_REQUEST)
+        if project.manifest_stale:
+            project.refresh_manifest()
+        allowed = {project.file.name} | set(project.manifest_entries.values_list('file', flat=True))
+        unknown = sorted(set(keys) - allowed)
+        if unknown:
+            return Response({'unknown_keys': unknown[:100]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'urls': signing.sign_names(keys)})
+
+    def check_annotation_changes(self, project, changes):
+        """Return a 400 response if changes are not locations keyed by subjects of the project."""
+        if not isinstance(changes, dict) or not all(
+            isinstance(data, dict) for data in changes.values()
+        ):
             return Response(
-                'Project is read only.',
-                status=status.HTTP_403_FORBIDDEN,
+                'Expected locations keyed by subject id and anatomy type.',
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        project = self.get_object()
-        form_data = request.data
-        landmarks_info = form_data.get('info')
-        landmarks_locations = form_data.get('locations')
+        subject_ids = {}
+        unknown = []
+        for key in changes:
+            try:
+                subject_ids[key] = int(key)
+            except ValueError:
+                unknown.append(key)
+        in_dataset = set(
+            models.Subject.objects.filter(
+                dataset=project.dataset_id, id__in=subject_ids.values()
+            ).values_list('id', flat=True)
+        )
+        unknown += [key for key, subject_id in subject_ids.items() if subject_id not in in_dataset]
+        if unknown:
+            return Response({'unknown_subjects': unknown[:100]}, status=status.HTTP_400_BAD_REQUEST)
+        return None
+
+    def write_annotations(self, project, annotation_model, changes, partial):
+        """
+        Store the locations of each (subject, anatomy type) pair in changes.
+
+        A partial update leaves rows outside of changes untouched and deletes the pairs whose
+        locations are null, while a full update deletes every row outside of changes. The
+        subject ids must have passed check_annotation_changes.
+        """
+        changes = {int(subject_id): data for subject_id, data in changes.items()}
+        subject_ids = set(changes)
+        existing = {
+            (annotation.subject_id, annotation.anatomy_type): annotation
+            for annotation in annotation_model.objects.filter(
+                project=project, subject__in=subject_ids
+            )
+        }
 
+        now = timezone.now()
+        created, updated, deleted_ids = [], [], []
+        for subject_id, data in changes.items():
+            for anatomy_type, locations in data.items():
+                annotation = existing.get((subject_id, anatomy_type))
+                if partial and locations is None:
+                    if annotation:
+                        deleted_ids.append(annotation.id)
+                    continue
+                if annotation is None:
+                    annotation = annotation_model(
+                        project=project,
+                        subject_id=subject_id,
+                        anatomy_type=anatomy_type,
+                    )
+                    created.append(annotation)
+                else:
+                    annotation.modified = now
+                    updated.append(annotation)
+                annotation.locations = annotation_model.normalize_locations(locations)
+                # written again from the new locations when a task or download needs it
+                annotation.file = None
+
+        with transaction.atomic():
+            annotation_model.objects.filter(id__in=deleted_ids).delete()
+            annotation_model.objects.bulk_update(updated, ['locations', 'file', 'modified'])
+            annotation_model.objects.bulk_create(created)
+            if not partial:
+                annotation_model.objects.filter(project=project).exclude(
+                    id__in=[annotation.id for annotation in created + updated]
+                ).delete()
+            # bulk writes send no signals; the manifest is rebuilt on the next download
+            models.Project.objects.filter(id=project.id).update(manifest_stale=True)
+            models.Dataset.bump_contents_version(id=project.dataset_id)
+            payload_cache.invalidate('project', [project.id])
+
+    def read_annotations(self, project, annotation_model):
+        """Map each subject id and anatomy type of the project to its annotation locations."""
+        ret: Dict[int, Dict] = {}
+        for annotation in annotation_model.objects.filter(project=project).order_by('id'):
+            subject = ret.setdefault(annotation.subject_id, {})
+            subject[annotation.anatomy_type] = annotation.get_locations()
+        return ret
+
+    def write_landmarks_info(self, project, landmarks_info):
         project.landmarks_info = landmarks_info
         project_file_contents = json.loads(project.file.read())
         project_file_contents['landmarks'] = landmarks_info
@@ -344,41 +816,50 @@ class ProjectViewSet(BaseViewSet):
         )
         project.save()
 
-        ids_existing_with_coords = []
-        for subject_id, data in landmarks_locations.items():
-            target_subject = models.Subject.objects.get(id=subject_id)
-            for anatomy_type, locations in data.items():
-                landmarks_object, created = models.Landmarks.objects.get_or_create(
-                    project=project, subject=target_subject, anatomy_type=anatomy_type
-                )
-                file_content = ''
-                if (
-                    locations is not None
-                    and len(locations) > 0
-                    and locations[0] is not None
-                    and len(locations[0]) == 3
-                ):
-                    file_content = '\n'.join(
-                        ' '.join(str(n) for n in (loc.values() if isinstance(loc, dict) else loc))
-                        for loc in locations
-                    )
-                file_name = 'landmarks.csv'
-                if landmarks_object.file:
-                    file_name = landmarks_object.file.name.split('/')[-1]
-                landmarks_object.file.save(
-                    file_name,
-                    ContentFile(file_content.encode()),
-                )
-                ids_existing_with_coords.append(landmarks_object.id)
+    @action(
+        detail=True,
+        url_path='landmarks',
+        url_name='landmarks',
+        methods=['POST'],
+    )
+    def set_landmarks(self, request, **kwargs):
+        return self.update_landmarks(request, partial=False, **kwargs)
+
+    @set_landmarks.mapping.patch
+    def patch_landmarks(self, request, **kwargs):
+        return self.update_landmarks(request, partial=True, **kwargs)
 
-        models.Landmarks.objects.filter(project=project).exclude(
-            id__in=ids_existing_with_coords
-        ).delete()
+    @set_landmarks.mapping.get
+    def get_landmarks(self, request, **kwargs):
+        return Response(self.read_annotations(self.get_object(), models.Landmarks))
+
+    def update_landmarks(self, request, partial, **kwargs):
+        if not self.edit_allowed(request, **kwargs):
+            return Response(
+                'Project is read only.',
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        project = self.get_object()
+        form_data = request.data
+        landmarks_locations = form_data.get('locations') or {}
+        error = self.check_annotation_changes(project, landmarks_locations)
+        if error:
+            return error
+
+        if not partial or 'info' in form_data:
+            self.write_landmarks_info(project, form_data.get('info'))
+
+        self.write_annotations(
+            project,
+            models.Landmarks,
+            landmarks_locations,
+            partial,
+        )
 
         log_write_access(
             timezone.now(),
             self.request.user.username,
-            'Set Project Landmarks',
+            'Update Project Landmarks' if partial else 'Set Project Landmarks',
             project.id,
         )
         return Response(serializers.ProjectReadSerializer(project).data)
@@ -390,6 +871,17 @@ class ProjectViewSet(BaseViewSet):
         methods=['POST'],
     )
     def set_constraints(self, request, **kwargs):
+        return self.update_constraints(request, partial=False, **kwargs)
+
+    @set_constraints.mapping.patch
+    def patch_constraints(self, request, **kwargs):
+        return self.update_constraints(request, partial=True, **kwargs)
+
+    @set_constraints.mapping.get
+    def get_constraints(self, request, **kwargs):
+        return Response(self.read_annotations(self.get_object(), models.Constraints))
+
+    def update_constraints(self, request, partial, **kwargs):
         if not self.edit_allowed(request, **kwargs):
             return Response(
                 'Project is read only.',
@@ -397,32 +889,22 @@ class ProjectViewSet(BaseViewSet):
             )
         project = self.get_object()
         form_data = request.data
-        constraints_locations = form_data.get('locations')
-
-        ids_existing_with_coords = []
-        for subject_id, data in constraints_locations.items():
-            target_subject = models.Subject.objects.get(id=subject_id)
-            for anatomy_type, locations in data.items():
-                constraints_object, created = models.Constraints.objects.get_or_create(
-                    project=project, subject=target_subject, anatomy_type=anatomy_type
-                )
-                file_name = 'constraints.json'
-                if constraints_object.file:
-                    file_name = constraints_object.file.name.split('/')[-1]
-                constraints_object.file.save(
-                    file_name,
-                    ContentFile(json.dumps(locations).encode()),
-                )
-                ids_existing_with_coords.append(constraints_object.id)
-
-        models.Constraints.objects.filter(project=project).exclude(
-            id__in=ids_existing_with_coords
-        ).delete()
+        constraints_locations = form_data.get('locations') or {}
+        error = self.check_annotation_changes(project, constraints_locations)
+        if error:
+            return error
+
+        self.write_annotations(
+            project,
+            models.Constraints,
+            constraints_locations,
+            partial,
+        )
 
         log_write_access(
             timezone.now(),
             self.request.user.username,
-            'Set Project Constraints',
+            'Update Project Constraints' if partial else 'Set Project Constraints',
             project.id,
         )
         return Response(serializers.ProjectReadSerializer(project).data)
@@ -596,26 +1078,33 @@ class ProjectViewSet(BaseViewSet):
         )
 
 
-class GroomedSegmentationViewSet(BaseViewSet):
-    queryset = models.GroomedSegmentation.objects.all()
+class GroomedSegmentationViewSet(BulkCreateMixin, BaseViewSet):
+    queryset = models.GroomedSegmentation.objects.select_related('segmentation').order_by('id')
     serializer_class = serializers.GroomedSegmentationSerializer
     filterset_class = filters.GroomedSegmentationFilter
 
 
-class GroomedMeshViewSet(BaseViewSet):
-    queryset = models.GroomedMesh.objects.all()
+class GroomedMeshViewSet(BulkCreateMixin, BaseViewSet):
+    queryset = models.GroomedMesh.objects.select_related('mesh').order_by('id')
     serializer_class = serializers.GroomedMeshSerializer
     filterset_class = filters.GroomedMeshFilter
 
 
-class OptimizedParticlesViewSet(BaseViewSet):
-    queryset = models.OptimizedParticles.objects.all()
+class OptimizedParticlesViewSet(BulkCreateMixin, BaseViewSet):
+    # the serializer only reads foreign key ids, so no related rows are needed
+    queryset = models.OptimizedParticles.objects.all().order_by('id')
     serializer_class = serializers.OptimizedParticlesSerializer
     filterset_class = filters.OptimizedParticlesFilter
 
 
 class CachedAnalysisViewSet(BaseViewSet):
-    queryset = models.CachedAnalysis.objects.all()
+    queryset = models.CachedAnalysis.objects.order_by('id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.prefetch_related('modes__pca_values', 'groups', 'mean_shapes')
+        return queryset
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -625,7 +1114,7 @@ class CachedAnalysisViewSet(BaseViewSet):
 
 
 class CachedAnalysisModeViewSet(BaseViewSet):
-    queryset = models.CachedAnalysisMode.objects.all()
+    queryset = models.CachedAnalysisMode.objects.prefetch_related('pca_values').order_by('id')
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -651,7 +1140,7 @@ class CachedAnalysisMeanShapeViewSet(BaseViewSet):
 
 
 class DeepSSMTestingDataViewSet(BaseViewSet):
-    queryset = models.DeepSSMTestingData.objects.all()
+    queryset = models.DeepSSMTestingData.objects.select_related('project')
     filterset_class = filters.DeepSSMTestingDataFilter
 
     def get_serializer_class(self):
@@ -662,7 +1151,7 @@ class DeepSSMTestingDataViewSet(BaseViewSet):
 
 
 class DeepSSMTrainingPairViewSet(BaseViewSet):
-    queryset = models.DeepSSMTrainingPair.objects.all()
+    queryset = models.DeepSSMTrainingPair.objects.select_related('project')
     filterset_class = filters.DeepSSMTrainingPairFilter
 
     def get_serializer_class(self):
@@ -673,7 +1162,7 @@ class DeepSSMTrainingPairViewSet(BaseViewSet):
 
 
 class DeepSSMTrainingImageViewSet(BaseViewSet):
-    queryset = models.DeepSSMTrainingImage.objects.all()
+    queryset = models.DeepSSMTrainingImage.objects.select_related('project')
     filterset_class = filters.DeepSSMTrainingImageFilter
 
     def get_serializer_class(self):
@@ -684,7 +1173,7 @@ class DeepSSMTrainingImageViewSet(BaseViewSet):
 
 
 class DeepSSMAugPairViewSet(BaseViewSet):
-    queryset = models.DeepSSMAugPair.objects.all()
+    queryset = models.DeepSSMAugPair.objects.select_related('project')
     filterset_class = filters.DeepSSMAugPairFilter
 
     def get_serializer_class(self):
@@ -695,7 +1184,7 @@ class DeepSSMAugPairViewSet(BaseViewSet):
 
 
 class DeepSSMResultViewSet(BaseViewSet):
-    queryset = models.DeepSSMResult.objects.all()
+    queryset = models.DeepSSMResult.objects.select_related('project')
     filterset_class = filters.DeepSSMResultFilter
 
     def get_serializer_class(self):
@@ -706,16 +1195,30 @@ class DeepSSMResultViewSet(BaseViewSet):
 
 
 class ReconstructedSampleViewSet(
+    SparseFieldsMixin,
+    ConditionalGetMixin,
+    CursorPaginationMixin,
     GenericViewSet,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
 ):
-    queryset = models.ReconstructedSample.objects.all()
+    queryset = models.ReconstructedSample.objects.select_related(
+        'particles__groomed_mesh__mesh',
+        'particles__groomed_segmentation__segmentation',
+    ).order_by('id')
     serializer_class = serializers.ReconstructedSampleSerializer
     filterset_class = filters.ReconstructedSampleFilter
+    etag_related = [
+        'particles',
+        'particles__groomed_mesh',
+        'particles__groomed_segmentation',
+    ]
 
 
 class TaskProgressViewSet(
+    SparseFieldsMixin,
+    ConditionalGetMixin,
+    CursorPaginationMixin,
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
     mixins.DestroyModelMixin,
@@ -736,7 +1239,8 @@ class TaskProgressViewSet(
         progress = self.get_object()
         for task in models.TaskProgress.objects.filter(project=progress.project):
             task.abort = True
-            task.save(update_fields=['abort'])
+            task.save(update_fields=['abort', 'modified'])
+            publish_progress(task)
         log_write_access(
             timezone.now(),
             self.request.user.username,
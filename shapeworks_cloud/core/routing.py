@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    path(
+        'ws/projects/<int:project_id>/task-progress/',
+        consumers.TaskProgressConsumer.as_asgi(),
+    ),
+]
@@ -1,11 +1,121 @@
+from typing import Dict, List
+
+from django.db import router, transaction
+from django.db.models import Q, UniqueConstraint, prefetch_related_objects
+from django.db.models.signals import pre_save
 from rest_framework import serializers
 from s3_file_field.rest_framework import S3FileSerializerField
 
-from shapeworks_cloud.core import models
+from shapeworks_cloud.core import models, payload_cache, signing
+from shapeworks_cloud.core.signals import post_bulk_create
+
+# query parameters that change which fields a response holds
+FIELD_SELECTION_PARAMS = ['fields', 'omit']
+
+
+class BulkCreateListSerializer(serializers.ListSerializer):
+    """Create every validated item with a single bulk_create."""
+
+    def validate(self, attrs):
+        # the items are checked against each other and the stored rows here, since a
+        # duplicate would otherwise fail the whole bulk_create
+        model = self.child.Meta.model
+        errors = []
+        for constraint in model._meta.constraints:
+            if not isinstance(constraint, UniqueConstraint) or constraint.condition:
+                continue
+            fields = constraint.fields
+            keys = [tuple(item.get(field) for field in fields) for item in attrs]
+            message = f'The fields {", ".join(fields)} must make a unique set.'
+            seen: Dict[tuple, int] = {}
+            for index, key in enumerate(keys):
+                if None in key:
+                    # nulls never conflict
+                    continue
+                if key in seen:
+                    errors.append(f'Item {index}: {message} It repeats item {seen[key]}.')
+                else:
+                    seen[key] = index
+            if seen:
+                existing = Q()
+                for key in seen:
+                    existing |= Q(**dict(zip(fields, key)))
+                stored = set(model.objects.filter(existing).values_list(*fields))
+                for key, index in seen.items():
+                    stored_key = tuple(getattr(value, 'pk', value) for value in key)
+                    if stored_key in stored:
+                        errors.append(f'Item {index}: {message}')
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        instances = [model(**attrs) for attrs in validated_data]
+        using = router.db_for_write(model)
+        with transaction.atomic(using=using):
+            # bulk_create skips model signals, so send the ones our receivers rely on
+            for instance in instances:
+                pre_save.send(
+                    sender=model, instance=instance, raw=False, using=using, update_fields=None
+                )
+            instances = model.objects.bulk_create(instances)
+            post_bulk_create.send(sender=model, instances=instances)
+        return instances
+
+
+class SignedFileSerializerField(S3FileSerializerField):
+    """Represent files with URLs from the signing cache, or names while a payload is built."""
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        if self.context.get('unsigned_files'):
+            return signing.StoredName(value.name)
+        return signing.signed_url(value)
+
+
+class CachedPayloadMixin:
+    """
+    Serve the representation of an instance from the payload cache.
+
+    Signal receivers invalidate the payloads when the instance or anything it nests changes.
+    Requests that select fields bypass the cache. The relations in `payload_prefetch` are
+    prefetched before a payload is built, unless the queryset already prefetched them.
+    Payloads hold the names of their files, which are signed each time a payload is served,
+    so that a cached payload never hands out URLs close to expiry.
+    """
+
+    payload_kind: str
+    payload_prefetch: List[str] = []
+
+    def to_representation(self, instance):
+        request = self.context.get('request')
+        if request is not None and any(
+            name in request.query_params for name in FIELD_SELECTION_PARAMS
+        ):
+            return super().to_representation(instance)
+
+        def build():
+            if not getattr(instance, '_prefetched_objects_cache', None):
+                prefetch_related_objects([instance], *self.payload_prefetch)
+            # the context is shared by every nested serializer
+            unsigned_files = self.context.get('unsigned_files', False)
+            self.context['unsigned_files'] = True
+            try:
+                return super(CachedPayloadMixin, self).to_representation(instance)
+            finally:
+                self.context['unsigned_files'] = unsigned_files
+
+        payload = payload_cache.get_or_build(self.payload_kind, instance.pk, build)
+        if self.context.get('unsigned_files'):
+            # nested in a payload being built, which is signed as a whole
+            return payload
+        return signing.sign_files(payload)
 
 
 class LandmarksSerializer(serializers.ModelSerializer):
-    file = S3FileSerializerField(required=False)
+    file = SignedFileSerializerField(required=False, allow_null=True)
 
     class Meta:
         model = models.Landmarks
@@ -13,7 +123,7 @@ class LandmarksSerializer(serializers.ModelSerializer):
 
 
 class ConstraintsSerializer(serializers.ModelSerializer):
-    file = S3FileSerializerField()
+    file = SignedFileSerializerField(required=False, allow_null=True)
 
     class Meta:
         model = models.Constraints
@@ -21,18 +131,27 @@ class ConstraintsSerializer(serializers.ModelSerializer):
 
 
 class CachedAnalysisGroupSerializer(serializers.ModelSerializer):
+    file = SignedFileSerializerField()
+    particles = SignedFileSerializerField(required=False, allow_null=True)
+
     class Meta:
         model = models.CachedAnalysisGroup
         fields = '__all__'
 
 
 class CachedAnalysisMeanShapeSerializer(serializers.ModelSerializer):
+    file = SignedFileSerializerField()
+    particles = SignedFileSerializerField(required=False, allow_null=True)
+
     class Meta:
         model = models.CachedAnalysisMeanShape
         fields = '__all__'
 
 
 class CachedAnalysisModePCASerializer(serializers.ModelSerializer):
+    file = SignedFileSerializerField()
+    particles = SignedFileSerializerField(required=False, allow_null=True)
+
     class Meta:
         model = models.CachedAnalysisModePCA
         fields = '__all__'
@@ -51,19 +170,20 @@ class CachedAnalysisSerializer(serializers.ModelSerializer):
 
 
 class ProjectSerializer(serializers.ModelSerializer):
-    file = S3FileSerializerField(required=False)
+    file = SignedFileSerializerField(required=False)
 
     class Meta:
         model = models.Project
-        fields = '__all__'
+        # manifest_stale is server bookkeeping, flipped without touching modified
+        exclude = ['manifest_stale']
 
 
 class DeepSSMTestingDataSerializer(serializers.ModelSerializer):
     project = ProjectSerializer()
     image_type = serializers.CharField(max_length=255)
     image_id = serializers.IntegerField()
-    mesh = S3FileSerializerField()
-    particles = S3FileSerializerField()
+    mesh = SignedFileSerializerField()
+    particles = SignedFileSerializerField()
 
     class Meta:
         model = models.DeepSSMTestingData
@@ -74,9 +194,9 @@ class DeepSSMTrainingPairSerializer(serializers.ModelSerializer):
     project = ProjectSerializer()
     example_type = serializers.CharField(max_length=255)
     validation = serializers.BooleanField()
-    particles = S3FileSerializerField()
-    scalar = S3FileSerializerField()
-    mesh = S3FileSerializerField()
+    particles = SignedFileSerializerField()
+    scalar = SignedFileSerializerField()
+    mesh = SignedFileSerializerField()
     index = serializers.CharField(max_length=255)
 
     class Meta:
@@ -86,7 +206,7 @@ class DeepSSMTrainingPairSerializer(serializers.ModelSerializer):
 
 class DeepSSMTrainingImageSerializer(serializers.ModelSerializer):
     project = ProjectSerializer()
-    image = S3FileSerializerField()
+    image = SignedFileSerializerField()
     index = serializers.CharField(max_length=255)
     validation = serializers.BooleanField()
 
@@ -98,9 +218,9 @@ class DeepSSMTrainingImageSerializer(serializers.ModelSerializer):
 class DeepSSMAugPairSerializer(serializers.ModelSerializer):
     project = ProjectSerializer()
     sample_num = serializers.IntegerField()
-    mesh = S3FileSerializerField()
-    image = S3FileSerializerField()
-    particles = S3FileSerializerField()
+    mesh = SignedFileSerializerField()
+    image = SignedFileSerializerField()
+    particles = SignedFileSerializerField()
 
     class Meta:
         model = models.DeepSSMAugPair
@@ -109,12 +229,12 @@ class DeepSSMAugPairSerializer(serializers.ModelSerializer):
 
 class DeepSSMResultSerializer(serializers.ModelSerializer):
     project = ProjectSerializer()
-    aug_visualization = S3FileSerializerField()
-    aug_total_data = S3FileSerializerField()
-    training_visualization = S3FileSerializerField()
-    training_visualization_ft = S3FileSerializerField()
-    training_data_table = S3FileSerializerField()
-    testing_distances = S3FileSerializerField()
+    aug_visualization = SignedFileSerializerField()
+    aug_total_data = SignedFileSerializerField()
+    training_visualization = SignedFileSerializerField()
+    training_visualization_ft = SignedFileSerializerField()
+    training_data_table = SignedFileSerializerField()
+    testing_distances = SignedFileSerializerField()
 
     class Meta:
         model = models.DeepSSMResult
@@ -125,8 +245,8 @@ class DeepSSMTestingDataReadSerializer(serializers.ModelSerializer):
     project = ProjectSerializer()
     image_type = serializers.CharField(max_length=255)
     image_id = serializers.CharField(max_length=255)
-    mesh = S3FileSerializerField()
-    particles = S3FileSerializerField()
+    mesh = SignedFileSerializerField()
+    particles = SignedFileSerializerField()
 
     class Meta:
         model = models.DeepSSMTestingData
@@ -137,9 +257,9 @@ class DeepSSMTrainingPairReadSerializer(serializers.ModelSerializer):
     project = ProjectSerializer()
     example_type = serializers.CharField(max_length=255)
     validation = serializers.BooleanField()
-    particles = S3FileSerializerField()
-    scalar = S3FileSerializerField()
-    mesh = S3FileSerializerField()
+    particles = SignedFileSerializerField()
+    scalar = SignedFileSerializerField()
+    mesh = SignedFileSerializerField()
     index = serializers.CharField(max_length=255)
 
     class Meta:
@@ -149,7 +269,7 @@ class DeepSSMTrainingPairReadSerializer(serializers.ModelSerializer):
 
 class DeepSSMTrainingImageReadSerializer(serializers.ModelSerializer):
     project = ProjectSerializer()
-    image = S3FileSerializerField()
+    image = SignedFileSerializerField()
     index = serializers.CharField(max_length=255)
     validation = serializers.BooleanField()
 
@@ -160,9 +280,9 @@ class DeepSSMTrainingImageReadSerializer(serializers.ModelSerializer):
 
 class DeepSSMAugPairReadSerializer(serializers.ModelSerializer):
     project = ProjectSerializer()
-    mesh = S3FileSerializerField()
-    image = S3FileSerializerField()
-    particles = S3FileSerializerField()
+    mesh = SignedFileSerializerField()
+    image = SignedFileSerializerField()
+    particles = SignedFileSerializerField()
     sample_num = serializers.IntegerField()
 
     class Meta:
@@ -172,12 +292,12 @@ class DeepSSMAugPairReadSerializer(serializers.ModelSerializer):
 
 class DeepSSMResultReadSerializer(serializers.ModelSerializer):
     project = ProjectSerializer()
-    aug_visualization = S3FileSerializerField()
-    aug_total_data = S3FileSerializerField()
-    training_visualization = S3FileSerializerField()
-    training_visualization_ft = S3FileSerializerField()
-    training_data_table = S3FileSerializerField()
-    testing_distances = S3FileSerializerField()
+    aug_visualization = SignedFileSerializerField()
+    aug_total_data = SignedFileSerializerField()
+    training_visualization = SignedFileSerializerField()
+    training_visualization_ft = SignedFileSerializerField()
+    training_data_table = SignedFileSerializerField()
+    testing_distances = SignedFileSerializerField()
 
     class Meta:
         model = models.DeepSSMResult
@@ -192,25 +312,45 @@ class CachedAnalysisModeReadSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class CachedAnalysisReadSerializer(serializers.ModelSerializer):
+class CachedAnalysisReadSerializer(CachedPayloadMixin, serializers.ModelSerializer):
     modes = CachedAnalysisModeReadSerializer(many=True)
     groups = CachedAnalysisGroupSerializer(many=True)
     mean_shapes = CachedAnalysisMeanShapeSerializer(many=True)
 
+    payload_kind = 'analysis'
+    payload_prefetch = ['modes__pca_values', 'groups', 'mean_shapes']
+
     class Meta:
         model = models.CachedAnalysis
         fields = '__all__'
 
 
-class ProjectReadSerializer(serializers.ModelSerializer):
-    file = S3FileSerializerField()
+class ProjectReadSerializer(CachedPayloadMixin, serializers.ModelSerializer):
+    file = SignedFileSerializerField()
     last_cached_analysis = CachedAnalysisReadSerializer(allow_null=True)
     landmarks = LandmarksSerializer(many=True)
     constraints = ConstraintsSerializer(many=True)
+    max_num_domains = serializers.SerializerMethodField('get_max_num_domains')
+
+    payload_kind = 'project'
+    payload_prefetch = [
+        'last_cached_analysis__modes__pca_values',
+        'last_cached_analysis__groups',
+        'last_cached_analysis__mean_shapes',
+        'landmarks',
+        'constraints',
+    ]
+
+    def get_max_num_domains(self, obj):
+        # ProjectViewSet annotates this value; fall back to querying it
+        max_num_domains = getattr(obj, 'max_num_domains', None)
+        if max_num_domains is None:
+            return obj.get_max_num_domains()
+        return max_num_domains
 
     class Meta:
         model = models.Project
-        fields = '__all__'
+        exclude = ['manifest_stale']
 
 
 class ProjectDownloadSerializer(serializers.ModelSerializer):
@@ -236,10 +376,13 @@ class DatasetSerializer(serializers.ModelSerializer):
 
     def get_summary(self, obj):
         summary = ''
-        meshes = models.Mesh.objects.filter(subject__dataset=obj)
-        segmentations = models.Segmentation.objects.filter(subject__dataset=obj)
-        meshes_count = meshes.count()
-        segmentations_count = segmentations.count()
+        # DatasetViewSet annotates these counts; fall back to querying them
+        meshes_count = getattr(obj, 'meshes_count', None)
+        if meshes_count is None:
+            meshes_count = models.Mesh.objects.filter(subject__dataset=obj).count()
+        segmentations_count = getattr(obj, 'segmentations_count', None)
+        if segmentations_count is None:
+            segmentations_count = models.Segmentation.objects.filter(subject__dataset=obj).count()
         if meshes_count > 0:
             summary += f'{meshes_count} meshes'
         if meshes_count > 0 and segmentations_count > 0:
@@ -251,28 +394,26 @@ class DatasetSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Dataset
         fields = '__all__'
+        read_only_fields = ['contents_version']
 
 
-class SubjectSerializer(serializers.ModelSerializer):
-    num_domains = serializers.SerializerMethodField('get_num_domains')
+class DatasetSnapshotSerializer(serializers.ModelSerializer):
+    file = SignedFileSerializerField(read_only=True)
+
+    class Meta:
+        model = models.DatasetSnapshot
+        fields = ['id', 'dataset', 'version', 'file', 'created']
 
-    def get_num_domains(self, obj):
-        shapes = list(obj.segmentations.all()) + list(obj.meshes.all()) + list(obj.contours.all())
-        domains = []
-        for shape in shapes:
-            # get unique values for anatomy_type
-            domain = shape.anatomy_type
-            if domain not in domains:
-                domains.append(domain)
-        return len(domains)
 
+class SubjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Subject
         fields = '__all__'
+        read_only_fields = ['num_domains']
 
 
 class SegmentationSerializer(serializers.ModelSerializer):
-    file = S3FileSerializerField()
+    file = SignedFileSerializerField()
 
     class Meta:
         model = models.Segmentation
@@ -280,7 +421,7 @@ class SegmentationSerializer(serializers.ModelSerializer):
 
 
 class MeshSerializer(serializers.ModelSerializer):
-    file = S3FileSerializerField()
+    file = SignedFileSerializerField()
 
     class Meta:
         model = models.Mesh
@@ -288,7 +429,7 @@ class MeshSerializer(serializers.ModelSerializer):
 
 
 class ContourSerializer(serializers.ModelSerializer):
-    file = S3FileSerializerField()
+    file = SignedFileSerializerField()
 
     class Meta:
         model = models.Contour
@@ -296,7 +437,7 @@ class ContourSerializer(serializers.ModelSerializer):
 
 
 class ImageSerializer(serializers.ModelSerializer):
-    file = S3FileSerializerField()
+    file = SignedFileSerializerField()
 
     class Meta:
         model = models.Image
@@ -304,9 +445,9 @@ class ImageSerializer(serializers.ModelSerializer):
 
 
 class GroomedSegmentationSerializer(serializers.ModelSerializer):
-    file = S3FileSerializerField()
-    pre_cropping = S3FileSerializerField(required=False, allow_null=True)
-    pre_alignment = S3FileSerializerField(required=False, allow_null=True)
+    file = SignedFileSerializerField()
+    pre_cropping = SignedFileSerializerField(required=False, allow_null=True)
+    pre_alignment = SignedFileSerializerField(required=False, allow_null=True)
     anatomy_type = serializers.SerializerMethodField('get_anatomy_type')
 
     def get_anatomy_type(self, obj):
@@ -321,9 +462,9 @@ class GroomedSegmentationSerializer(serializers.ModelSerializer):
 
 
 class GroomedMeshSerializer(serializers.ModelSerializer):
-    file = S3FileSerializerField()
-    pre_cropping = S3FileSerializerField(required=False, allow_null=True)
-    pre_alignment = S3FileSerializerField(required=False, allow_null=True)
+    file = SignedFileSerializerField()
+    pre_cropping = SignedFileSerializerField(required=False, allow_null=True)
+    pre_alignment = SignedFileSerializerField(required=False, allow_null=True)
     anatomy_type = serializers.SerializerMethodField('get_anatomy_type')
 
     def get_anatomy_type(self, obj):
@@ -338,10 +479,10 @@ class GroomedMeshSerializer(serializers.ModelSerializer):
 
 
 class OptimizedParticlesSerializer(serializers.ModelSerializer):
-    world = S3FileSerializerField(required=False, allow_null=True)
-    local = S3FileSerializerField(required=False, allow_null=True)
-    transform = S3FileSerializerField(required=False, allow_null=True)
-    constraints = S3FileSerializerField(required=False, allow_null=True)
+    world = SignedFileSerializerField(required=False, allow_null=True)
+    local = SignedFileSerializerField(required=False, allow_null=True)
+    transform = SignedFileSerializerField(required=False, allow_null=True)
+    constraints = SignedFileSerializerField(required=False, allow_null=True)
 
     class Meta:
         model = models.OptimizedParticles
@@ -354,7 +495,7 @@ class OptimizedParticlesReadSerializer(OptimizedParticlesSerializer):
 
 
 class ReconstructedSampleSerializer(serializers.ModelSerializer):
-    file = S3FileSerializerField()
+    file = SignedFileSerializerField()
     particles = OptimizedParticlesReadSerializer(required=False)
     anatomy_type = serializers.SerializerMethodField('get_anatomy_type')
 
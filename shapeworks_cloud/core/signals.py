@@ -1,15 +1,31 @@
-from django.db.models.signals import pre_delete
-from django.dispatch import receiver
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
 
+from . import payload_cache
 from .models import (
     CachedAnalysis,
     CachedAnalysisGroup,
     CachedAnalysisMeanShape,
     CachedAnalysisMode,
     CachedAnalysisModePCA,
+    Constraints,
+    Contour,
+    Dataset,
+    GroomedMesh,
+    GroomedSegmentation,
+    Image,
+    Landmarks,
+    Mesh,
+    OptimizedParticles,
     Project,
+    Segmentation,
+    Subject,
+    post_instance_delete,
 )
 
+# sent with the saved instances after a bulk_create, which skips post_save
+post_bulk_create = Signal()
+
 
 @receiver(pre_delete, sender=Project)
 def delete_cached_analysis(sender, instance, using, **kwargs):
@@ -20,3 +36,146 @@ def delete_cached_analysis(sender, instance, using, **kwargs):
     CachedAnalysis.objects.filter(project=instance).delete()
     CachedAnalysisGroup.objects.filter(cachedanalysis__project=instance).delete()
     CachedAnalysisMeanShape.objects.filter(cachedanalysis__project=instance).delete()
+
+
+@receiver(pre_save, sender=Project)
+def invalidate_own_manifest(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or (
+        update_fields is not None and not {'file', 'manifest_stale'} & set(update_fields)
+    ):
+        # new projects start stale, and the file is not written
+        return
+    stored = Project.objects.filter(pk=instance.pk).values('file', 'manifest_stale').first()
+    if stored is None:
+        return
+    # keep a mark made since the instance was loaded, and add one if the file was replaced
+    file_replaced = stored['file'] != instance.file.name
+    instance.manifest_stale = stored['manifest_stale'] or file_replaced
+    if file_replaced and update_fields is not None and 'manifest_stale' not in update_fields:
+        Project.objects.filter(pk=instance.pk).update(manifest_stale=True)
+
+
+# rows derived by a single project
+PROJECT_OUTPUTS = [GroomedMesh, GroomedSegmentation, OptimizedParticles, Landmarks]
+# rows shared by every project of their dataset
+DATASET_CONTENTS = [Segmentation, Mesh, Contour, Image, Constraints]
+# rows whose anatomy types count towards Subject.num_domains
+SHAPES = [Segmentation, Mesh, Contour]
+# rows stored in the snapshots of their dataset
+SNAPSHOT_CONTENTS = [Segmentation, Mesh, Contour, Image, Landmarks, Constraints]
+# rows nested in the cached payload of their project
+ANNOTATIONS = [Landmarks, Constraints]
+
+
+def rows_changed(sender, instances):
+    """Invalidate everything derived from rows that were written or deleted, in one pass."""
+    if sender in PROJECT_OUTPUTS:
+        project_ids = {instance.project_id for instance in instances}
+        Project.objects.filter(id__in=project_ids).update(manifest_stale=True)
+    if sender in DATASET_CONTENTS:
+        subject_ids = {instance.subject_id for instance in instances}
+        Project.objects.filter(dataset__subjects__in=subject_ids).update(manifest_stale=True)
+    if sender in SHAPES:
+        Subject.refresh_num_domains({instance.subject_id for instance in instances})
+    if sender in SNAPSHOT_CONTENTS:
+        Dataset.bump_contents_version(subjects__in={instance.subject_id for instance in instances})
+    if sender in ANNOTATIONS:
+        payload_cache.invalidate(
+            'project', {instance.project_id for instance in instances} - {None}
+        )
+    if sender is Subject:
+        dataset_ids = {instance.dataset_id for instance in instances}
+        Project.objects.filter(dataset__in=dataset_ids).update(manifest_stale=True)
+        Dataset.bump_contents_version(id__in=dataset_ids)
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_save, sender=Segmentation)
+@receiver(post_save, sender=Mesh)
+@receiver(post_save, sender=Contour)
+@receiver(post_save, sender=Image)
+@receiver(post_save, sender=GroomedMesh)
+@receiver(post_save, sender=GroomedSegmentation)
+@receiver(post_save, sender=OptimizedParticles)
+@receiver(post_save, sender=Landmarks)
+@receiver(post_save, sender=Constraints)
+@receiver(post_instance_delete)
+def handle_row_change(sender, instance, **kwargs):
+    rows_changed(sender, [instance])
+
+
+@receiver(post_bulk_create)
+def handle_bulk_create(sender, instances, **kwargs):
+    rows_changed(sender, instances)
+
+
+@receiver(pre_save, sender=Segmentation)
+@receiver(pre_save, sender=Mesh)
+@receiver(pre_save, sender=GroomedSegmentation)
+@receiver(pre_save, sender=GroomedMesh)
+def set_file_basename(sender, instance, **kwargs):
+    instance.file_basename = instance.file.name.split('/')[-1] if instance.file else ''
+
+
+def invalidate_analysis_payloads(analysis_ids):
+    analysis_ids = list(analysis_ids)
+    payload_cache.invalidate('analysis', analysis_ids)
+    payload_cache.invalidate(
+        'project',
+        Project.objects.filter(last_cached_analysis__in=analysis_ids).values_list('id', flat=True),
+    )
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_project_payload(sender, instance, **kwargs):
+    payload_cache.invalidate('project', [instance.id])
+
+
+@receiver(post_delete, sender=Project)
+def invalidate_project_dataset_snapshot(sender, instance, **kwargs):
+    # the landmarks and constraints of the project are deleted with it, in bulk
+    Dataset.bump_contents_version(id=instance.dataset_id)
+
+
+@receiver(post_save, sender=CachedAnalysis)
+@receiver(post_delete, sender=CachedAnalysis)
+def invalidate_analysis_payload(sender, instance, **kwargs):
+    invalidate_analysis_payloads([instance.id])
+
+
+@receiver(m2m_changed, sender=CachedAnalysis.modes.through)
+@receiver(m2m_changed, sender=CachedAnalysis.mean_shapes.through)
+@receiver(m2m_changed, sender=CachedAnalysis.groups.through)
+def invalidate_analysis_relation_payload(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith('post_'):
+        invalidate_analysis_payloads((pk_set or []) if reverse else [instance.id])
+
+
+# how each nested analysis row is reached from CachedAnalysis
+ANALYSIS_LOOKUPS = {
+    CachedAnalysisMode: 'modes',
+    CachedAnalysisModePCA: 'modes__pca_values',
+    CachedAnalysisGroup: 'groups',
+    CachedAnalysisMeanShape: 'mean_shapes',
+}
+
+
+@receiver(post_save, sender=CachedAnalysisMode)
+@receiver(post_save, sender=CachedAnalysisModePCA)
+@receiver(post_save, sender=CachedAnalysisGroup)
+@receiver(post_save, sender=CachedAnalysisMeanShape)
+@receiver(pre_delete, sender=CachedAnalysisMode)
+@receiver(pre_delete, sender=CachedAnalysisModePCA)
+@receiver(pre_delete, sender=CachedAnalysisGroup)
+@receiver(pre_delete, sender=CachedAnalysisMeanShape)
+def invalidate_nested_analysis_payload(sender, instance, created=False, **kwargs):
+    if created:
+        # not part of any analysis yet
+        return
+    # deletions are handled before the fact, while the relation rows still lead to the analyses
+    invalidate_analysis_payloads(
+        CachedAnalysis.objects.filter(**{ANALYSIS_LOOKUPS[sender]: instance}).values_list(
+            'id', flat=True
+        )
+    )
@@ -0,0 +1,85 @@
+"""
+Sign stored file URLs, reusing each signed URL until it nears expiry.
+
+Time is split into buckets of half the signed-URL lifetime. A URL signed during a bucket is
+cached until the bucket ends, so every URL handed out is valid for at least half its lifetime.
+"""
+
+import hashlib
+import time
+from typing import Dict, Iterable, List
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.db.models.fields.files import FieldFile
+
+CACHE_ALIAS = 'signed_urls'
+
+
+def bucket_length():
+    return getattr(settings, 'AWS_QUERYSTRING_EXPIRE', 3600) // 2
+
+
+def sign_names(names: Iterable[str], storage=default_storage) -> Dict[str, str]:
+    """Map each stored file name to a signed URL, signing only those not already cached."""
+    names = set(names)
+    length = bucket_length()
+    now = time.time()
+    bucket = int(now) // length
+    # file names may hold characters that cache keys must not
+    keys = {name: f'{bucket}:{hashlib.md5(name.encode()).hexdigest()}' for name in names}
+
+    cache = caches[CACHE_ALIAS]
+    cached = cache.get_many(keys.values())
+    urls = {name: cached[key] for name, key in keys.items() if key in cached}
+    signed = {name: storage.url(name) for name in names if name not in urls}
+    if signed:
+        timeout = max(int((bucket + 1) * length - now), 1)
+        cache.set_many({keys[name]: url for name, url in signed.items()}, timeout=timeout)
+    urls.update(signed)
+    return urls
+
+
+class StoredName(str):
+    """The name of a stored file in a cached payload, signed when the payload is served."""
+
+
+def signed_url(field_file: FieldFile) -> str:
+    return sign_names([field_file.name], field_file.storage)[field_file.name]
+
+
+def sign_files(data):
+    """
+    Replace every stored file or StoredName in a structure of dicts and lists with its URL.
+
+    The files are signed in one batch, so a large structure costs one cache round trip.
+    """
+    names: List[str] = []
+
+    def collect(value):
+        if isinstance(value, FieldFile):
+            names.append(value.name)
+        elif isinstance(value, StoredName):
+            names.append(value)
+        elif isinstance(value, dict):
+            for item in value.values():
+                collect(item)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+
+    def replace(value):
+        if isinstance(value, FieldFile):
+            return urls[value.name]
+        if isinstance(value, StoredName):
+            return urls[value]
+        if isinstance(value, dict):
+            return {key: replace(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [replace(item) for item in value]
+        return value
+
+    collect(data)
+    urls = sign_names(names) if names else {}
+    return replace(data)
@@ -1,18 +1,23 @@
+from datetime import timedelta
 import json
 from pathlib import Path
 import re
 from subprocess import PIPE, Popen
-from tempfile import TemporaryDirectory
+from tempfile import TemporaryDirectory, TemporaryFile
 from typing import Dict, List
 
 from celery import shared_task
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.files.base import ContentFile
+from django.core.files.base import ContentFile, File
 from django.db.models import Q
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
 
 from shapeworks_cloud.core import models
+from shapeworks_cloud.core.progress import ProgressReporter
+from shapeworks_cloud.core.signals import post_bulk_create
+from shapeworks_cloud.core.zip_stream import storage_layout, stream_zip
 from swcc.api import swcc_session
 from swcc.models import Project as SWCCProject
 from swcc.models.constants import expected_key_prefixes
@@ -45,7 +50,15 @@ def edit_swproj_section(filename, section_name, new_contents):
         json.dump(data, f)
 
 
-def interpret_form_data(data, command, swcc_project):
+def index_by_basename(queryset, basenames):
+    """Map each basename to the first row of the queryset whose file has that basename."""
+    ret = {}
+    for obj in queryset.filter(file_basename__in=set(basenames)).order_by('id'):
+        ret.setdefault(obj.file_basename, obj)
+    return ret
+
+
+def interpret_form_data(data, command, project):
     anisotropic_values = []
     del_keys = []
     for key, value in data.items():
@@ -61,7 +74,7 @@ def interpret_form_data(data, command, swcc_project):
     elif command == 'optimize':
         num_particles = data.get('number_of_particles')
         if num_particles:
-            max_num_domains = max(s.num_domains for s in swcc_project.subjects)
+            max_num_domains = project.get_max_num_domains()
             data['number_of_particles'] = ' '.join(
                 str(num_particles) for i in range(max_num_domains)
             )
@@ -80,11 +93,11 @@ def run_shapeworks_command(
     args: List[str],
 ):
     user = User.objects.get(id=user_id)
-    progress = models.TaskProgress.objects.get(id=progress_id)
+    progress = ProgressReporter(progress_id)
     token, _created = Token.objects.get_or_create(user=user)
     base_url = settings.API_URL  # type: ignore
     try:
-        progress.update_message('Initializing task.')
+        progress.report('Initializing task.')
         with TemporaryDirectory() as download_dir:
             with swcc_session(base_url=base_url) as session:
                 # fetch everything we need
@@ -92,16 +105,14 @@ def run_shapeworks_command(
                 project = models.Project.objects.get(id=project_id)
                 project_filename = project.file.name.split('/')[-1]
                 swcc_project = SWCCProject.from_id(project.id)
-                progress.update_message('Downloading project.')
+                progress.report('Downloading project.')
                 swcc_project.download(download_dir)
 
                 pre_command_function()
-                progress.update_percentage(10)
-
-                progress.update_message('Writing form data to project file.')
+                progress.report('Writing form data to project file.', 10)
                 if form_data:
                     # write the form data to the project file
-                    form_data = interpret_form_data(form_data, command, swcc_project)
+                    form_data = interpret_form_data(form_data, command, project)
                     edit_swproj_section(
                         Path(download_dir, project_filename),
                         command,
@@ -123,15 +134,14 @@ def run_shapeworks_command(
                 if len(args) > 0:
                     full_command.extend(args)
 
-                progress.update_message(f'Running {command} command on data.')
+                progress.report(f'Running {command} command on data.')
                 with Popen(full_command, cwd=download_dir, stdout=PIPE, stderr=PIPE) as process:
                     if process.stderr and process.stdout:
                         for line in iter(process.stdout.readline, b''):
-                            progress.refresh_from_db()
                             if command == 'analyze':
                                 message = line.decode().split('[info]')[-1]
+                                progress.set(percentage=50)
                                 progress.update_message(message)
-                                progress.update_percentage(50)
                             else:
                                 percentage = int(parse_progress(line.decode()) * 0.8) + 10
                                 if percentage > progress.percent_complete and percentage <= 90:
@@ -141,20 +151,103 @@ def run_shapeworks_command(
                             return
                     process.wait()
 
-                progress.update_percentage(90)
-                progress.update_message('Saving task results.')
+                progress.report('Saving task results.', 90)
                 result_filename = 'analysis.json' if command == 'analyze' else project_filename
                 with open(Path(download_dir, result_filename), 'r') as f:
                     result_data = json.load(f)
                 post_command_function(project, download_dir, result_data, project_filename)
-                progress.update_message('Finalizing task.')
-                progress.update_percentage(100)
+                progress.report('Finalizing task.', 100)
+    except models.TaskProgress.TaskAbortedError:
+        print('Task Aborted. Exiting.')
+    except Exception as e:
+        progress.update_error(str(e))
+
+
+@shared_task
+def create_subset(dataset_id, new_dataset_id, selected, progress_id=None):
+    """Copy the selected shapes of a dataset, with one new subject per source subject."""
+    progress = ProgressReporter(progress_id) if progress_id else None
+
+    def report(message, percentage):
+        if progress:
+            progress.report(message, percentage)
+
+    try:
+        report('Reading selected shapes.', 0)
+        shape_models = {'mesh': models.Mesh, 'segmentation': models.Segmentation}
+        shapes = []
+        for shape_type, shape_model in shape_models.items():
+            shape_ids = [datum['id'] for datum in selected if datum['type'] == shape_type]
+            shapes += list(
+                shape_model.objects.filter(id__in=shape_ids, subject__dataset=dataset_id).order_by(
+                    'id'
+                )
+            )
+        source_subjects = models.Subject.objects.filter(
+            id__in={shape.subject_id for shape in shapes}
+        ).order_by('id')
+
+        report('Creating subjects.', 30)
+        new_subjects = models.copy_rows(source_subjects, dataset_id=new_dataset_id)
+        post_bulk_create.send(sender=models.Subject, instances=list(new_subjects.values()))
+
+        report('Copying shapes.', 60)
+        for shape_model in shape_models.values():
+            model_shapes = [shape for shape in shapes if isinstance(shape, shape_model)]
+            for shape in model_shapes:
+                shape.subject_id = new_subjects[shape.subject_id].id
+            copies = models.copy_rows(model_shapes)
+            post_bulk_create.send(sender=shape_model, instances=list(copies.values()))
+        report('Finalizing task.', 100)
     except models.TaskProgress.TaskAbortedError:
         print('Task Aborted. Exiting.')
     except Exception as e:
+        if not progress:
+            raise
         progress.update_error(str(e))
 
 
+@shared_task
+def build_dataset_snapshot(snapshot_id):
+    """Write the archive of a dataset snapshot, unless the dataset changes in the meantime."""
+    snapshot = models.DatasetSnapshot.objects.select_related('dataset').get(id=snapshot_id)
+    dataset = snapshot.dataset
+    files = dataset.get_snapshot_files()
+    dataset.refresh_from_db(fields=['contents_version'])
+    if dataset.contents_version != snapshot.version:
+        # the next download requests a snapshot of the new contents
+        snapshot.delete()
+        return
+
+    with TemporaryFile() as archive:
+        for chunk in stream_zip(storage_layout(files)):
+            archive.write(chunk)
+        archive.seek(0)
+        snapshot.file.save(f'{dataset.name}-v{snapshot.version}.zip', File(archive))
+    dataset.snapshots.filter(version__lt=snapshot.version).delete()
+
+
+@shared_task
+def store_manifest_checksums(project_id):
+    """Store the sizes and CRCs of the project's manifest files that have none yet."""
+    project = models.Project.objects.filter(id=project_id).first()
+    if project is not None:
+        project.store_manifest_checksums()
+
+
+@shared_task
+def prune_write_access_log(batch_size=10000):
+    """Delete write access log entries older than the retention period, a batch at a time."""
+    cutoff = timezone.now() - timedelta(days=settings.WRITE_ACCESS_LOG_RETENTION_DAYS)
+    expired = models.WriteAccessLog.objects.filter(timestamp__lt=cutoff)
+    while True:
+        # short deletes, so that the flushes of running servers are not held up
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        models.WriteAccessLog.objects.filter(id__in=ids).delete()
+
+
 @shared_task
 def groom(user_id, project_id, form_data, progress_id):
     def pre_command_function():
@@ -170,10 +263,7 @@ def groom(user_id, project_id, form_data, progress_id):
         )
 
         # make new objects in database
-        project_segmentations = models.Segmentation.objects.filter(
-            subject__dataset__id=project.dataset.id
-        )
-        project_meshes = models.Mesh.objects.filter(subject__dataset__id=project.dataset.id)
+        groomed_rows = []
         for entry in result_data['data']:
             row: Dict[str, Dict] = {}
             for key in entry.keys():
@@ -184,32 +274,39 @@ def groom(user_id, project_id, form_data, progress_id):
                     if anatomy_id not in row:
                         row[anatomy_id] = {}
                     row[anatomy_id][prefix] = entry[key].replace('../', '').replace('./', '')
+            groomed_rows += [a for a in row.values() if 'groomed' in a]
 
-            for anatomy_data in row.values():
-                if 'groomed' not in anatomy_data:
-                    continue
-                source_filename = anatomy_data['shape'].split('/')[-1]
-                result_file = Path(download_dir, anatomy_data['groomed'])
-                try:
-                    target_object = project_segmentations.get(
-                        file__endswith=source_filename,
-                    )
-                    result_object = models.GroomedSegmentation.objects.create(
-                        project=project,
-                        segmentation=target_object,
-                    )
-                except models.Segmentation.DoesNotExist:
-                    target_object = project_meshes.get(
-                        file__endswith=source_filename,
-                    )
-                    result_object = models.GroomedMesh.objects.create(
-                        project=project,
-                        mesh=target_object,
-                    )
-                result_object.file.save(
-                    anatomy_data['groomed'],
-                    open(result_file, 'rb'),
+        # resolve every source shape with a single lookup per table
+        source_filenames = [a['shape'].split('/')[-1] for a in groomed_rows]
+        project_segmentations = index_by_basename(
+            models.Segmentation.objects.filter(subject__dataset=project.dataset_id),
+            source_filenames,
+        )
+        project_meshes = index_by_basename(
+            models.Mesh.objects.filter(subject__dataset=project.dataset_id),
+            source_filenames,
+        )
+
+        for anatomy_data, source_filename in zip(groomed_rows, source_filenames):
+            result_file = Path(download_dir, anatomy_data['groomed'])
+            if source_filename in project_segmentations:
+                result_object = models.GroomedSegmentation.objects.create(
+                    project=project,
+                    segmentation=project_segmentations[source_filename],
                 )
+            elif source_filename in project_meshes:
+                result_object = models.GroomedMesh.objects.create(
+                    project=project,
+                    mesh=project_meshes[source_filename],
+                )
+            else:
+                raise models.Mesh.DoesNotExist(f'No shape matches {source_filename}.')
+            result_object.file.save(
+                anatomy_data['groomed'],
+                open(result_file, 'rb'),
+            )
+
+        project.refresh_manifest()
 
     run_shapeworks_command(
         user_id,
@@ -237,9 +334,7 @@ def optimize(user_id, project_id, form_data, progress_id, analysis_progress_id):
         )
 
         # make new objects in database
-        project_groomed_segmentations = models.GroomedSegmentation.objects.filter(project=project)
-        project_groomed_meshes = models.GroomedMesh.objects.filter(project=project)
-
+        rows = []
         for entry in result_data['data']:
             row: Dict[str, Dict] = {}
             for key in entry.keys():
@@ -252,44 +347,53 @@ def optimize(user_id, project_id, form_data, progress_id, analysis_progress_id):
                     if anatomy_id not in row:
                         row[anatomy_id] = {}
                     row[anatomy_id][prefix] = entry[key].replace('../', '').replace('./', '')
+            rows += [(a_id, a) for a_id, a in row.items() if 'groomed' in a]
+
+        # resolve every groomed shape with a single lookup per table
+        groomed_filenames = [a['groomed'].split('/')[-1] for _a_id, a in rows]
+        project_groomed_segmentations = index_by_basename(
+            models.GroomedSegmentation.objects.filter(project=project).select_related(
+                'segmentation'
+            ),
+            groomed_filenames,
+        )
+        project_groomed_meshes = index_by_basename(
+            models.GroomedMesh.objects.filter(project=project).select_related('mesh'),
+            groomed_filenames,
+        )
 
-            for anatomy_id, anatomy_data in row.items():
-                if 'groomed' not in anatomy_data:
-                    continue
-                groomed_filename = anatomy_data['groomed'].split('/')[-1]
-                target_segmentation = project_groomed_segmentations.filter(
-                    file__endswith=groomed_filename,
-                ).first()
-                target_mesh = project_groomed_meshes.filter(
-                    file__endswith=groomed_filename,
-                ).first()
-                if target_mesh and target_mesh.mesh:
-                    subject = target_mesh.mesh.subject
-                elif target_segmentation and target_segmentation.segmentation:
-                    subject = target_segmentation.segmentation.subject
-                result_particles_object = models.OptimizedParticles.objects.create(
-                    groomed_segmentation=target_segmentation,
-                    groomed_mesh=target_mesh,
-                    project=project,
-                    subject=subject,
-                    anatomy_type=anatomy_id,
+        for (anatomy_id, anatomy_data), groomed_filename in zip(rows, groomed_filenames):
+            target_segmentation = project_groomed_segmentations.get(groomed_filename)
+            target_mesh = project_groomed_meshes.get(groomed_filename)
+            subject_id = None
+            if target_mesh and target_mesh.mesh:
+                subject_id = target_mesh.mesh.subject_id
+            elif target_segmentation and target_segmentation.segmentation:
+                subject_id = target_segmentation.segmentation.subject_id
+            result_particles_object = models.OptimizedParticles.objects.create(
+                groomed_segmentation=target_segmentation,
+                groomed_mesh=target_mesh,
+                project=project,
+                subject_id=subject_id,
+                anatomy_type=anatomy_id,
+            )
+            if 'world' in anatomy_data:
+                result_particles_object.world.save(
+                    anatomy_data['world'].split('/')[-1],
+                    open(Path(download_dir, anatomy_data['world']), 'rb'),
                 )
-                if 'world' in anatomy_data:
-                    result_particles_object.world.save(
-                        anatomy_data['world'].split('/')[-1],
-                        open(Path(download_dir, anatomy_data['world']), 'rb'),
-                    )
-                if 'local' in anatomy_data:
-                    result_particles_object.local.save(
-                        anatomy_data['local'].split('/')[-1],
-                        open(Path(download_dir, anatomy_data['local']), 'rb'),
-                    )
-                if 'alignment' in anatomy_data:
-                    result_particles_object.transform.save(
-                        '.'.join(anatomy_data['shape'].split('/')[-1].split('.')[:-1])
-                        + '.transform',
-                        ContentFile(str(anatomy_data['alignment']).encode()),
-                    )
+            if 'local' in anatomy_data:
+                result_particles_object.local.save(
+                    anatomy_data['local'].split('/')[-1],
+                    open(Path(download_dir, anatomy_data['local']), 'rb'),
+                )
+            if 'alignment' in anatomy_data:
+                result_particles_object.transform.save(
+                    '.'.join(anatomy_data['shape'].split('/')[-1].split('.')[:-1]) + '.transform',
+                    ContentFile(str(anatomy_data['alignment']).encode()),
+                )
+
+        project.refresh_manifest()
 
     run_shapeworks_command(
         user_id,
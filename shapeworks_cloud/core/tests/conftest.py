@@ -0,0 +1,46 @@
+from django.core.cache import caches
+import pytest
+from pytest_factoryboy import register
+from rest_framework.test import APIClient
+
+from . import factories
+
+for _factory in [
+    factories.UserFactory,
+    factories.DatasetFactory,
+    factories.SubjectFactory,
+    factories.SegmentationFactory,
+    factories.MeshFactory,
+    factories.ContourFactory,
+    factories.ImageFactory,
+    factories.ProjectFactory,
+    factories.GroomedSegmentationFactory,
+    factories.GroomedMeshFactory,
+    factories.OptimizedParticlesFactory,
+    factories.ReconstructedSampleFactory,
+    factories.LandmarksFactory,
+    factories.ConstraintsFactory,
+    factories.DeepSSMTestingDataFactory,
+    factories.CachedAnalysisFactory,
+    factories.TaskProgressFactory,
+]:
+    register(_factory)
+
+
+@pytest.fixture(autouse=True)
+def clear_caches(settings):
+    # the payload and signed URL caches would otherwise carry over between tests
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def authenticated_api_client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
@@ -0,0 +1,241 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+import factory
+from factory.django import DjangoModelFactory, FileField
+
+from shapeworks_cloud.core import models
+
+
+class UserFactory(DjangoModelFactory):
+    class Meta:
+        model = User
+
+    username = factory.Sequence(lambda n: f'user_{n}')
+    email = factory.Faker('safe_email')
+
+
+class DatasetFactory(DjangoModelFactory):
+    class Meta:
+        model = models.Dataset
+
+    name = factory.Sequence(lambda n: f'dataset_{n}')
+    creator = factory.SubFactory(UserFactory)
+    license = factory.Faker('sentence')
+    description = factory.Faker('sentence')
+    acknowledgement = factory.Faker('sentence')
+
+
+class SubjectFactory(DjangoModelFactory):
+    class Meta:
+        model = models.Subject
+
+    name = factory.Sequence(lambda n: f'subject_{n}')
+    dataset = factory.SubFactory(DatasetFactory)
+
+
+class SegmentationFactory(DjangoModelFactory):
+    class Meta:
+        model = models.Segmentation
+
+    file = FileField(filename=factory.Sequence(lambda n: f'segmentation_{n}.nrrd'))
+    anatomy_type = 'anatomy_femur'
+    subject = factory.SubFactory(SubjectFactory)
+
+
+class MeshFactory(DjangoModelFactory):
+    class Meta:
+        model = models.Mesh
+
+    file = FileField(filename=factory.Sequence(lambda n: f'mesh_{n}.vtk'))
+    anatomy_type = 'anatomy_femur'
+    subject = factory.SubFactory(SubjectFactory)
+
+
+class ContourFactory(DjangoModelFactory):
+    class Meta:
+        model = models.Contour
+
+    file = FileField(filename=factory.Sequence(lambda n: f'contour_{n}.vtp'))
+    anatomy_type = 'anatomy_femur'
+    subject = factory.SubFactory(SubjectFactory)
+
+
+class ImageFactory(DjangoModelFactory):
+    class Meta:
+        model = models.Image
+
+    file = FileField(filename=factory.Sequence(lambda n: f'image_{n}.nrrd'))
+    modality = 'ct'
+    subject = factory.SubFactory(SubjectFactory)
+
+
+class ProjectFactory(DjangoModelFactory):
+    class Meta:
+        model = models.Project
+
+    file = FileField(
+        filename='project.swproj',
+        data=json.dumps({'data': [], 'groom': {}, 'optimize': {}}).encode(),
+    )
+    name = factory.Sequence(lambda n: f'project_{n}')
+    creator = factory.SubFactory(UserFactory)
+    dataset = factory.SubFactory(DatasetFactory)
+
+
+class GroomedSegmentationFactory(DjangoModelFactory):
+    class Meta:
+        model = models.GroomedSegmentation
+
+    file = FileField(filename=factory.Sequence(lambda n: f'groomed_segmentation_{n}.nrrd'))
+    segmentation = factory.SubFactory(SegmentationFactory)
+    project = factory.SubFactory(ProjectFactory)
+
+
+class GroomedMeshFactory(DjangoModelFactory):
+    class Meta:
+        model = models.GroomedMesh
+
+    file = FileField(filename=factory.Sequence(lambda n: f'groomed_mesh_{n}.vtk'))
+    mesh = factory.SubFactory(MeshFactory)
+    project = factory.SubFactory(ProjectFactory)
+
+
+class OptimizedParticlesFactory(DjangoModelFactory):
+    class Meta:
+        model = models.OptimizedParticles
+
+    world = FileField(filename=factory.Sequence(lambda n: f'world_{n}.particles'))
+    local = FileField(filename=factory.Sequence(lambda n: f'local_{n}.particles'))
+    transform = FileField(filename=factory.Sequence(lambda n: f'transform_{n}.txt'))
+    anatomy_type = 'anatomy_femur'
+    project = factory.SubFactory(ProjectFactory)
+    subject = factory.SubFactory(SubjectFactory)
+
+
+class ReconstructedSampleFactory(DjangoModelFactory):
+    class Meta:
+        model = models.ReconstructedSample
+
+    file = FileField(filename=factory.Sequence(lambda n: f'reconstructed_{n}.vtk'))
+    project = factory.SubFactory(ProjectFactory)
+    particles = factory.SubFactory(
+        OptimizedParticlesFactory,
+        project=factory.SelfAttribute('..project'),
+        groomed_mesh=factory.SubFactory(
+            GroomedMeshFactory, project=factory.SelfAttribute('..project')
+        ),
+    )
+
+
+class LandmarksFactory(DjangoModelFactory):
+    class Meta:
+        model = models.Landmarks
+
+    locations = [[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]]
+    anatomy_type = 'anatomy_femur'
+    subject = factory.SubFactory(SubjectFactory)
+    project = factory.SubFactory(ProjectFactory)
+
+
+class ConstraintsFactory(DjangoModelFactory):
+    class Meta:
+        model = models.Constraints
+
+    locations = {'planes': [], 'paint': []}
+    anatomy_type = 'anatomy_femur'
+    subject = factory.SubFactory(SubjectFactory)
+    project = factory.SubFactory(ProjectFactory)
+
+
+class DeepSSMTestingDataFactory(DjangoModelFactory):
+    class Meta:
+        model = models.DeepSSMTestingData
+
+    image_type = 'image'
+    image_id = factory.Sequence(str)
+    mesh = FileField(filename=factory.Sequence(lambda n: f'deepssm_mesh_{n}.vtk'))
+    particles = FileField(filename=factory.Sequence(lambda n: f'deepssm_{n}.particles'))
+    project = factory.SubFactory(ProjectFactory)
+
+
+class CachedAnalysisModePCAFactory(DjangoModelFactory):
+    class Meta:
+        model = models.CachedAnalysisModePCA
+
+    pca_value = factory.Sequence(float)
+    lambda_value = factory.Sequence(float)
+    file = FileField(filename=factory.Sequence(lambda n: f'pca_{n}.vtk'))
+
+
+class CachedAnalysisModeFactory(DjangoModelFactory):
+    class Meta:
+        model = models.CachedAnalysisMode
+
+    mode = factory.Sequence(int)
+    eigen_value = 1.0
+    explained_variance = 0.5
+    cumulative_explained_variance = 0.5
+
+
+class CachedAnalysisFactory(DjangoModelFactory):
+    class Meta:
+        model = models.CachedAnalysis
+
+    charts = []
+
+
+class TaskProgressFactory(DjangoModelFactory):
+    class Meta:
+        model = models.TaskProgress
+
+    name = 'groom'
+    project = factory.SubFactory(ProjectFactory)
+
+
+def populate_project(project, num_subjects):
+    """Give a project subjects with a mesh, groomed mesh and particles each, in its file too."""
+    data = []
+    for subject in SubjectFactory.create_batch(num_subjects, dataset=project.dataset):
+        mesh = MeshFactory(subject=subject)
+        GroomedMeshFactory(mesh=mesh, project=project)
+        OptimizedParticlesFactory(subject=subject, project=project)
+        data.append(
+            {
+                'name': subject.name,
+                'shape_femur': f'../meshes/{subject.name}.vtk',
+                'groomed_femur': f'groomed/{subject.name}.vtk',
+                'local_particles_femur': f'particles/{subject.name}_local.particles',
+                'world_particles_femur': f'particles/{subject.name}_world.particles',
+            }
+        )
+    project.file.save(
+        'project.swproj',
+        ContentFile(json.dumps({'data': data, 'groom': {}, 'optimize': {}}).encode()),
+    )
+    return data
+
+
+def create_analysis(num_modes, num_steps):
+    """Create an analysis with the given number of modes and PCA steps per mode."""
+    analysis = CachedAnalysisFactory()
+    for mode_number in range(num_modes):
+        mode = CachedAnalysisModeFactory(mode=mode_number)
+        # the files are only signed, so they need not exist in storage
+        mode.pca_values.set(
+            models.CachedAnalysisModePCA.objects.bulk_create(
+                [
+                    models.CachedAnalysisModePCA(
+                        pca_value=step,
+                        lambda_value=step,
+                        file=f'pca/{mode_number}_{step}.vtk',
+                    )
+                    for step in range(num_steps)
+                ]
+            )
+        )
+        analysis.modes.add(mode)
+    analysis.mean_shapes.add(models.CachedAnalysisMeanShape.objects.create(file='mean.vtk'))
+    analysis.groups.add(models.CachedAnalysisGroup.objects.create(name='group', file='group.vtk'))
+    return analysis
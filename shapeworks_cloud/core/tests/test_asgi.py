@@ -0,0 +1,53 @@
+import threading
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.http import StreamingHttpResponse
+import pytest
+
+from shapeworks_cloud.asgi import StreamingASGIHandler
+from shapeworks_cloud.core import consumers
+
+
+@pytest.mark.django_db
+def test_streaming_response_read_off_event_loop():
+    part_threads = []
+
+    def parts():
+        for part in [b'first', b'second']:
+            part_threads.append(threading.get_ident())
+            yield part
+
+    response = StreamingHttpResponse(parts(), content_type='application/zip')
+    messages = []
+
+    async def send(message):
+        messages.append((threading.get_ident(), message))
+
+    async_to_sync(StreamingASGIHandler().send_response)(response, send)
+
+    loop_threads = {thread for thread, _ in messages}
+    assert len(loop_threads) == 1
+    assert not loop_threads & set(part_threads)
+    assert messages[0][1]['type'] == 'http.response.start'
+    assert (b'Content-Type', b'application/zip') in messages[0][1]['headers']
+    assert b''.join(message.get('body', b'') for _, message in messages[1:]) == b'firstsecond'
+    assert not messages[-1][1].get('more_body')
+
+
+def test_progress_socket_refused_without_channel_layer(mocker):
+    mocker.patch('channels.consumer.get_channel_layer', return_value=None)
+    scope = {
+        'type': 'websocket',
+        'path': '/ws/projects/1/task-progress/',
+        'url_route': {'args': (), 'kwargs': {'project_id': 1}},
+    }
+
+    async def connect():
+        communicator = ApplicationCommunicator(consumers.TaskProgressConsumer.as_asgi(), scope)
+        await communicator.send_input({'type': 'websocket.connect'})
+        message = await communicator.receive_output(timeout=1)
+        await communicator.wait(timeout=1)
+        return message
+
+    assert async_to_sync(connect)()['type'] == 'websocket.close'
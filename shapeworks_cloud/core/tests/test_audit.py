@@ -0,0 +1,50 @@
+import logging
+import os
+
+from django.utils import timezone
+import pytest
+
+from shapeworks_cloud.core import audit
+from shapeworks_cloud.core.models import WriteAccessLog
+
+
+@pytest.fixture
+def sink(mocker):
+    mocker.patch.object(audit, 'BATCH_SIZE', 2)
+    mocker.patch.object(audit, 'MAX_BUFFERED', 3)
+    sink = audit.AuditLogSink()
+    # flushed by the test, rather than a thread outside its transaction
+    sink.pid = os.getpid()
+    return sink
+
+
+@pytest.mark.django_db
+def test_audit_log_sink_flushes_batches(django_assert_num_queries, sink):
+    sink.record(timezone.now(), 'user', 'Create Dataset', 'first')
+    assert not sink.wake.is_set()
+    sink.record(timezone.now(), 'user', 'Create Dataset', 'second', 'detail')
+    # a full batch wakes the flushing thread early
+    assert sink.wake.is_set()
+
+    with django_assert_num_queries(1):
+        sink.flush()
+    assert list(WriteAccessLog.objects.order_by('id').values_list('details', flat=True)) == [
+        'first',
+        'second\tdetail',
+    ]
+
+    with django_assert_num_queries(0):
+        sink.flush()
+
+
+@pytest.mark.django_db
+def test_audit_log_sink_counts_dropped_entries(caplog, sink):
+    for index in range(5):
+        sink.record(timezone.now(), 'user', 'Create Dataset', index)
+    assert sink.dropped == 2
+
+    with caplog.at_level(logging.WARNING, logger=audit.__name__):
+        sink.flush()
+    assert 'Dropped 2 write access log entries' in caplog.text
+    assert sink.dropped == 0
+    assert WriteAccessLog.objects.count() == 3
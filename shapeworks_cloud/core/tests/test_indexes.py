@@ -0,0 +1,93 @@
+from django.db import connection
+from django.db.models import Q
+import pytest
+
+from shapeworks_cloud.core import models
+
+
+@pytest.fixture
+def seeded(user_factory):
+    """Thousands of mostly private rows, with up to date planner statistics."""
+    users = user_factory.create_batch(20)
+    datasets = models.Dataset.objects.bulk_create(
+        [
+            models.Dataset(name=f'seeded_{i}', creator=users[i % 20], private=i % 100 != 0)
+            for i in range(5000)
+        ]
+    )
+    projects = models.Project.objects.bulk_create(
+        [
+            models.Project(
+                name=f'seeded_{i}',
+                file='project.swproj',
+                dataset=datasets[i],
+                creator=users[i % 20],
+                private=i % 100 != 0,
+            )
+            for i in range(5000)
+        ]
+    )
+    subjects = models.Subject.objects.bulk_create(
+        [
+            models.Subject(name=f'subject_{i % 100}', dataset=datasets[i // 100 % 200])
+            for i in range(20000)
+        ]
+    )
+    models.OptimizedParticles.objects.bulk_create(
+        [
+            models.OptimizedParticles(
+                project=projects[i % 200],
+                subject=subjects[i],
+                anatomy_type=f'anatomy_{i % 3}',
+            )
+            for i in range(20000)
+        ]
+    )
+    models.Landmarks.objects.bulk_create(
+        [
+            models.Landmarks(
+                project=projects[i % 200],
+                subject=subjects[i],
+                anatomy_type='anatomy_0',
+                locations=[],
+            )
+            for i in range(20000)
+        ]
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return {'users': users, 'datasets': datasets, 'projects': projects, 'subjects': subjects}
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason='reads PostgreSQL plans')
+@pytest.mark.django_db
+def test_hot_filters_use_indexes(seeded):
+    user = seeded['users'][3]
+    dataset = seeded['datasets'][3]
+    project = seeded['projects'][3]
+    subject = seeded['subjects'][3]
+    for queryset, index in [
+        (
+            models.Subject.objects.filter(dataset=dataset, name='subject_7'),
+            'subject_dataset_name_idx',
+        ),
+        (
+            models.OptimizedParticles.objects.filter(
+                project=project, subject=subject, anatomy_type='anatomy_0'
+            ),
+            'particles_project_subject_idx',
+        ),
+        (
+            models.Landmarks.objects.filter(
+                project=project, subject=subject, anatomy_type='anatomy_0'
+            ),
+            'unique_project_landmarks',
+        ),
+        (models.Project.visible_to(user), 'project_private_creator_idx'),
+        (
+            models.Dataset.objects.filter(Q(private=False) | Q(creator=user)),
+            'dataset_private_creator_idx',
+        ),
+    ]:
+        plan = queryset.explain()
+        assert index in plan, plan
@@ -0,0 +1,259 @@
+import json
+
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import pytest
+
+from shapeworks_cloud.core import models, payload_cache
+
+from .factories import create_analysis, populate_project
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('num_subjects', [1, 20])
+def test_dataset_get_contents_queries(
+    django_assert_num_queries, dataset, subject_factory, mesh_factory, image_factory, num_subjects
+):
+    for subject in subject_factory.create_batch(num_subjects, dataset=dataset):
+        mesh_factory(subject=subject, anatomy_type='anatomy_femur')
+        mesh_factory(subject=subject, anatomy_type='anatomy_pelvis')
+        image_factory(subject=subject, modality='ct')
+
+    # one query per shape type, however many subjects there are
+    with django_assert_num_queries(4):
+        contents = dataset.get_contents()
+
+    assert len(contents) == num_subjects
+    assert set(contents[0]) == {'name', 'shape_femur', 'shape_pelvis', 'image_ct'}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('num_subjects', [1, 10])
+def test_project_get_download_files_queries(django_assert_num_queries, project, num_subjects):
+    populate_project(project, num_subjects)
+
+    # one query per table, however many subjects there are
+    with django_assert_num_queries(10):
+        files = project.get_download_files()
+
+    assert len(files) == 4 * num_subjects
+    assert all(not path.startswith('../') for path in files)
+
+
+@pytest.mark.django_db
+def test_subject_num_domains(subject, mesh_factory, segmentation_factory, contour_factory):
+    mesh = mesh_factory(subject=subject, anatomy_type='anatomy_femur')
+    segmentation_factory(subject=subject, anatomy_type='anatomy_femur')
+    contour_factory(subject=subject, anatomy_type='anatomy_pelvis')
+    subject.refresh_from_db()
+    assert subject.num_domains == 2
+
+    mesh.delete()
+    subject.refresh_from_db()
+    assert subject.num_domains == 2
+
+    models.Contour.objects.filter(subject=subject).delete()
+    models.Subject.refresh_num_domains(models.Subject.objects.filter(dataset=subject.dataset))
+    subject.refresh_from_db()
+    assert subject.num_domains == 1
+
+
+@pytest.mark.django_db
+def test_shape_save_queries(django_assert_num_queries, subject, mesh_factory):
+    mesh = mesh_factory(subject=subject)
+
+    # the update itself, then projects, num_domains and the dataset with its project payloads
+    with django_assert_num_queries(5):
+        mesh.save()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('num_subjects', [1, 10])
+def test_dataset_delete_queries(django_assert_num_queries, project, num_subjects):
+    populate_project(project, num_subjects)
+    dataset = project.dataset
+
+    # the cascades are deleted in bulk, however many rows they hold
+    with django_assert_num_queries(40):
+        dataset.delete()
+
+    assert not models.Subject.objects.exists()
+    assert not models.Mesh.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('num_subjects', [1, 10])
+def test_project_get_bundle_queries(
+    django_assert_num_queries, project, landmarks_factory, num_subjects
+):
+    populate_project(project, num_subjects)
+    for subject in models.Subject.objects.filter(dataset=project.dataset):
+        landmarks_factory(project=project, subject=subject)
+
+    # one query per table, however many subjects there are
+    with django_assert_num_queries(11):
+        bundle = project.get_bundle()
+
+    assert len(bundle['subjects']) == num_subjects
+    femur = bundle['subjects'][0]['anatomies']['anatomy_femur']
+    assert femur['shape']['type'] == 'mesh'
+    assert femur['groomed']['url'].startswith('http')
+    assert femur['particles']['world'].startswith('http')
+    assert femur['landmarks']['locations'] == [[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]]
+
+
+@pytest.mark.django_db
+def test_project_refresh_manifest_writes_annotation_files(
+    mocker, project, subject, landmarks_factory, constraints_factory
+):
+    subject.dataset = project.dataset
+    subject.save()
+    data = {
+        'name': subject.name,
+        'landmarks_file_femur': f'landmarks/{subject.name}.csv',
+        'constraints_femur': f'constraints/{subject.name}.json',
+    }
+    project.file.save(
+        'project.swproj',
+        ContentFile(json.dumps({'data': [data], 'groom': {}, 'optimize': {}}).encode()),
+    )
+    landmarks = landmarks_factory(project=project, subject=subject)
+    constraints = constraints_factory(project=project, subject=subject)
+    queries = CaptureQueriesContext(connection)
+    locked_at_write = []
+    ensure_file = models.AnnotationFileMixin.ensure_file
+
+    def spy(self):
+        locked_at_write.append(any('FOR UPDATE' in q['sql'] for q in queries.captured_queries))
+        ensure_file(self)
+
+    mocker.patch.object(models.AnnotationFileMixin, 'ensure_file', spy)
+    with queries:
+        project.refresh_manifest()
+
+    # the files are uploaded before the manifest row is locked
+    assert locked_at_write == [False, False]
+    landmarks.refresh_from_db()
+    constraints.refresh_from_db()
+    assert landmarks.file and constraints.file
+    assert dict(project.manifest_entries.values_list('path', 'file')) == {
+        data['landmarks_file_femur']: landmarks.file.name,
+        data['constraints_femur']: constraints.file.name,
+    }
+
+
+@pytest.mark.django_db
+def test_annotation_writes_invalidate_project_payload(mocker, project, landmarks_factory):
+    landmarks = landmarks_factory(project=project)
+    invalidate = mocker.patch.object(payload_cache, 'invalidate')
+
+    # the file is written from the locations
+    landmarks.ensure_file()
+    invalidate.assert_called_once_with('project', [project.id])
+
+    # and the locations parsed from the file
+    models.Landmarks.objects.filter(id=landmarks.id).update(locations=None)
+    landmarks.refresh_from_db()
+    invalidate.reset_mock()
+    assert landmarks.get_locations() == [[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]]
+    invalidate.assert_called_once_with('project', [project.id])
+
+
+@pytest.mark.django_db
+def test_project_save_marks_manifest_stale(project):
+    project.refresh_manifest()
+
+    project.name = 'renamed'
+    project.save()
+    project.refresh_from_db()
+    assert not project.manifest_stale
+
+    project.file.save('other.swproj', ContentFile(b'{"data": []}'))
+    project.refresh_from_db()
+    assert project.manifest_stale
+
+
+@pytest.mark.django_db
+def test_project_refresh_manifest_incremental(project, mesh_factory):
+    data = populate_project(project, 3)
+    project.refresh_manifest()
+    entries = {entry.path: entry for entry in project.manifest_entries.all()}
+
+    # replace one mesh, and drop the particles of another subject
+    subject = models.Subject.objects.get(name=data[0]['name'])
+    mesh = subject.meshes.get()
+    mesh.file = mesh_factory.build().file
+    mesh.save()
+    models.OptimizedParticles.objects.filter(subject__name=data[1]['name']).delete()
+    project.refresh_from_db()
+    assert project.manifest_stale
+    project.refresh_manifest()
+
+    refreshed = {entry.path: entry for entry in project.manifest_entries.all()}
+    removed = {data[1]['local_particles_femur'], data[1]['world_particles_femur']}
+    assert set(refreshed) == set(entries) - removed
+    changed = 'meshes/' + data[0]['shape_femur'].split('/')[-1]
+    assert refreshed[changed].id == entries[changed].id
+    assert refreshed[changed].file.name == mesh.file.name != entries[changed].file.name
+    for path, entry in refreshed.items():
+        if path != changed:
+            assert (entry.id, entry.file.name) == (entries[path].id, entries[path].file.name)
+
+
+@pytest.mark.django_db
+def test_project_clone(project, landmarks_factory, constraints_factory):
+    populate_project(project, 2)
+    subjects = list(models.Subject.objects.filter(dataset=project.dataset))
+    for particles in models.OptimizedParticles.objects.filter(project=project):
+        particles.groomed_mesh = models.GroomedMesh.objects.get(mesh__subject=particles.subject)
+        particles.save()
+    landmarks_factory(project=project, subject=subjects[0])
+    constraints_factory(project=project, subject=subjects[1])
+    project.last_cached_analysis = create_analysis(num_modes=2, num_steps=3)
+    project.save()
+    project.refresh_manifest()
+    project.dataset.refresh_from_db()
+    version = project.dataset.contents_version
+
+    clone = project.clone(name='clone')
+
+    for model in [
+        models.GroomedMesh,
+        models.OptimizedParticles,
+        models.Landmarks,
+        models.Constraints,
+    ]:
+        originals = set(model.objects.filter(project=project).values_list('id', flat=True))
+        copies = set(model.objects.filter(project=clone).values_list('id', flat=True))
+        assert len(copies) == len(originals) > 0
+        assert not copies & originals
+    # particles refer to the copied groomed meshes
+    particles = models.OptimizedParticles.objects.filter(project=clone)
+    assert {p.groomed_mesh.project_id for p in particles} == {clone.id}
+
+    # the analysis is copied with its PCA values linked to the copied modes
+    analysis = clone.last_cached_analysis
+    assert analysis.id != project.last_cached_analysis_id
+    original_pca = set(
+        models.CachedAnalysisModePCA.objects.filter(
+            cachedanalysismode__cachedanalysis=project.last_cached_analysis
+        ).values_list('id', flat=True)
+    )
+    for mode in analysis.modes.all():
+        pca_values = list(mode.pca_values.all())
+        assert len(pca_values) == 3
+        assert not {pca.id for pca in pca_values} & original_pca
+    assert analysis.mean_shapes.count() == 1
+    assert analysis.groups.count() == 1
+
+    # the fresh manifest is copied rather than rebuilt
+    clone.refresh_from_db()
+    assert not clone.manifest_stale
+    assert sorted(clone.manifest_entries.values_list('path', 'file')) == sorted(
+        project.manifest_entries.values_list('path', 'file')
+    )
+
+    # and the copied annotations outdate the dataset snapshots
+    project.dataset.refresh_from_db()
+    assert project.dataset.contents_version > version
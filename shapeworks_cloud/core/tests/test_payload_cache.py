@@ -0,0 +1,27 @@
+from django.core.cache import caches
+
+from shapeworks_cloud.core import payload_cache
+from shapeworks_cloud.settings import DevelopmentConfiguration
+
+
+def test_payload_cache_needs_redis():
+    configuration = DevelopmentConfiguration()
+    configuration.REDIS_URL = None
+    assert configuration.payload_cache()['BACKEND'].endswith('DummyCache')
+    configuration.REDIS_URL = 'redis://localhost:6379'
+    assert configuration.payload_cache()['BACKEND'].endswith('RedisCache')
+
+
+def test_payload_invalidated_through_other_cache(mocker):
+    build = mocker.Mock(side_effect=[{'version': 1}, {'version': 2}])
+    assert payload_cache.get_or_build('project', 1, build) == {'version': 1}
+    assert payload_cache.get_or_build('project', 1, build) == {'version': 1}
+
+    # as if another process invalidated the payload
+    other_cache = caches.create_connection(payload_cache.CACHE_ALIAS)
+    assert other_cache is not payload_cache.get_cache()
+    mocker.patch.object(payload_cache, 'get_cache', return_value=other_cache)
+    payload_cache.bump_versions('project', [1])
+    mocker.stopall()
+
+    assert payload_cache.get_or_build('project', 1, build) == {'version': 2}
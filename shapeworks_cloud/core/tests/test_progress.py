@@ -0,0 +1,40 @@
+import pytest
+
+from shapeworks_cloud.core.models import TaskProgress
+from shapeworks_cloud.core.progress import ProgressReporter
+
+
+@pytest.mark.django_db
+def test_progress_reporter_coalesces_writes(django_assert_num_queries, task_progress):
+    reporter = ProgressReporter(task_progress.id, write_interval=60, abort_check_interval=60)
+
+    # the first update is written, and the rest wait for the next write
+    with django_assert_num_queries(1):
+        for line in range(100):
+            reporter.update_message(f'line {line}')
+            reporter.update_percentage(line)
+    task_progress.refresh_from_db()
+    assert (task_progress.message, task_progress.percent_complete) == ('line 0', 0)
+
+    with django_assert_num_queries(1):
+        reporter.report('Next stage')
+    task_progress.refresh_from_db()
+    assert (task_progress.message, task_progress.percent_complete) == ('Next stage', 99)
+
+
+@pytest.mark.django_db
+def test_progress_reporter_keeps_abort(task_progress):
+    reporter = ProgressReporter(task_progress.id, write_interval=0, abort_check_interval=60)
+    TaskProgress.objects.filter(id=task_progress.id).update(abort=True)
+
+    reporter.update_message('still running')
+    task_progress.refresh_from_db()
+    assert task_progress.message == 'still running'
+    assert task_progress.abort
+
+    reporter.abort_check_interval = 0
+    with pytest.raises(TaskProgress.TaskAbortedError):
+        reporter.update_percentage(50)
+    task_progress.refresh_from_db()
+    assert task_progress.abort
+    assert task_progress.percent_complete == 50
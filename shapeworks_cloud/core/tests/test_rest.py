@@ -0,0 +1,589 @@
+import io
+import json
+import re
+import time
+import zipfile
+
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+import pytest
+
+from shapeworks_cloud.core import models, payload_cache, rest, signing, zip_stream
+
+from . import factories
+from .factories import create_analysis, populate_project
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('num_subjects', [1, 10])
+def test_project_download_queries(
+    mocker, django_assert_num_queries, authenticated_api_client, project, num_subjects
+):
+    populate_project(project, num_subjects)
+    url = f'/api/v1/projects/{project.id}/download/'
+
+    # a stale manifest is rebuilt from one query per table, without reading any file
+    read_checksums = mocker.spy(zip_stream, 'read_checksums')
+    with django_assert_num_queries(20):
+        resp = authenticated_api_client.get(url)
+    assert resp.status_code == 200
+    assert len(resp.json()['download_paths']) == 4 * num_subjects
+    read_checksums.assert_not_called()
+
+    # and afterwards read from the stored entries
+    with django_assert_num_queries(2):
+        resp = authenticated_api_client.get(url)
+    assert len(resp.json()['download_paths']) == 4 * num_subjects
+
+
+@pytest.mark.django_db
+def test_dataset_list_summary_counts(
+    django_assert_max_num_queries,
+    authenticated_api_client,
+    dataset_factory,
+    subject_factory,
+    mesh_factory,
+    segmentation_factory,
+):
+    for dataset in dataset_factory.create_batch(5):
+        for subject in subject_factory.create_batch(2, dataset=dataset):
+            mesh_factory.create_batch(3, subject=subject)
+            segmentation_factory.create_batch(2, subject=subject)
+
+    with django_assert_max_num_queries(6) as captured:
+        resp = authenticated_api_client.get('/api/v1/datasets/')
+
+    assert resp.status_code == 200
+    assert [dataset['summary'] for dataset in resp.json()['results']] == [
+        '6 meshes, 4 segmentations'
+    ] * 5
+    # the counts are subqueries, rather than joins of both relations
+    list_query = next(q['sql'] for q in captured if 'core_mesh' in q['sql'])
+    assert 'JOIN "core_mesh"' not in list_query
+    assert 'JOIN "core_segmentation"' not in list_query
+
+
+@pytest.mark.django_db
+def test_dataset_list_etag_reads_page(
+    django_assert_num_queries, authenticated_api_client, dataset_factory
+):
+    datasets = sorted(dataset_factory.create_batch(25), key=lambda dataset: dataset.name)
+    url = '/api/v1/datasets/?page_size=10'
+    etag = authenticated_api_client.get(url)['ETag']
+
+    # the page is revalidated without serializing it, or aggregating over other pages
+    with django_assert_num_queries(4) as captured:
+        resp = authenticated_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 304
+    aggregates = [q['sql'] for q in captured if 'MAX(' in q['sql']]
+    assert aggregates and all(' IN (' in sql for sql in aggregates)
+
+    datasets[15].save()
+    assert authenticated_api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    datasets[5].save()
+    assert authenticated_api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    'endpoint,factory,list_queries,retrieve_queries',
+    [
+        ('groomed-meshes', factories.GroomedMeshFactory, 3, 2),
+        ('groomed-segmentations', factories.GroomedSegmentationFactory, 3, 2),
+        ('optimized-particles', factories.OptimizedParticlesFactory, 3, 2),
+        ('reconstructed-samples', factories.ReconstructedSampleFactory, 6, 5),
+    ],
+)
+@pytest.mark.parametrize('num_rows', [1, 5])
+def test_project_output_queries(
+    django_assert_num_queries,
+    authenticated_api_client,
+    endpoint,
+    factory,
+    list_queries,
+    retrieve_queries,
+    num_rows,
+):
+    rows = factory.create_batch(num_rows)
+
+    # related rows are joined in, rather than fetched per row
+    with django_assert_num_queries(list_queries):
+        resp = authenticated_api_client.get(f'/api/v1/{endpoint}/')
+    assert resp.json()['count'] == num_rows
+
+    with django_assert_num_queries(retrieve_queries):
+        resp = authenticated_api_client.get(f'/api/v1/{endpoint}/{rows[0].id}/')
+    assert resp.json()['id'] == rows[0].id
+    if endpoint == 'reconstructed-samples':
+        assert resp.json()['particles']['groomed_mesh']['anatomy_type'] == 'anatomy_femur'
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('num_projects', [1, 3])
+def test_project_read_queries(
+    django_assert_num_queries,
+    authenticated_api_client,
+    project_factory,
+    landmarks_factory,
+    constraints_factory,
+    num_projects,
+):
+    projects = project_factory.create_batch(num_projects)
+    for project in projects:
+        project.last_cached_analysis = create_analysis(num_modes=10, num_steps=11)
+        project.save()
+        landmarks_factory(project=project, subject__dataset=project.dataset)
+        constraints_factory(project=project, subject__dataset=project.dataset)
+
+    # the analysis tree, landmarks and constraints are prefetched for the whole page
+    with django_assert_num_queries(13):
+        resp = authenticated_api_client.get('/api/v1/projects/')
+    assert len(resp.json()['results']) == num_projects
+    modes = resp.json()['results'][0]['last_cached_analysis']['modes']
+    assert [len(mode['pca_values']) for mode in modes] == [11] * 10
+
+    # a single project is prefetched when its payload is built, and then read from the cache
+    caches['payloads'].clear()
+    with django_assert_num_queries(13):
+        cold = authenticated_api_client.get(f'/api/v1/projects/{projects[0].id}/')
+    with django_assert_num_queries(5):
+        warm = authenticated_api_client.get(f'/api/v1/projects/{projects[0].id}/')
+    assert cold.json() == warm.json()
+    assert len(cold.json()['landmarks']) == 1
+
+
+@pytest.mark.django_db
+def test_dataset_download(
+    mocker,
+    authenticated_api_client,
+    project,
+    subject_factory,
+    mesh_factory,
+    landmarks_factory,
+    constraints_factory,
+):
+    subjects = subject_factory.create_batch(2, dataset=project.dataset)
+    for subject in subjects:
+        mesh_factory(subject=subject)
+        landmarks_factory(subject=subject, project=project)
+        constraints_factory(subject=subject, project=project)
+    url = f'/api/v1/datasets/{project.dataset.id}/download/'
+    delay = mocker.patch.object(rest.build_dataset_snapshot, 'delay')
+
+    resp = authenticated_api_client.get(url)
+    assert resp.status_code == 202
+    assert resp.json()['file'] is None
+    delay.assert_called_once_with(resp.json()['id'])
+    # polling while the snapshot is built queues no second build
+    assert authenticated_api_client.get(url).status_code == 202
+    assert delay.call_count == 1
+
+    rest.build_dataset_snapshot(resp.json()['id'])
+    resp = authenticated_api_client.get(url)
+    assert resp.status_code == 200
+    snapshot = models.DatasetSnapshot.objects.get(id=resp.json()['id'])
+    with zipfile.ZipFile(snapshot.file.open()) as archive:
+        assert archive.testzip() is None
+        contents = {name: archive.read(name) for name in archive.namelist()}
+
+    # the annotations of every subject are kept, under the names swcc writes them
+    expected = {}
+    for subject in subjects:
+        mesh = subject.meshes.get()
+        expected[mesh.file.name.split('/')[-1]] = mesh.file.read()
+        for annotation in [subject.landmarks.get(), subject.constraints.get()]:
+            name = f'{subject.name}_femur_{annotation.default_file_name}'
+            expected[name] = annotation.dump_locations().encode()
+    assert contents == expected
+
+
+def subset_selection(dataset, mesh_factory, segmentation_factory):
+    selected = []
+    for subject in models.Subject.objects.filter(dataset=dataset):
+        for shape in [mesh_factory(subject=subject), segmentation_factory(subject=subject)]:
+            shape_type = 'mesh' if isinstance(shape, models.Mesh) else 'segmentation'
+            selected.append({'id': shape.id, 'subject': subject.id, 'type': shape_type})
+    return selected
+
+
+@pytest.mark.django_db
+def test_dataset_subset(
+    authenticated_api_client, dataset, subject_factory, mesh_factory, segmentation_factory
+):
+    subject_factory.create_batch(2, dataset=dataset)
+    selected = subset_selection(dataset, mesh_factory, segmentation_factory)
+
+    resp = authenticated_api_client.post(
+        f'/api/v1/datasets/{dataset.id}/subset/',
+        {'name': 'subset', 'selected': selected[1:]},
+        format='json',
+    )
+    assert resp.status_code == 200
+    subset = models.Dataset.objects.get(id=resp.json()['id'])
+    assert subset.subjects.count() == 2
+    assert models.Mesh.objects.filter(subject__dataset=subset).count() == 1
+    assert models.Segmentation.objects.filter(subject__dataset=subset).count() == 2
+
+
+@pytest.mark.django_db
+def test_dataset_subset_task(
+    mocker, authenticated_api_client, dataset, subject_factory, mesh_factory, segmentation_factory
+):
+    subject_factory.create_batch(2, dataset=dataset)
+    selected = subset_selection(dataset, mesh_factory, segmentation_factory)
+    mocker.patch.object(rest, 'SUBSET_TASK_THRESHOLD', 3)
+    delay = mocker.patch.object(rest.create_subset, 'delay')
+
+    resp = authenticated_api_client.post(
+        f'/api/v1/datasets/{dataset.id}/subset/',
+        {'name': 'subset', 'selected': selected},
+        format='json',
+    )
+    assert resp.status_code == 202
+    task = resp.json()['subset_task']
+    delay.assert_called_once_with(dataset.id, resp.json()['id'], selected, task['id'])
+
+    # the client polls the task until the copy is done
+    rest.create_subset(*delay.call_args.args)
+    resp = authenticated_api_client.get(f'/api/v1/task-progress/{task["id"]}/')
+    assert resp.json()['percent_complete'] == 100
+    assert not resp.json()['error']
+    subset = models.Dataset.objects.get(id=delay.call_args.args[1])
+    assert models.Mesh.objects.filter(subject__dataset=subset).count() == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('invalid', ['other_dataset', 'other_subject', 'missing', 'image'])
+def test_dataset_subset_invalid_selection(
+    mocker,
+    authenticated_api_client,
+    dataset,
+    subject_factory,
+    mesh_factory,
+    segmentation_factory,
+    invalid,
+):
+    subject_factory.create_batch(2, dataset=dataset)
+    selected = subset_selection(dataset, mesh_factory, segmentation_factory)
+    other = mesh_factory()
+    selected.append(
+        {
+            'other_dataset': {'id': other.id, 'subject': other.subject_id, 'type': 'mesh'},
+            'other_subject': dict(selected[0], subject=selected[2]['subject']),
+            'missing': {'id': other.id + 1, 'type': 'mesh'},
+            'image': {'id': other.id, 'type': 'image'},
+        }[invalid]
+    )
+    delay = mocker.patch.object(rest.create_subset, 'delay')
+    datasets = models.Dataset.objects.count()
+
+    resp = authenticated_api_client.post(
+        f'/api/v1/datasets/{dataset.id}/subset/',
+        {'name': 'subset', 'selected': selected},
+        format='json',
+    )
+    assert resp.status_code == 400
+    assert resp.json()['unknown_shapes'] == [selected[-1]]
+    assert models.Dataset.objects.count() == datasets
+    delay.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_bulk_create(authenticated_api_client, dataset):
+    version = dataset.contents_version
+    resp = authenticated_api_client.post(
+        '/api/v1/subjects/bulk/',
+        [{'name': f'subject_{i}', 'dataset': dataset.id} for i in range(3)],
+        format='json',
+    )
+    assert resp.status_code == 201
+    created = models.Subject.objects.filter(dataset=dataset).order_by('id')
+    assert [row['id'] for row in resp.json()] == [subject.id for subject in created]
+    assert [subject.name for subject in created] == ['subject_0', 'subject_1', 'subject_2']
+    # post_bulk_create is sent for the whole batch
+    dataset.refresh_from_db()
+    assert dataset.contents_version == version + 1
+
+    resp = authenticated_api_client.post(
+        '/api/v1/subjects/bulk/', {'name': 'subject', 'dataset': dataset.id}, format='json'
+    )
+    assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('stored', [False, True])
+def test_bulk_create_duplicates(authenticated_api_client, project, subject, stored):
+    row = {
+        'project': project.id,
+        'subject': subject.id,
+        'anatomy_type': 'anatomy_femur',
+        'locations': [[0.0, 0.0, 0.0]],
+    }
+    if stored:
+        authenticated_api_client.post('/api/v1/landmarks/bulk/', [row], format='json')
+        rows = [dict(row, anatomy_type='anatomy_tibia'), row]
+    else:
+        rows = [row, dict(row, anatomy_type='anatomy_tibia'), row]
+
+    resp = authenticated_api_client.post('/api/v1/landmarks/bulk/', rows, format='json')
+    assert resp.status_code == 400
+    assert 'must make a unique set' in str(resp.json())
+    assert models.Landmarks.objects.count() == int(stored)
+
+
+@pytest.mark.django_db
+def test_project_bundle(
+    authenticated_api_client, project, image_factory, reconstructed_sample_factory
+):
+    populate_project(project, 2)
+    subject, other = models.Subject.objects.filter(dataset=project.dataset).order_by('name')
+    image = image_factory(subject=subject)
+    particles = models.OptimizedParticles.objects.get(subject=subject)
+    sample = reconstructed_sample_factory(project=project, particles=particles)
+
+    resp = authenticated_api_client.get(f'/api/v1/projects/{project.id}/bundle/')
+    assert resp.status_code == 200
+    bundle = resp.json()
+    assert bundle['id'] == project.id
+    assert [s['id'] for s in bundle['subjects']] == [subject.id, other.id]
+
+    first = bundle['subjects'][0]
+    assert first['images']['ct']['id'] == image.id
+    femur = first['anatomies']['anatomy_femur']
+    mesh = subject.meshes.get()
+    assert femur['shape'] == {'type': 'mesh', 'id': mesh.id, 'url': femur['shape']['url']}
+    assert femur['groomed']['id'] == models.GroomedMesh.objects.get(mesh=mesh).id
+    assert femur['particles']['id'] == particles.id
+    assert [r['id'] for r in femur['reconstructed']] == [sample.id]
+    # every file comes back signed
+    for url in [
+        first['images']['ct']['url'],
+        femur['shape']['url'],
+        femur['groomed']['url'],
+        femur['particles']['local'],
+        femur['reconstructed'][0]['url'],
+    ]:
+        assert url.startswith('http')
+    assert bundle['subjects'][1]['anatomies']['anatomy_femur']['reconstructed'] == []
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('endpoint', ['landmarks', 'constraints'])
+def test_project_annotations_unknown_subjects(
+    authenticated_api_client, project, subject_factory, endpoint
+):
+    subject = subject_factory(dataset=project.dataset)
+    other_subject = subject_factory()
+    url = f'/api/v1/projects/{project.id}/{endpoint}/'
+    locations = [[0, 0, 0]] if endpoint == 'landmarks' else {'planes': []}
+
+    resp = authenticated_api_client.post(
+        url,
+        {
+            'locations': {
+                str(subject.id): {'anatomy_femur': locations},
+                'abc': {'anatomy_femur': locations},
+                str(other_subject.id): {'anatomy_femur': locations},
+            }
+        },
+        format='json',
+    )
+    assert resp.status_code == 400
+    assert resp.json() == {'unknown_subjects': ['abc', str(other_subject.id)]}
+    assert not project.landmarks.exists() and not project.constraints.exists()
+
+    resp = authenticated_api_client.patch(
+        url, {'locations': {str(subject.id): 'anatomy_femur'}}, format='json'
+    )
+    assert resp.status_code == 400
+
+    resp = authenticated_api_client.patch(
+        url, {'locations': {str(subject.id): {'anatomy_femur': locations}}}, format='json'
+    )
+    assert resp.status_code == 200
+    assert authenticated_api_client.get(url).json() == {
+        str(subject.id): {'anatomy_femur': locations}
+    }
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('endpoint', ['landmarks', 'constraints'])
+def test_project_annotations_set_replaces(
+    mocker, authenticated_api_client, project, subject_factory, endpoint
+):
+    subject, other_subject = subject_factory.create_batch(2, dataset=project.dataset)
+    url = f'/api/v1/projects/{project.id}/{endpoint}/'
+    locations = [[0, 0, 0]] if endpoint == 'landmarks' else {'planes': []}
+    both = {
+        str(subject.id): {'anatomy_femur': locations},
+        str(other_subject.id): {'anatomy_femur': locations},
+    }
+    authenticated_api_client.post(url, {'info': [], 'locations': both}, format='json')
+    assert authenticated_api_client.get(url).json() == both
+    one = {str(subject.id): {'anatomy_femur': locations}}
+
+    model = models.Landmarks if endpoint == 'landmarks' else models.Constraints
+
+    def bump_contents_version(**lookup):
+        # the rows outside of the new set are deleted with the writes, before the invalidations
+        assert not model.objects.filter(subject=other_subject).exists()
+
+    invalidations = mocker.patch.object(
+        models.Dataset, 'bump_contents_version', side_effect=bump_contents_version
+    )
+    resp = authenticated_api_client.post(url, {'info': [], 'locations': one}, format='json')
+    assert resp.status_code == 200
+    assert invalidations.called
+    assert authenticated_api_client.get(url).json() == one
+
+
+@pytest.mark.django_db
+def test_project_export_resume(mocker, authenticated_api_client, project):
+    populate_project(project, 3)
+    url = f'/api/v1/projects/{project.id}/export.zip/'
+    # the first export queues a task to store the checksums of the manifest files
+    delay = mocker.patch.object(rest.store_manifest_checksums, 'delay')
+    full = b''.join(authenticated_api_client.get(url).streaming_content)
+    delay.assert_called_once_with(project.id)
+    rest.store_manifest_checksums(project.id)
+    assert not project.manifest_entries.filter(crc__isnull=True).exists()
+    with zipfile.ZipFile(io.BytesIO(full)) as archive:
+        assert archive.testzip() is None
+        names = archive.namelist()
+        expected = {entry.path: entry.file.read() for entry in project.manifest_entries.all()}
+        assert {name: archive.read(name) for name in names[1:]} == expected
+
+    # resume halfway through the last file
+    spool_entry = mocker.spy(zip_stream, 'spool_entry')
+    with zipfile.ZipFile(io.BytesIO(full)) as archive:
+        last = archive.infolist()[-1]
+    start = last.header_offset + len(full) // 100
+    resp = authenticated_api_client.get(url, HTTP_RANGE=f'bytes={start}-')
+    assert resp.status_code == 206
+    remainder = b''.join(resp.streaming_content)
+    with zipfile.ZipFile(io.BytesIO(full[:start] + remainder)) as archive:
+        assert archive.testzip() is None
+
+    # the stored crcs spare reading the files before the range, except the project file
+    assert [call.args[0].name for call in spool_entry.call_args_list] == [names[0], names[-1]]
+
+
+@pytest.mark.django_db
+def test_project_cached_payload_url_validity(mocker, authenticated_api_client, project):
+    project.last_cached_analysis = create_analysis(num_modes=2, num_steps=3)
+    project.save()
+    lifetime = 2 * signing.bucket_length()
+    clock = mocker.patch.object(time, 'time')
+    # a signed URL is valid for lifetime seconds from when it is signed
+    mocker.patch.object(
+        default_storage, 'url', side_effect=lambda name: f'{name}?expires={clock() + lifetime}'
+    )
+
+    def remaining_validity(payload):
+        expiries = re.findall(r'\?expires=(\d+)', json.dumps(payload))
+        assert len(expiries) == 1 + 2 * 3 + 2
+        return min(int(expires) for expires in expiries) - clock()
+
+    url = f'/api/v1/projects/{project.id}/'
+    # the URLs are signed at the start of a bucket, and reused by a payload built at its end
+    clock.return_value = 1000 * lifetime
+    assert remaining_validity(authenticated_api_client.get(url).json()) == lifetime
+    caches['payloads'].clear()
+    clock.return_value += lifetime // 2 - 1
+    authenticated_api_client.get(url)
+
+    # served from the cache just before the payload expires
+    clock.return_value += lifetime // 2 - 1
+    assert remaining_validity(authenticated_api_client.get(url).json()) >= lifetime // 2
+    assert payload_cache.get_stats()['hits'] == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('endpoint,order_key', [('subjects', 'name'), ('meshes', 'subject')])
+def test_cursor_pagination_keeps_view_order(
+    authenticated_api_client, dataset, subject_factory, mesh_factory, endpoint, order_key
+):
+    # created in reverse name order, so that the id order differs from the view's
+    subjects = [subject_factory(dataset=dataset, name=f'subject_{n}') for n in reversed(range(7))]
+    for subject in reversed(subjects):
+        mesh_factory.create_batch(2, subject=subject)
+    expected = authenticated_api_client.get(f'/api/v1/{endpoint}/').json()['results']
+    assert [row['id'] for row in expected] != sorted(row['id'] for row in expected)
+
+    rows = []
+    url = f'/api/v1/{endpoint}/?pagination=cursor&page_size=3'
+    while url:
+        page = authenticated_api_client.get(url).json()
+        assert 'count' not in page and len(page['results']) <= 3
+        rows += page['results']
+        url = page['next']
+    # ties in the view's order are broken by id
+    assert [row[order_key] for row in rows] == [row[order_key] for row in expected]
+    assert sorted(row['id'] for row in rows) == sorted(row['id'] for row in expected)
+
+
+@pytest.mark.django_db
+def test_cursor_pagination_page_size(mocker, authenticated_api_client, subject_factory):
+    subject_factory.create_batch(5)
+    mocker.patch.object(rest.KeysetPagination, 'max_page_size', 3)
+
+    page = authenticated_api_client.get('/api/v1/subjects/?pagination=cursor&page_size=100')
+    assert len(page.json()['results']) == 3
+    assert page.json()['next']
+
+
+@pytest.mark.django_db
+def test_page_number_pagination_by_default(authenticated_api_client, subject_factory):
+    subject_factory.create_batch(5)
+
+    page = authenticated_api_client.get('/api/v1/subjects/?page_size=2&page=3').json()
+    assert page['count'] == 5
+    assert len(page['results']) == 1
+    assert page['next'] is None and 'page=2' in page['previous']
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('num_rows', [1, 5])
+def test_deepssm_read_nests_project(
+    django_assert_num_queries,
+    authenticated_api_client,
+    project,
+    deep_ssm_testing_data_factory,
+    num_rows,
+):
+    deep_ssm_testing_data_factory.create_batch(num_rows, project=project)
+    url = '/api/v1/deepssm-testing-data/'
+
+    # the project is joined in, rather than fetched per row
+    with django_assert_num_queries(2):
+        rows = authenticated_api_client.get(url).json()['results']
+    assert [row['project']['id'] for row in rows] == [project.id] * num_rows
+    assert rows[0]['project']['name'] == project.name
+
+    rows = authenticated_api_client.get(url, {'omit': 'project'}).json()['results']
+    assert 'project' not in rows[0] and rows[0]['mesh']
+
+
+@pytest.mark.django_db
+def test_sparse_fields_skip_signing(mocker, authenticated_api_client, mesh_factory):
+    mesh = mesh_factory()
+    sign_names = mocker.spy(signing, 'sign_names')
+
+    resp = authenticated_api_client.get('/api/v1/meshes/', {'fields': 'id,anatomy_type'})
+    assert resp.json()['results'] == [{'id': mesh.id, 'anatomy_type': 'anatomy_femur'}]
+    resp = authenticated_api_client.get(f'/api/v1/meshes/{mesh.id}/', {'omit': 'file'})
+    assert 'file' not in resp.json() and resp.json()['subject'] == mesh.subject_id
+    assert not sign_names.called
+
+    resp = authenticated_api_client.get(f'/api/v1/meshes/{mesh.id}/')
+    assert resp.json()['file'] and sign_names.called
+
+
+@pytest.mark.django_db
+def test_sparse_fields_bypass_payload_cache(authenticated_api_client, project):
+    resp = authenticated_api_client.get(f'/api/v1/projects/{project.id}/', {'fields': 'id,name'})
+    assert resp.json() == {'id': project.id, 'name': project.name}
+    assert payload_cache.get_stats()['misses'] == 0
+
+    authenticated_api_client.get(f'/api/v1/projects/{project.id}/')
+    assert payload_cache.get_stats()['misses'] == 1
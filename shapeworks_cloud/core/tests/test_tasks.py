@@ -0,0 +1,16 @@
+import pytest
+
+from shapeworks_cloud.core import models
+from shapeworks_cloud.core.tasks import index_by_basename
+
+
+@pytest.mark.django_db
+def test_index_by_basename_long_names(mesh_factory):
+    long_name = 'm' * 300 + '.vtk'
+    mesh = mesh_factory(file__filename=long_name)
+    mesh_factory(file__filename='other.vtk')
+
+    assert mesh.file_basename == long_name
+    index = index_by_basename(models.Mesh.objects.all(), [long_name, 'missing.vtk'])
+    assert list(index) == [long_name]
+    assert index[long_name].id == mesh.id
@@ -0,0 +1,292 @@
+"""
+Stream an uncompressed zip64 archive of stored files.
+
+Entries are written without compression and with fixed timestamps, so the layout of the
+archive depends only on the entry names and sizes. This lets the total length and the offset
+of every entry be computed before any file is read, which is what makes Content-Length and
+Range requests possible. CRCs are written in a data descriptor after each file and repeated in
+the central directory. Unless they are known up front, they are computed while the files are
+read, so a range that includes the central directory then reads every file.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import struct
+from tempfile import SpooledTemporaryFile
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import zlib
+
+from django.db.models.fields.files import FieldFile
+
+CHUNK_SIZE = 1024 * 1024
+# files larger than this are spooled to disk while they wait to be sent
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+PREFETCH_COUNT = 4
+
+# 1980-01-01 00:00:00, the earliest time a zip header can express
+DOS_TIME = 0
+DOS_DATE = (0 << 9) | (1 << 5) | 1
+# bit 3: sizes and crc follow the data, bit 11: names are utf-8
+FLAGS = 0x0808
+VERSION = 45
+ZIP64_MARKER = 0xFFFFFFFF
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+LOCAL_ZIP64_EXTRA = struct.Struct('<HHQQ')
+DATA_DESCRIPTOR = struct.Struct('<IIQQ')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+CENTRAL_ZIP64_EXTRA = struct.Struct('<HHQQQ')
+ZIP64_END = struct.Struct('<IQHHIIQQQQ')
+ZIP64_LOCATOR = struct.Struct('<IIQI')
+END = struct.Struct('<IHHHHIIH')
+
+
+class ZipEntry(NamedTuple):
+    name: str
+    size: int
+    # opens a binary file-like object with the entry contents
+    open: Callable
+    crc: Optional[int] = None
+
+
+class ZipLayout:
+    def __init__(self, entries: List[ZipEntry]):
+        self.entries = entries
+        self.names = [entry.name.encode() for entry in entries]
+        self.offsets = []
+        offset = 0
+        for name, entry in zip(self.names, entries):
+            self.offsets.append(offset)
+            offset += self.local_header_size(name) + entry.size + DATA_DESCRIPTOR.size
+        self.central_directory_offset = offset
+        self.central_directory_size = sum(
+            CENTRAL_HEADER.size + len(name) + CENTRAL_ZIP64_EXTRA.size for name in self.names
+        )
+        self.size = (
+            self.central_directory_offset
+            + self.central_directory_size
+            + ZIP64_END.size
+            + ZIP64_LOCATOR.size
+            + END.size
+        )
+
+    @staticmethod
+    def local_header_size(name: bytes):
+        return LOCAL_HEADER.size + len(name) + LOCAL_ZIP64_EXTRA.size
+
+    def entry_range(self, index: int) -> Tuple[int, int]:
+        """Return the byte range covered by an entry's header, data and descriptor."""
+        start = self.offsets[index]
+        end = start + self.local_header_size(self.names[index])
+        return start, end + self.entries[index].size + DATA_DESCRIPTOR.size
+
+    def local_header(self, index: int) -> bytes:
+        name, size = self.names[index], self.entries[index].size
+        return (
+            LOCAL_HEADER.pack(
+                0x04034B50,
+                VERSION,
+                FLAGS,
+                0,  # stored
+                DOS_TIME,
+                DOS_DATE,
+                0,  # crc, in the data descriptor
+                ZIP64_MARKER,
+                ZIP64_MARKER,
+                len(name),
+                LOCAL_ZIP64_EXTRA.size,
+            )
+            + name
+            + LOCAL_ZIP64_EXTRA.pack(0x0001, 16, size, size)
+        )
+
+    def data_descriptor(self, index: int, crc: int) -> bytes:
+        size = self.entries[index].size
+        return DATA_DESCRIPTOR.pack(0x08074B50, crc, size, size)
+
+    def central_directory(self, crcs: List[int]) -> bytes:
+        records = []
+        for index, (name, entry) in enumerate(zip(self.names, self.entries)):
+            records.append(
+                CENTRAL_HEADER.pack(
+                    0x02014B50,
+                    VERSION,
+                    VERSION,
+                    FLAGS,
+                    0,
+                    DOS_TIME,
+                    DOS_DATE,
+                    crcs[index],
+                    ZIP64_MARKER,
+                    ZIP64_MARKER,
+                    len(name),
+                    CENTRAL_ZIP64_EXTRA.size,
+                    0,  # comment length
+                    0,  # disk number
+                    0,  # internal attributes
+                    0,  # external attributes
+                    ZIP64_MARKER,
+                )
+                + name
+                + CENTRAL_ZIP64_EXTRA.pack(0x0001, 24, entry.size, entry.size, self.offsets[index])
+            )
+        zip64_end_offset = self.central_directory_offset + self.central_directory_size
+        count = len(self.entries)
+        records.append(
+            ZIP64_END.pack(
+                0x06064B50,
+                ZIP64_END.size - 12,
+                VERSION,
+                VERSION,
+                0,
+                0,
+                count,
+                count,
+                self.central_directory_size,
+                self.central_directory_offset,
+            )
+        )
+        records.append(ZIP64_LOCATOR.pack(0x07064B50, 0, zip64_end_offset, 1))
+        records.append(
+            END.pack(
+                0x06054B50,
+                0,
+                0,
+                min(count, 0xFFFF),
+                min(count, 0xFFFF),
+                ZIP64_MARKER,
+                ZIP64_MARKER,
+                0,
+            )
+        )
+        return b''.join(records)
+
+
+def storage_layout(
+    files: Dict[str, FieldFile], checksums: Optional[Dict[str, Tuple[int, int]]] = None
+) -> ZipLayout:
+    """
+    Lay out an archive of stored files, keyed by their path in the archive.
+
+    Files without a (size, crc) in checksums have their size read from storage.
+    """
+    known = checksums or {}
+    unknown = [path for path in files if path not in known]
+    with ThreadPoolExecutor(max_workers=PREFETCH_COUNT) as executor:
+        sizes = executor.map(lambda path: files[path].storage.size(files[path].name), unknown)
+        layout_checksums = {**known, **{path: (size, None) for path, size in zip(unknown, sizes)}}
+    return ZipLayout(
+        [
+            ZipEntry(
+                path,
+                layout_checksums[path][0],
+                partial(field_file.storage.open, field_file.name, 'rb'),
+                layout_checksums[path][1],
+            )
+            for path, field_file in files.items()
+        ]
+    )
+
+
+def read_checksum(field_file: FieldFile) -> Tuple[int, int]:
+    size = crc = 0
+    with field_file.storage.open(field_file.name, 'rb') as f:
+        for chunk in iter(partial(f.read, CHUNK_SIZE), b''):
+            size += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+    return size, crc
+
+
+def read_checksums(files: List[FieldFile]) -> List[Tuple[int, int]]:
+    """Return the (size, crc) of each stored file, reading them in parallel."""
+    with ThreadPoolExecutor(max_workers=PREFETCH_COUNT) as executor:
+        return list(executor.map(read_checksum, files))
+
+
+def spool_entry(entry: ZipEntry):
+    """Copy an entry into a spooled temporary file, returning it with its crc."""
+    spool = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    crc = 0
+    with entry.open() as f:
+        for chunk in iter(partial(f.read, CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+            spool.write(chunk)
+    spool.seek(0)
+    return spool, crc
+
+
+def close_spool(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result()[0].close()
+
+
+def stream_zip(
+    layout: ZipLayout, start: int = 0, end: Optional[int] = None, max_workers=PREFETCH_COUNT
+) -> Iterator[bytes]:
+    """
+    Yield the bytes of the archive from start up to and including end.
+
+    Files are read from storage by a thread pool, at most max_workers ahead of the one being
+    sent. Files outside the range are only read when the central directory is in the range
+    and their crc is not known.
+    """
+    end = layout.size - 1 if end is None else end
+    needs_crcs = end >= layout.central_directory_offset
+    position = 0
+
+    def emit(data: bytes):
+        nonlocal position
+        chunk_start, position = position, position + len(data)
+        if position <= start or chunk_start > end:
+            return b''
+        return data[max(start - chunk_start, 0) : end + 1 - chunk_start]
+
+    needed = [
+        index
+        for index in range(len(layout.entries))
+        if (needs_crcs and layout.entries[index].crc is None)
+        or (layout.entry_range(index)[1] > start and layout.entry_range(index)[0] <= end)
+    ]
+    crcs = [entry.crc or 0 for entry in layout.entries]
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = {}
+    queue = iter(needed)
+    try:
+        for index in queue:
+            pending[index] = executor.submit(spool_entry, layout.entries[index])
+            if len(pending) >= max_workers:
+                break
+
+        for index in range(len(layout.entries)):
+            if index not in pending:
+                # the entry is not in the range, and its crc is known if needed
+                position = layout.entry_range(index)[1]
+                continue
+            spool, crcs[index] = pending.pop(index).result()
+            next_index = next(queue, None)
+            if next_index is not None:
+                pending[next_index] = executor.submit(spool_entry, layout.entries[next_index])
+            with spool:
+                data = emit(layout.local_header(index))
+                if data:
+                    yield data
+                for chunk in iter(partial(spool.read, CHUNK_SIZE), b''):
+                    data = emit(chunk)
+                    if data:
+                        yield data
+            data = emit(layout.data_descriptor(index, crcs[index]))
+            if data:
+                yield data
+            if position > end:
+                return
+    finally:
+        # the client may have gone away, or the range may end early; files still being read
+        # are closed once they are, rather than holding up the response
+        for future in pending.values():
+            future.cancel()
+            future.add_done_callback(close_spool)
+        executor.shutdown(wait=False)
+
+    data = emit(layout.central_directory(crcs))
+    if data:
+        yield data
@@ -30,6 +30,65 @@ class ShapeworksCloudMixin(ConfigMixin):
 
     DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
+    # A redis:// URL for the caches and the channel layer shared by every process. Without one,
+    # each process keeps bounded local-memory caches, payloads are not cached at all, and task
+    # progress is not pushed to websockets. Bound redis with maxmemory and allkeys-lru eviction.
+    REDIS_URL = values.Value(None)
+    PAYLOAD_CACHE_MAX_ENTRIES = values.IntegerValue(1000)
+    PAYLOAD_CACHE_TIMEOUT = values.IntegerValue(24 * 60 * 60)
+    SIGNED_URL_CACHE_MAX_ENTRIES = values.IntegerValue(50000)
+
+    WRITE_ACCESS_LOG_RETENTION_DAYS = values.IntegerValue(90)
+
+    def local_cache(self, name, max_entries, **options):
+        return {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': name,
+            'OPTIONS': {'MAX_ENTRIES': max_entries},
+            **options,
+        }
+
+    def shared_cache(self, name, max_entries, **options):
+        if self.REDIS_URL:
+            return {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': self.REDIS_URL,
+                'KEY_PREFIX': name,
+                **options,
+            }
+        return self.local_cache(name, max_entries, **options)
+
+    def payload_cache(self, **options):
+        # payloads are invalidated by version counters that every process must see, so
+        # without redis they are rebuilt on every request
+        if self.REDIS_URL:
+            return self.shared_cache('payloads', self.PAYLOAD_CACHE_MAX_ENTRIES, **options)
+        return {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+
+    @property
+    def CACHES(self):  # noqa: N802
+        return {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            # payloads hold unsigned file names, signed when served, and are replaced through
+            # their version counters; the timeout only frees the entries no longer read
+            'payloads': self.payload_cache(TIMEOUT=self.PAYLOAD_CACHE_TIMEOUT),
+            # entries are stored with the time left until their URLs are renewed
+            'signed_urls': self.shared_cache('signed_urls', self.SIGNED_URL_CACHE_MAX_ENTRIES),
+        }
+
+    @property
+    def CHANNEL_LAYERS(self):  # noqa: N802
+        # task progress is published from celery workers, so it only reaches websocket clients
+        # through redis; without it, nothing is published and the web client polls
+        if self.REDIS_URL:
+            return {
+                'default': {
+                    'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                    'CONFIG': {'hosts': [self.REDIS_URL], 'prefix': 'shapeworks'},
+                }
+            }
+        return {}
+
     @staticmethod
     def before_binding(configuration: ComposedConfiguration) -> None:
         # Install local apps first, to ensure any overridden resources are found first
@@ -55,7 +114,11 @@ class DevelopmentConfiguration(ShapeworksCloudMixin, DevelopmentBaseConfiguratio
 
 
 class TestingConfiguration(ShapeworksCloudMixin, TestingBaseConfiguration):
-    pass
+    # the tests run in a single process
+    CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+    def payload_cache(self, **options):
+        return self.local_cache('payloads', self.PAYLOAD_CACHE_MAX_ENTRIES, **options)
 
 
 class ProductionConfiguration(ShapeworksCloudMixin, ProductionBaseConfiguration):
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from contextlib import contextmanager
-from typing import Any, Dict, List, Optional
+import json
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 from requests_toolbelt.sessions import BaseUrlSession
@@ -11,6 +12,9 @@ from urllib3.util.retry import Retry
 
 _session_stack: List[SwccSession] = []
 
+# number of GET responses kept for revalidation with their ETags
+ETAG_CACHE_SIZE = 256
+
 
 def current_session():
     global _session_stack
@@ -42,6 +46,7 @@ class SwccSession(BaseUrlSession):
         super().__init__(base_url=base_url, **kwargs)
 
         self.cache: Dict[Any, Dict[int, Any]] = defaultdict(dict)
+        self.etag_cache: OrderedDict[Tuple[str, str], requests.Response] = OrderedDict()
         retry = Retry()
         adapter = requests.adapters.HTTPAdapter(max_retries=retry)
         self.mount(base_url, adapter)
@@ -56,6 +61,27 @@ class SwccSession(BaseUrlSession):
         if token:
             self.set_token(token)
 
+    def request(self, method, url, *args, **kwargs):
+        """Revalidate repeated GET requests with If-None-Match instead of downloading again."""
+        headers = kwargs.get('headers') or {}
+        if method.upper() != 'GET' or args or kwargs.get('stream') or 'Range' in headers:
+            return super().request(method, url, *args, **kwargs)
+
+        key = (url, json.dumps(kwargs.get('params'), sort_keys=True, default=str))
+        cached = self.etag_cache.get(key)
+        if cached is not None:
+            kwargs['headers'] = {**headers, 'If-None-Match': cached.headers['ETag']}
+        r = super().request(method, url, **kwargs)
+        if r.status_code == 304 and cached is not None:
+            self.etag_cache.move_to_end(key)
+            return cached
+        if r.status_code == 200 and 'ETag' in r.headers:
+            self.etag_cache[key] = r
+            self.etag_cache.move_to_end(key)
+            if len(self.etag_cache) > ETAG_CACHE_SIZE:
+                self.etag_cache.popitem(last=False)
+        return r
+
     def set_token(self, token: str):
         self.headers['Authorization'] = f'Token {token}'
 
@@ -1,6 +1,6 @@
 import inspect
 from pathlib import Path
-from typing import Any, Dict, Iterator, Optional, Type, TypeVar, Union
+from typing import Any, Dict, Iterator, List, Optional, Type, TypeVar, Union
 
 from pydantic.v1 import AnyHttpUrl, BaseModel, PrivateAttr, parse_obj_as, validator
 import requests
@@ -10,6 +10,11 @@ from .file import File
 
 ModelType = TypeVar('ModelType', bound='ApiModel')
 
+# page size requested when listing with cursor pagination
+LIST_PAGE_SIZE = 1000
+# number of entities sent per bulk create request
+BULK_CREATE_BATCH_SIZE = 500
+
 
 class ApiModel(BaseModel):
     _endpoint: Optional[str] = None
@@ -50,7 +55,8 @@ class ApiModel(BaseModel):
 
         session = current_session()
 
-        filter: Dict[str, Any] = {}
+        # cursor pages stay fast at any depth; older servers ignore these parameters
+        filter: Dict[str, Any] = {'pagination': 'cursor', 'page_size': LIST_PAGE_SIZE}
         replace: Dict[str, ApiModel] = {}
         for key, value in kwargs.items():
             if isinstance(value, ApiModel):
@@ -150,6 +156,27 @@ class ApiModel(BaseModel):
             self.creator = r.json()['creator']
         return self
 
+    @classmethod
+    def bulk_create(cls: Type[ModelType], instances: List[ModelType]) -> List[ModelType]:
+        from .utils import raise_for_status
+
+        session = current_session()
+
+        for start in range(0, len(instances), BULK_CREATE_BATCH_SIZE):
+            batch = instances[start : start + BULK_CREATE_BATCH_SIZE]
+            for instance in batch:
+                instance.assert_local()
+            r: requests.Response = session.post(
+                f'{cls._endpoint}/bulk/', json=[instance.to_json() for instance in batch]
+            )
+            raise_for_status(r)
+            for instance, json in zip(batch, r.json()):
+                instance.id = json['id']
+                for key, file in instance._files.items():
+                    if key in json:
+                        file.url = parse_obj_as(AnyHttpUrl, json[key])
+        return instances
+
     def download_files(self, path: Union[str, Path]) -> Iterator[Path]:
         for file in self._files.values():
             yield file.download(path)
@@ -1,10 +1,14 @@
 import re
+from tempfile import TemporaryDirectory
 from typing import Iterator
+from zipfile import ZipFile
 
 from pydantic.v1 import Field
 
+from ..api import current_session
 from .api_model import ApiModel
-from .utils import logger
+from .file import File
+from .utils import logger, raise_for_status
 
 
 class Dataset(ApiModel):
@@ -110,5 +114,23 @@ class Dataset(ApiModel):
         return self.create()
 
     def download(self, path):
+        """
+        Download every file of the dataset into path.
+
+        The server's snapshot archive is used when it is ready. Otherwise the files are
+        fetched one subject at a time, and the server starts building the snapshot for
+        the next download.
+        """
+        self.assert_remote()
+        session = current_session()
+        r = session.get(f'{self._endpoint}/{self.id}/download/')
+        raise_for_status(r)
+        snapshot = r.json()
+        if snapshot['file']:
+            with TemporaryDirectory() as temp_dir:
+                archive = File(snapshot['file']).download(temp_dir)
+                with ZipFile(archive) as zip_file:
+                    zip_file.extractall(path)
+            return
         for subject in self.subjects:
             subject.download(path)
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
+import json
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Any, List, Optional, Union
 
 from pydantic.v1 import Field
 
@@ -96,21 +97,47 @@ class Landmarks(ApiModel):
     _endpoint = 'landmarks'
     _file_fields = {'file': 'core.Landmarks.file'}
 
-    file_source: Union[str, Path]
+    file_source: Optional[Union[str, Path]] = None
+    locations: Optional[Any] = None
     subject: Subject
     anatomy_type: str = Field(min_length=1)
     project: Project
 
+    def write_locations(self, path: Union[str, Path]) -> Path:
+        """Write the locations in the landmarks file format, for rows stored without a file."""
+        anatomy = self.anatomy_type.replace('anatomy_', '')
+        return write_file(
+            path,
+            f'{self.subject.name}_{anatomy}_landmarks.csv',
+            '\n'.join(' '.join(str(n) for n in loc) for loc in self.locations or []),
+        )
+
 
 class Constraints(ApiModel):
     _endpoint = 'constraints'
     _file_fields = {'file': 'core.Constraints.file'}
 
-    file_source: Union[str, Path]
+    file_source: Optional[Union[str, Path]] = None
+    locations: Optional[Any] = None
     subject: Subject
     anatomy_type: str = Field(min_length=1)
     project: Project
 
+    def write_locations(self, path: Union[str, Path]) -> Path:
+        """Write the locations in the constraints file format, for rows stored without a file."""
+        anatomy = self.anatomy_type.replace('anatomy_', '')
+        return write_file(
+            path, f'{self.subject.name}_{anatomy}_constraints.json', json.dumps(self.locations)
+        )
+
+
+def write_file(path: Union[str, Path], file_name: str, contents: str) -> Path:
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    path = path / file_name
+    path.write_text(contents)
+    return path
+
 
 class CachedAnalysisGroup(ApiModel):
     _endpoint = 'cached-analysis-group'
@@ -3,7 +3,7 @@ from __future__ import annotations
 import json
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Any, Dict, Iterator, Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Type, Union
 import warnings
 
 from pydantic.v1 import BaseModel
@@ -61,29 +61,29 @@ class ProjectFileIO(BaseModel, FileIO):
         data = self.interpret_data(contents['data'])
         if create:
             print(f'Uploading files for {len(data)} subjects...')
-            i = 0
-            total_progress_steps = len(data)
-            print_progress_bar(i, total_progress_steps)
-            for [subject, objects_by_domain] in data:
-                i += 1
-                self.create_objects_for_subject(subject, objects_by_domain)
-                print_progress_bar(i, total_progress_steps)
+            self.create_objects(data)
             print()
         return data
 
     def interpret_data(self, input_data):
         output_data = []
+        new_subjects = []
+        # subjects are listed once, and new ones registered so that entries sharing a name
+        # share the subject
+        subjects_by_name: Dict[str, Subject] = {}
+        for subject in self.project.dataset.subjects:
+            subjects_by_name.setdefault(subject.name, subject)
         for entry in input_data:
-            subjects = [s for s in self.project.dataset.subjects if s.name == entry.get('name')]
-            if len(subjects) > 0:
-                subject = subjects[0]
-            else:
+            subject = subjects_by_name.get(entry.get('name'))
+            if subject is None:
                 groups_dict = {
                     k.replace('group_', ''): v for k, v in entry.items() if k.startswith('group_')
                 }
                 subject = Subject(
                     name=entry.get('name'), groups=groups_dict, dataset=self.project.dataset
-                ).create()
+                )
+                subjects_by_name[subject.name] = subject
+                new_subjects.append(subject)
 
             objects_by_domain: Dict[str, Dict] = {}
             for key in entry.keys():
@@ -111,6 +111,7 @@ class ProjectFileIO(BaseModel, FileIO):
                     objects_by_domain,
                 ]
             )
+        Subject.bulk_create(new_subjects)
         return output_data
 
     def create_objects_for_subject(
@@ -118,6 +119,16 @@ class ProjectFileIO(BaseModel, FileIO):
         subject,
         objects_by_domain,
     ):
+        self.create_objects([[subject, objects_by_domain]])
+
+    def create_objects(self, data):
+        """
+        Create the objects of every subject in data.
+
+        Objects are sent in bulk, one phase at a time, since groomed shapes refer to
+        their original shapes and particles refer to their groomed shapes.
+        """
+
         def relative_path(filepath):
             if not self.project.file.path:
                 return None
@@ -125,15 +136,27 @@ class ProjectFileIO(BaseModel, FileIO):
                 self.project.file.path.parent, str(filepath).replace('../', '').replace('./', '')
             )
 
+        def bulk_create(instances):
+            by_model: Dict[Type[ApiModel], List[ApiModel]] = {}
+            for instance in instances:
+                by_model.setdefault(type(instance), []).append(instance)
+            for model, model_instances in by_model.items():
+                model.bulk_create(model_instances)
+
+        domains = [
+            (subject, anatomy_id, objects)
+            for subject, objects_by_domain in data
+            for anatomy_id, objects in objects_by_domain.items()
+        ]
+        total_progress_steps = 3
+        print_progress_bar(0, total_progress_steps)
+
         with TemporaryDirectory() as temp_dir:
-            for anatomy_id, objects in objects_by_domain.items():
+            # original shapes, images and annotations only refer to the subject
+            original_shapes: List[Union[Mesh, Segmentation, Contour, None]] = []
+            instances: List[ApiModel] = []
+            for subject, anatomy_id, objects in domains:
                 original_shape: Union[Mesh, Segmentation, Contour, None] = None
-                groomed_shape: Union[GroomedMesh, GroomedSegmentation, None] = None
-                world_particles_path = None
-                local_particles_path = None
-                constraints_path = None
-                transform = None
-
                 for key, value in objects.items():
                     if key == 'shape':
                         key = shape_file_type(Path(value)).__name__.lower()
@@ -143,56 +166,94 @@ class ProjectFileIO(BaseModel, FileIO):
                             file_source=relative_path(value),
                             anatomy_type=anatomy_id,
                             subject=subject,
-                        ).create()
+                        )
                     elif key == 'segmentation':
                         original_shape = Segmentation(
                             file_source=relative_path(value),
                             anatomy_type=anatomy_id,
                             subject=subject,
-                        ).create()
-                        pass
+                        )
                     elif key == 'contour':
                         original_shape = Contour(
                             file_source=relative_path(value),
                             anatomy_type=anatomy_id,
                             subject=subject,
-                        ).create()
+                        )
                     elif key == 'image':
-                        Image(
-                            file_source=relative_path(value),
-                            modality=anatomy_id,
-                            subject=subject,
-                        ).create()
-                    elif key == 'groomed':
-                        if type(original_shape) == Mesh:
-                            groomed_shape = self.project.add_groomed_mesh(
+                        instances.append(
+                            Image(
                                 file_source=relative_path(value),
-                                mesh=original_shape,
+                                modality=anatomy_id,
+                                subject=subject,
                             )
-                        elif type(original_shape) == Segmentation:
-                            groomed_shape = self.project.add_groomed_segmentation(
+                        )
+                    elif key == 'landmarks_file':
+                        instances.append(
+                            Landmarks(
                                 file_source=relative_path(value),
-                                segmentation=original_shape,
+                                subject=subject,
+                                project=self.project,
+                                anatomy_type=anatomy_id,
                             )
-                    elif key == 'local':
-                        local_particles_path = relative_path(value)
-                    elif key == 'world':
-                        world_particles_path = relative_path(value)
-                    elif key == 'alignment':
-                        transform = Path(temp_dir) / 'transform'
-                        with transform.open('w') as f:
-                            f.write(value)
-                    elif key == 'landmarks_file':
-                        Landmarks(
-                            file_source=relative_path(value),
-                            subject=subject,
-                            project=self.project,
-                            anatomy_type=anatomy_id,
-                        ).create()
+                        )
                     elif key == 'constraints':
                         constraints_path = relative_path(value)
+                        with open(constraints_path) as f:
+                            constraints_contents = json.load(f)
+                        if constraints_contents:
+                            instances.append(
+                                Constraints(
+                                    file_source=constraints_path,
+                                    subject=subject,
+                                    project=self.project,
+                                    anatomy_type=anatomy_id,
+                                )
+                            )
                     # elif key == 'procrustes':
                     #     pass
+                original_shapes.append(original_shape)
+            bulk_create([shape for shape in original_shapes if shape] + instances)
+            print_progress_bar(1, total_progress_steps)
+
+            # groomed shapes, created once their original shapes have ids
+            groomed_shapes: List[Union[GroomedMesh, GroomedSegmentation, None]] = []
+            for (_subject, _anatomy_id, objects), original_shape in zip(domains, original_shapes):
+                groomed_shape: Union[GroomedMesh, GroomedSegmentation, None] = None
+                if 'groomed' in objects:
+                    if type(original_shape) == Mesh:
+                        groomed_shape = GroomedMesh(
+                            file_source=relative_path(objects['groomed']),
+                            mesh=original_shape,
+                            project=self.project,
+                        )
+                    elif type(original_shape) == Segmentation:
+                        groomed_shape = GroomedSegmentation(
+                            file_source=relative_path(objects['groomed']),
+                            segmentation=original_shape,
+                            project=self.project,
+                        )
+                groomed_shapes.append(groomed_shape)
+            bulk_create([shape for shape in groomed_shapes if shape])
+            print_progress_bar(2, total_progress_steps)
+
+            # particles, created once their groomed shapes have ids
+            particles = []
+            for index, ((subject, anatomy_id, objects), groomed_shape) in enumerate(
+                zip(domains, groomed_shapes)
+            ):
+                world_particles_path = None
+                local_particles_path = None
+                transform = None
+                if 'local' in objects:
+                    local_particles_path = relative_path(objects['local'])
+                if 'world' in objects:
+                    world_particles_path = relative_path(objects['world'])
+                if 'alignment' in objects:
+                    # every transform stays on disk until its batch is uploaded
+                    transform = Path(temp_dir, str(index), 'transform')
+                    transform.parent.mkdir()
+                    with transform.open('w') as f:
+                        f.write(objects['alignment'])
                 if world_particles_path or local_particles_path:
                     groomed_mesh = None
                     groomed_segmentation = None
@@ -200,26 +261,20 @@ class ProjectFileIO(BaseModel, FileIO):
                         groomed_mesh = groomed_shape
                     elif type(groomed_shape) == GroomedSegmentation:
                         groomed_segmentation = groomed_shape
-                    OptimizedParticles(
-                        world_source=world_particles_path,
-                        local_source=local_particles_path,
-                        transform_source=transform,
-                        groomed_segmentation=groomed_segmentation,
-                        groomed_mesh=groomed_mesh,
-                        project=self.project,
-                        subject=subject,
-                        anatomy_type=anatomy_id,
-                    ).create()
-                if constraints_path:
-                    with open(constraints_path) as f:
-                        constraints_contents = json.load(f)
-                    if constraints_contents:
-                        Constraints(
-                            file_source=constraints_path,
-                            subject=subject,
+                    particles.append(
+                        OptimizedParticles(
+                            world_source=world_particles_path,
+                            local_source=local_particles_path,
+                            transform_source=transform,
+                            groomed_segmentation=groomed_segmentation,
+                            groomed_mesh=groomed_mesh,
                             project=self.project,
+                            subject=subject,
                             anatomy_type=anatomy_id,
-                        ).create()
+                        )
+                    )
+            bulk_create(particles)
+            print_progress_bar(3, total_progress_steps)
 
     def load_analysis_from_json(self, file_path):
         project_root = Path(str(self.project.file.path)).parent
@@ -317,6 +372,7 @@ class Project(ApiModel):
     # sent in as a filepath string, interpreted as CachedAnalysis object
     last_cached_analysis: Optional[Any] = None
     landmarks_info: Optional[Any] = None
+    max_num_domains: Optional[int] = None
 
     def get_file_io(self):
         return ProjectFileIO(project=self)
@@ -413,5 +469,24 @@ class Project(ApiModel):
         session.close()
         print()
 
+    def download_zip(self, path: Union[str, Path]) -> Path:
+        """Download the project as a single zip, resuming a partial download at path."""
+        path = Path(path)
+        session = current_session()
+        offset = path.stat().st_size if path.exists() else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        with session.get(
+            f'{self._endpoint}/{self.id}/export.zip/', headers=headers, stream=True
+        ) as r:
+            if r.status_code == 416:
+                # the partial download is already complete
+                return path
+            raise_for_status(r)
+            mode = 'ab' if r.status_code == 206 else 'wb'
+            with path.open(mode) as f:
+                for chunk in r.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+        return path
+
 
 ProjectFileIO.update_forward_refs()
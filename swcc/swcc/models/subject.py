@@ -72,4 +72,8 @@ class Subject(ApiModel):
         ]
         for iterator in data_lists:
             for item in iterator:
-                item.file.download(path)
+                if item.file is not None:
+                    item.file.download(path)
+                elif isinstance(item, (Landmarks, Constraints)) and item.locations is not None:
+                    # annotations may be stored as coordinates only
+                    item.write_locations(path)
@@ -1,3 +1,4 @@
+import json
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
@@ -6,6 +7,7 @@ import pytest
 import requests
 
 from swcc import models
+from swcc.models.utils import raise_for_status
 
 from . import factories
 
@@ -29,6 +31,12 @@ def test_api_common(session):
     assert {d.id for d in models.Dataset.list()} == {dataset2.id}
 
 
+def test_list_cursor_pages(session):
+    datasets = [factories.DatasetFactory().create() for _ in range(3)]
+
+    assert [d.id for d in models.Dataset.list(page_size=2)] == sorted(d.id for d in datasets)
+
+
 def test_file_download_api(session):
     with TemporaryDirectory() as d:
         directory = Path(d)
@@ -176,3 +184,49 @@ def test_dataset_force_create_backup_multiple_conflicts(session):
 
     # The new dataset should cascade up until it reaches dataset-v4
     assert models.Dataset.from_name('dataset-v4') == new_dataset
+
+
+def test_subject_download_annotations_without_file(session):
+    subject = factories.SubjectFactory().create()
+    project = factories.ProjectFactory(dataset=subject.dataset).create()
+    # the server stores annotations written through these endpoints without a file
+    raise_for_status(
+        session.post(
+            f'projects/{project.id}/landmarks/',
+            json={'info': [], 'locations': {str(subject.id): {'anatomy_femur': [[1, 2, 3]]}}},
+        )
+    )
+    raise_for_status(
+        session.post(
+            f'projects/{project.id}/constraints/',
+            json={'locations': {str(subject.id): {'anatomy_femur': {'planes': []}}}},
+        )
+    )
+
+    with TemporaryDirectory() as d:
+        directory = Path(d)
+        subject.download(directory)
+
+        landmarks = directory / f'{subject.name}_femur_landmarks.csv'
+        assert landmarks.read_text() == '1 2 3'
+        constraints = directory / f'{subject.name}_femur_constraints.json'
+        assert json.loads(constraints.read_text()) == {'planes': []}
+
+
+def test_project_interpret_data_shared_subject_names(session):
+    subject = factories.SubjectFactory(name='existing_subject').create()
+    project = factories.ProjectFactory(dataset=subject.dataset).create()
+    names = {s.name for s in project.dataset.subjects}
+    entries = [
+        {'name': subject.name, 'shape_femur': 'femur.vtk'},
+        {'name': 'new_subject', 'shape_femur': 'femur.vtk'},
+        {'name': 'new_subject', 'shape_tibia': 'tibia.vtk'},
+    ]
+
+    data = project.get_file_io().interpret_data(entries)
+
+    assert data[0][0].id == subject.id
+    # entries sharing the name of a new subject share one subject
+    assert data[1][0] is data[2][0]
+    assert {s.name for s in project.dataset.subjects} == names | {'new_subject'}
+    assert len(list(project.dataset.subjects)) == len(names) + 1
@@ -1,6 +1,5 @@
-import { AnalysisParams, DataObject, Dataset, LandmarkInfo, Project, Subject, Task } from "@/types";
-import { apiClient } from "./auth";
-import { loadGroomedShapeForObject, loadParticlesForObject } from "@/store";
+import { AnalysisParams, DataObject, Dataset, LandmarkInfo, Project, ProjectBundle, Subject, Task } from "@/types";
+import { apiClient, oauthClient } from "./auth";
 
 
 export async function getDatasets(search: string | undefined): Promise<Dataset[]>{
@@ -24,7 +23,9 @@ export async function getDataset(datasetId: number): Promise<Dataset>{
     return (await apiClient.get(`/datasets/${datasetId}`)).data
 }
 
-export async function subsetDataset(datasetId: number, formData: Object): Promise<Dataset>{
+export async function subsetDataset(
+    datasetId: number, formData: Object
+): Promise<Dataset & { subset_task?: Task }>{
     return (await apiClient.post(`/datasets/${datasetId}/subset/`, formData)).data
 }
 
@@ -78,6 +79,30 @@ export async function getTasksForProject(projectId: number): Promise<Task[]> {
     })).data?.results
 }
 
+export function openTaskProgressSocket(
+    projectId: number,
+    onTasks: (tasks: Task[]) => void,
+    onClose: () => void,
+): WebSocket | undefined {
+    const authorization = (oauthClient?.authHeaders as Record<string, string>)?.Authorization
+    const token = authorization?.replace(/^Bearer /, '')
+    // websockets are served alongside the API; a server without redis refuses the
+    // connection, and the caller falls back to polling
+    const websocketRoot = process.env.VUE_APP_WEBSOCKET_ROOT || process.env.VUE_APP_API_ROOT || '/'
+    if (!token || !window.WebSocket) return undefined
+    const url = new URL(
+        `ws/projects/${projectId}/task-progress/`,
+        new URL(websocketRoot, window.location.href),
+    )
+    url.protocol = url.protocol.replace('http', 'ws')
+    const socket = new WebSocket(url.toString())
+    // sent as a message rather than in the URL, which ends up in access logs
+    socket.onopen = () => socket.send(JSON.stringify({ token }))
+    socket.onmessage = (event) => onTasks(JSON.parse(event.data).tasks)
+    socket.onclose = onClose
+    return socket
+}
+
 export async function getSubject(subjectId: number): Promise<Subject>{
     return (await apiClient.get(`/subjects/${subjectId}`)).data
 }
@@ -90,42 +115,13 @@ export async function getDataObjectsForSubject(subjectId: number): Promise<DataO
         })
     }))).map((response, index) => {
         return response.data?.results.map((result: DataObject) => {
-            const type = dataTypes[index]
-            if(type !== 'image'){
-                // don't await this, let particles and groomed shapes load in after
-                loadParticlesForObject(type, result.id)
-                loadGroomedShapeForObject(type, result.id)
-            }
-            return Object.assign(result, {type})
+            return Object.assign(result, {type: dataTypes[index]})
         })
     }).flat(2)
 }
 
-export async function getOptimizedParticlesForDataObject(
-    type: string, id: number, projectId: number|undefined
-){
-    return (await apiClient.get('/optimized-particles', {
-        params: {[`original_${type}`]: id, project: projectId}
-    })).data?.results
-}
-
-export async function getGroomedShapeForDataObject(
-    type: string, id: number, projectId: number|undefined
-) {
-    if (type !== 'image') {
-        const plural = `${type}${type == 'mesh' ?'es' :'s'}`
-        return (await apiClient.get(`/groomed-${plural}`, {
-            params: {[type]: id, project: projectId}
-        })).data?.results
-    }
-}
-
-export async function getReconstructedSamplesForProject(
-    type: string, id: number, projectId: number|undefined
-){
-    return (await apiClient.get(`/reconstructed-samples/`, {
-        params: {project: projectId}
-    })).data?.results
+export async function getProjectBundle(projectId: number): Promise<ProjectBundle> {
+    return (await apiClient.get(`/projects/${projectId}/bundle/`)).data
 }
 
 export async function getDeepSSMResultForProject(
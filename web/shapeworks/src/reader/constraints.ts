@@ -35,38 +35,42 @@ function normalizeVector(v) {
     ]
 }
 
-export default async function (url: string | undefined) {
+export function parseConstraints(json) {
     const constraintList: {type: string, data: any, name: string}[] = []
-    if (url) {
-        const resp = await fetch(url);
-        const json = await resp.json()
-        json.planes?.forEach(({points, name}) => {
-            // must contain 3 points
-            if (points && points.length === 3) {
-                const [p1, p2, p3] = points
-                const v1 = subtractVectors(p1, p3)
-                const v2 = subtractVectors(p1, p2)
-                // v1 and v2 are parallel to plane, normal is vector product of v1 and v2
-                const normal = normalizeVector(crossProduct(v1, v2))
-                const origin = p1
-                constraintList.push({
-                    type: 'plane',
-                    data : { origin, normal },
-                    name
-                })
-            }
-        })
-        if (json.free_form_constraints) {
+    json.planes?.forEach(({points, name}) => {
+        // must contain 3 points
+        if (points && points.length === 3) {
+            const [p1, p2, p3] = points
+            const v1 = subtractVectors(p1, p3)
+            const v2 = subtractVectors(p1, p2)
+            // v1 and v2 are parallel to plane, normal is vector product of v1 and v2
+            const normal = normalizeVector(crossProduct(v1, v2))
+            const origin = p1
             constraintList.push({
-                type: 'paint',
-                data: json.free_form_constraints,
-                name: json.free_form_constraints.name,
+                type: 'plane',
+                data : { origin, normal },
+                name
             })
         }
+    })
+    if (json.free_form_constraints) {
+        constraintList.push({
+            type: 'paint',
+            data: json.free_form_constraints,
+            name: json.free_form_constraints.name,
+        })
     }
     return constraintList
 }
 
+export default async function (url: string | undefined) {
+    if (url) {
+        const resp = await fetch(url);
+        return parseConstraints(await resp.json())
+    }
+    return []
+}
+
 
 
 export function convertConstraintDataForDB(shapeLocations, shapeInfos) {
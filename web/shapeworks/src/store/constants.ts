@@ -27,7 +27,8 @@ export const layers = ref<Record<string, any>[]>([
         color: 'red',
         rgb: [1, 0, 0],
         available: () => {
-            return reconstructionsForOriginalDataObjects.value?.length > 0
+            return Object.values(reconstructionsForOriginalDataObjects.value)
+            .map((obj) => Object.values(obj).flat()).flat().length > 0
         },
     },
     {
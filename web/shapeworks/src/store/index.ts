@@ -45,7 +45,7 @@ export const orientationIndicator = ref<vtkAnnotatedCubeActor>(vtkAnnotatedCubeA
 
 export const particleSize = ref<number>(2)
 
-export const reconstructionsForOriginalDataObjects = ref<ReconstructedSample[]>([])
+export const reconstructionsForOriginalDataObjects = ref<Record<string, Record<number, ReconstructedSample[] | undefined>>>({})
 
 export const particlesForOriginalDataObjects = ref<Record<string, Record<number, Particles | undefined>>>({})
 
@@ -103,6 +103,8 @@ export const currentTasks = ref<Record<number, Record<string, Task| undefined>>>
 
 export const jobProgressPoll = ref();
 
+export const jobProgressSocket = ref<WebSocket>();
+
 export const analysisExpandedTab = ref(0);
 
 export const analysisAnimate = ref<boolean>(false);
@@ -1,4 +1,7 @@
-import { AnalysisParams, CacheComparison, Project, Task } from "@/types";
+import {
+    AnalysisParams, CacheComparison, DataObject, GroomedShape,
+    Particles, Project, ProjectBundle, ReconstructedSample, Task,
+} from "@/types";
 import {
      loadingState,
      selectedDataset,
@@ -12,6 +15,7 @@ import {
      currentTasks,
      groomedShapesForOriginalDataObjects,
      jobProgressPoll,
+     jobProgressSocket,
      reconstructionsForOriginalDataObjects,
      cachedParticleComparisonColors,
      cachedParticleComparisonVectors,
@@ -38,15 +42,14 @@ import {
 import imageReader from "@/reader/image";
 import pointsReader from "@/reader/points";
 import generateMapper from "@/reader/mapper";
-import constraintsReader from "@/reader/constraints";
+import constraintsReader, { parseConstraints } from "@/reader/constraints";
 import {
     abortTask,
     analyzeProject,
     getDataset,
     getDatasets,
-    getGroomedShapeForDataObject, getOptimizedParticlesForDataObject,
+    getProjectBundle,
     getProjectsForDataset,
-    getReconstructedSamplesForProject,
     groomProject, optimizeProject, refreshProject,
     deepssmRunProject,
     getDeepSSMResultForProject,
@@ -55,6 +58,7 @@ import {
     getDeepSSMTrainingPairsForProject,
     getDeepSSMTrainingImagesForProject,
     getTasksForProject,
+    openTaskProgressSocket,
     getProjectFileContents,
 } from '@/api/rest';
 import { layers, COLORS } from "./constants";
@@ -67,6 +71,8 @@ export const resetState = () => {
     landmarkInfo.value = [];
     currentTasks.value = {};
     jobProgressPoll.value = undefined;
+    jobProgressSocket.value?.close();
+    jobProgressSocket.value = undefined;
     particleSize.value = 2;
     analysis.value = undefined;
     analysisExpandedTab.value = 0;
@@ -115,7 +121,7 @@ export const loadProjectForDataset = async (projectId: number) => {
             selectedProject.value = proj
         }
     });
-    spawnJobProgressPoll()
+    spawnJobProgressPoll(projectId)
 }
 
 export const loadProjectsForDataset = async (datasetId: number) => {
@@ -138,48 +144,53 @@ export const selectProject = (projectId: number | undefined) => {
     }
 }
 
-export const loadParticlesForObject = async (type: string, id: number) => {
-    let particles = await getOptimizedParticlesForDataObject(
-        type, id, selectedProject.value?.id
-    )
-    if (particles && particles.length > 0) {
-        particles = particles[0]
-        if (!particlesForOriginalDataObjects.value[type]) {
-            particlesForOriginalDataObjects.value[type] = {}
-        }
-        particlesForOriginalDataObjects.value[type][id] = particles
-    } else if (
-        particlesForOriginalDataObjects.value[type] &&
-        particlesForOriginalDataObjects.value[type][id]
-    ){
-        particlesForOriginalDataObjects.value[type][id] = undefined
-    }
-}
-
-export const loadGroomedShapeForObject = async (type: string, id: number) => {
-    let groomed = await getGroomedShapeForDataObject(
-        type, id, selectedProject.value?.id
-    )
-    if (groomed && groomed.length > 0) {
-        groomed = groomed[0]
-        if (!groomedShapesForOriginalDataObjects.value[type]) {
-            groomedShapesForOriginalDataObjects.value[type] = {}
-        }
-        groomedShapesForOriginalDataObjects.value[type][id] = groomed
-    }else if (
-        groomedShapesForOriginalDataObjects.value[type] &&
-        groomedShapesForOriginalDataObjects.value[type][id]
-    ){
-        groomedShapesForOriginalDataObjects.value[type][id] = undefined
-    }
-}
-
-export const loadReconstructedSamplesForProject = async (type: string, id: number) => {
-    if (selectedProject.value) {
-        reconstructionsForOriginalDataObjects.value = await getReconstructedSamplesForProject(
-            type, id, selectedProject.value?.id
-        )
-    }
+function setForObject<T>(
+    record: Record<string, Record<number, T>>, type: string, id: number, value: T
+) {
+    if (!record[type]) record[type] = {}
+    record[type][id] = value
+}
+
+export const loadProjectBundle = async (projectId: number): Promise<DataObject[]> => {
+    // one request covers the shapes of every subject and their project outputs
+    const bundle: ProjectBundle = await getProjectBundle(projectId)
+    const dataObjects: DataObject[] = []
+    const groomed: Record<string, Record<number, GroomedShape>> = {}
+    const particles: Record<string, Record<number, Particles>> = {}
+    const reconstructions: Record<string, Record<number, ReconstructedSample[]>> = {}
+    bundle.subjects.forEach((subject) => {
+        Object.entries(subject.images).forEach(([modality, image]) => {
+            dataObjects.push({
+                type: 'image', id: image.id, subject: subject.id, file: image.url, modality,
+            } as DataObject)
+        })
+        Object.entries(subject.anatomies).forEach(([anatomy_type, anatomy]) => {
+            const shape = anatomy.shape
+            if (!shape?.type) return
+            const type = shape.type
+            const id = shape.id
+            dataObjects.push({
+                type, id, subject: subject.id, file: shape.url, anatomy_type,
+            } as DataObject)
+            if (anatomy.groomed) {
+                setForObject(groomed, type, id, {
+                    id: anatomy.groomed.id, file: anatomy.groomed.url, anatomy_type,
+                } as GroomedShape)
+            }
+            if (anatomy.particles) {
+                setForObject(particles, type, id, anatomy.particles as Particles)
+            }
+            if (anatomy.reconstructed.length) {
+                setForObject(reconstructions, type, id, anatomy.reconstructed.map(
+                    (sample) => ({ id: sample.id, file: sample.url, anatomy_type } as ReconstructedSample)
+                ))
+            }
+        })
+    })
+    groomedShapesForOriginalDataObjects.value = groomed
+    particlesForOriginalDataObjects.value = particles
+    reconstructionsForOriginalDataObjects.value = reconstructions
+    return dataObjects
 }
 
 export const loadDeepSSMDataForProject = async () => {
@@ -255,9 +266,46 @@ export async function spawnJob(action: string, payload: Record<string, any>): Pr
     return undefined;
 }
 
-export async function spawnJobProgressPoll() {
+export async function spawnJobProgressPoll(projectId: number) {
     if (jobProgressPoll.value) clearInterval(jobProgressPoll.value)
-    jobProgressPoll.value = setInterval(pollJobProgress, 1000)
+    jobProgressPoll.value = undefined
+    const previousSocket = jobProgressSocket.value
+    jobProgressSocket.value = undefined
+    previousSocket?.close()
+
+    // the server pushes progress over a websocket; poll when that is unavailable or drops
+    const startPolling = () => {
+        jobProgressPoll.value = setInterval(pollJobProgress, 1000)
+    }
+    const socket = openTaskProgressSocket(
+        projectId,
+        (tasks) => updateJobProgress(projectId, tasks),
+        () => {
+            if (jobProgressSocket.value === socket) {
+                jobProgressSocket.value = undefined
+                startPolling()
+            }
+        },
+    )
+    jobProgressSocket.value = socket
+    if (!socket) startPolling()
+}
+
+export function updateJobProgress(projectId: number, tasks: Task[], replace = false) {
+    const projectTasks: Record<string, Task | undefined> =
+        replace ? {} : {...currentTasks.value[projectId]}
+    tasks.forEach((task) => {
+        if (!task.name) return
+        if (!task.abort && !task.error && task.percent_complete !== 100) {
+            projectTasks[task.name] = task
+        } else if (projectTasks[task.name]?.id === task.id) {
+            delete projectTasks[task.name]
+        }
+    })
+    currentTasks.value = {
+        ...currentTasks.value,
+        ...{[projectId]: projectTasks}
+    }
 }
 
 export function pollJobProgress() {
@@ -265,16 +313,7 @@ export function pollJobProgress() {
         const projectId = selectedProject.value.id
         getTasksForProject(projectId).then((tasks) => {
             if (tasks) {
-                const refreshedTasks = {}
-                tasks.forEach((task) => {
-                    if (task.name && !task.abort && !task.error && task.percent_complete !== 100) {
-                        refreshedTasks[`${task.name}`] = task
-                    }
-                })
-                currentTasks.value = {
-                    ...currentTasks.value,
-                    ...{[projectId]: refreshedTasks}
-                }
+                updateJobProgress(projectId, tasks, true)
             }
         })
     }
@@ -286,19 +325,15 @@ export async function fetchJobResults(taskName: string) {
     }
     const refreshedProject = await refreshProject(selectedProject.value.id)
     let layerName: string = ''
-    let loadFunction: Function | undefined = undefined
     switch (taskName) {
         case 'groom':
             layerName = 'Groomed'
-            loadFunction = loadGroomedShapeForObject
             break;
         case 'optimize':
             layerName = 'Particles'
-            loadFunction = loadParticlesForObject
             break;
         case 'analyze':
             layerName = 'Reconstructed'
-            loadFunction = loadReconstructedSamplesForProject
             analysis.value = refreshedProject?.last_cached_analysis
             if (analysis.value) {
                 if (analysis.value.good_bad_angles) {
@@ -307,25 +342,19 @@ export async function fetchJobResults(taskName: string) {
             }
             break;
         case 'deepssm':
-            loadFunction = loadDeepSSMDataForProject
+            await loadDeepSSMDataForProject()
             break;
     }
-    if (layerName && loadFunction) {
-        if (layerName) {
-            await Promise.all(allDataObjectsInDataset.value.map(
-                (dataObject) => loadFunction ? loadFunction(dataObject.type, dataObject.id) : undefined
-            ))
-            cachedMarchingCubes.value = Object.fromEntries(
-                Object.entries(cachedMarchingCubes.value).filter(
-                    ([cachedLabel]) => !cachedLabel.includes(layerName)
-                )
+    if (layerName) {
+        await loadProjectBundle(selectedProject.value.id)
+        cachedMarchingCubes.value = Object.fromEntries(
+            Object.entries(cachedMarchingCubes.value).filter(
+                ([cachedLabel]) => !cachedLabel.includes(layerName)
             )
-            const layer = layers.value.find((l) => l.name === layerName)
-            if (layer?.available() && !layersShown.value.includes(layerName)) {
-                layersShown.value = [...layersShown.value, layerName]
-            }
-        } else {
-            loadFunction()
+        )
+        const layer = layers.value.find((l) => l.name === layerName)
+        if (layer?.available() && !layersShown.value.includes(layerName)) {
+            layersShown.value = [...layersShown.value, layerName]
         }
     }
 }
@@ -556,12 +585,16 @@ export async function getLandmarks() {
         for (let i = 0; i < selectedProject.value.landmarks.length; i++) {
             const landmarksObject = selectedProject.value.landmarks[i]
             const subject = allSubjectsForDataset.value.find((s) => s.id === landmarksObject.subject)
-            const pointData = await pointsReader(landmarksObject.file)
-            const locationData = pointData.getPoints().getData()
-            const locations: number[][] = []
-            for (let p = 0; p < locationData.length; p+=3) {
-                const location = locationData.slice(p, p+3) as number[]
-                locations.push(location)
+            let locations: number[][] = []
+            if (landmarksObject.locations) {
+                locations = landmarksObject.locations
+            } else {
+                const pointData = await pointsReader(landmarksObject.file)
+                const locationData = pointData.getPoints().getData()
+                for (let p = 0; p < locationData.length; p+=3) {
+                    const location = locationData.slice(p, p+3) as number[]
+                    locations.push(location)
+                }
             }
             const lInfos = landmarkInfo.value.filter((lInfo) => lInfo.domain === landmarksObject.anatomy_type.replace('anatomy_', ''))
             locations.forEach((location, index) => {
@@ -643,7 +676,9 @@ export async function getConstraints() {
             const subject = allSubjectsForDataset.value.find((s) => s.id === constraintsObject.subject)
             const domain = constraintsObject.anatomy_type?.replace('anatomy_', '') || '0'
             if (subject) {
-                const constraintsData = await constraintsReader(constraintsObject.file);
+                const constraintsData = constraintsObject.locations
+                    ? parseConstraints(constraintsObject.locations)
+                    : await constraintsReader(constraintsObject.file);
                 ['plane', 'paint'].forEach((constraintType) => {
                     const newConstraintsOfType = constraintsData.filter((cData) => cData.type === constraintType)
                     const existingConstraintsOfType = constraintInfo.value.filter((cData) => cData.type === constraintType && cData.domain === domain)
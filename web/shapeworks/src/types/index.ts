@@ -133,8 +133,8 @@ export interface DataObject {
     file: string,
     modality: string,
     anatomy_type: string,
-    created: string,
-    modified: string,
+    created?: string,
+    modified?: string,
 }
 
 export interface Particles {
@@ -170,6 +170,37 @@ export interface ReconstructedSample {
     anatomy_type: string
 }
 
+export interface BundleFile {
+    type?: string,
+    id: number,
+    url: string,
+}
+
+export interface BundleAnatomy {
+    shape: BundleFile | null,
+    groomed: BundleFile | null,
+    particles: {
+        id: number,
+        world: string | null,
+        local: string | null,
+        transform: string | null,
+    } | null,
+    landmarks: Record<string, any> | null,
+    constraints: Record<string, any> | null,
+    reconstructed: BundleFile[],
+}
+
+export interface ProjectBundle {
+    id: number,
+    subjects: {
+        id: number,
+        name: string,
+        groups: Record<string, string>,
+        images: Record<string, BundleFile>,
+        anatomies: Record<string, BundleAnatomy>,
+    }[],
+}
+
 export interface Task {
     id: number | undefined,
     name: string,
@@ -184,6 +215,7 @@ export interface Task {
 export interface Landmarks {
     id: number,
     file: string,
+    locations?: number[][],
     project: number,
     subject: number,
     created: string,
@@ -204,6 +236,7 @@ export interface LandmarkInfo {
 export interface Constraints {
     id?: number,
     file?: string,
+    locations?: Record<string, any>,
     type: string,
     project?: number,
     subject?: number,